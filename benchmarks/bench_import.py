@@ -0,0 +1,100 @@
+"""
+Import-time benchmark, each module is imported in a fresh interpreter.
+
+    python benchmarks/bench_import.py                 report
+    python benchmarks/bench_import.py --save          write benchmarks/baselines/import.json
+    python benchmarks/bench_import.py --compare       exit 1 on regressions or when a lazy dependency leaks
+
+Times are the best of several runs minus the startup of a bare interpreter, which is also
+used as the calibration value when comparing with a baseline from another machine. Besides
+the time, every run checks that the provider SDKs and other heavy dependencies are not
+imported until a backend actually uses them.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+from suite import compare, git_commit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baselines", "import.json")
+
+MODULES = [
+    "promptchain.message",
+    "promptchain.chain_processor",
+    "promptchain.llm",
+    "promptchain.tool",
+    "promptchain.prompt",
+    "promptchain.parser",
+]
+# 这些依赖只应该在使用对应后端时才被导入
+LAZY_DEPENDENCIES = ["openai", "ollama", "httpx", "numpy", "rich", "yaml"]
+
+
+def run_python(code: str, **kwargs) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable, "-c", code], check=True, env=env, cwd=ROOT, **kwargs)
+
+
+def timed(code: str) -> float:
+    start = time.perf_counter()
+    run_python(code)
+    return time.perf_counter() - start
+
+
+def leaked(module: str) -> List[str]:
+    code = f"import sys, {module}; print(','.join(m for m in {LAZY_DEPENDENCIES!r} if m in sys.modules))"
+    output = run_python(code, capture_output=True, text=True).stdout.strip()
+    return output.split(",") if output else []
+
+
+def run(repeat: int = 7) -> Dict:
+    startup = min(timed("pass") for _ in range(repeat))
+    results = {}
+    leaks = {}
+    print(f"{'interpreter startup':<32}{startup * 1000:>10.1f} ms")
+    for module in MODULES:
+        best = min(timed(f"import {module}") for _ in range(repeat))
+        results[module] = max(best - startup, 0.0) * 1e9
+        leaks[module] = leaked(module)
+        note = f"  imports {', '.join(leaks[module])}" if leaks[module] else ""
+        print(f"{module:<32}{results[module] / 1e6:>10.1f} ms{note}")
+    return {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "calibration_ns": startup * 1e9,
+        "results": results,
+        "leaks": leaks,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Import-time benchmark.")
+    arg_parser.add_argument("--save", nargs="?", const=BASELINE_PATH)
+    arg_parser.add_argument("--compare", nargs="?", const=BASELINE_PATH)
+    arg_parser.add_argument("--threshold", type=float, default=0.25)
+    arg_parser.add_argument("--repeat", type=int, default=7)
+    args = arg_parser.parse_args(argv)
+
+    current = run(args.repeat)
+    status = 1 if any(current["leaks"].values()) else 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            regressions = compare(current, json.load(file), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            status = 1
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(current, file, indent=2)
+            file.write("\n")
+        print(f"\nsaved {args.save}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+"""
+Micro-benchmark of Message construction.
+
+    python benchmarks/bench_message.py [number]
+
+Compares the validating constructors with Message.trusted and the MessageRecord
+round trip used for stored history.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from promptchain.message import AIMessage, HumanMessage, Message, MessageRecord, Messages
+
+CONTENT = "def hello():\n    print('hello world')\n" * 4
+
+
+def run(number: int = 100_000):
+    records = [MessageRecord("user" if i % 2 else "assistant", CONTENT) for i in range(1000)]
+    cases = {
+        "Message(role=, content=)": lambda: Message(role="user", content=CONTENT),
+        "AIMessage(content=)": lambda: AIMessage(content=CONTENT),
+        "HumanMessage(content=)": lambda: HumanMessage(content=CONTENT),
+        "Message(x=(role, content))": lambda: Message(x=("user", CONTENT)),
+        "Message(x={role, content})": lambda: Message(x={"role": "user", "content": CONTENT}),
+        "AIMessage.trusted(content=)": lambda: AIMessage.trusted(content=CONTENT),
+        "Message.from_record": lambda: Message.from_record(records[0]),
+    }
+    print(f"{'case':<32}{'ns/op':>10}{'ops/s':>14}")
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=number, repeat=3))
+        print(f"{name:<32}{seconds / number * 1e9:>10.0f}{number / seconds:>14,.0f}")
+
+    batches = max(number // 1000, 1)
+    seconds = min(timeit.repeat(lambda: Messages.from_records(records), number=batches, repeat=3))
+    print(f"{'Messages.from_records (1000)':<32}{seconds / batches / 1000 * 1e9:>10.0f}{batches * 1000 / seconds:>14,.0f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,54 @@
+"""
+Benchmark of Messages set algebra on histories with very large tool outputs.
+
+    python benchmarks/bench_messages_set.py [turns] [tool_output_kb]
+
+Compares the old set() based union/difference with the digest based, order
+preserving implementation, and shows the one-off cost of computing digests.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from promptchain.message import AIMessage, HumanMessage, Messages, ToolMessage
+
+
+def build_history(turns: int, tool_output_kb: int, offset: int = 0) -> Messages:
+    messages = Messages()
+    for i in range(offset, offset + turns):
+        messages.add_message(HumanMessage(content=f"question {i}"))
+        messages.add_message(ToolMessage(content=f"{i}:" + "y" * (tool_output_kb * 1024), tool_call_id=f"call_{i}"))
+        messages.add_message(AIMessage(content=f"answer {i}"))
+    return messages
+
+
+def timed(label: str, fn, repeat: int = 5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<36}{best * 1000:>10.2f} ms")
+
+
+def run(turns: int = 500, tool_output_kb: int = 256):
+    left = build_history(turns, tool_output_kb)
+    right = build_history(turns, tool_output_kb, offset=turns // 2)
+    print(f"{len(left)} + {len(right)} messages, tool outputs of {tool_output_kb} KB")
+
+    start = time.perf_counter()
+    for message in (*left, *right):
+        message.digest
+    print(f"{'digest (first time)':<36}{(time.perf_counter() - start) * 1000:>10.2f} ms")
+
+    timed("set union (unordered)", lambda: Messages(messages=list(set(left.messages) | set(right.messages))))
+    timed("set difference (unordered)", lambda: Messages(messages=list(set(left.messages) - set(right.messages))))
+    timed("Messages | (digest, ordered)", lambda: left | right)
+    timed("Messages - (digest, ordered)", lambda: left - right)
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    run(*args)
@@ -0,0 +1,142 @@
+"""
+Load test of concurrent chains against the local mock server (promptchain.mock_server).
+
+    python benchmarks/load_test.py --concurrency 50 --requests 2000
+    python benchmarks/load_test.py --provider ollama --stream --latency lognormal:0.3,0.5 --rate-limit-rate 0.05
+    python benchmarks/load_test.py --tools --chunk-delay 0.005
+
+`concurrency` workers each run a fresh ChainProcessor per request until `requests` chains
+have finished. The mock server runs in its own thread, so the event-loop lag reported here
+is the cost of the framework (and the HTTP client) alone.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from promptchain import metrics
+from promptchain.chain_processor import ChainProcessor
+from promptchain.llm import DeepseekChatMessageModel, OllamaChatMessageModel, aclose_clients
+from promptchain.message import HumanMessage, Messages, SystemMessage
+from promptchain.mock_server import Latency, MockLLMServer, MockServerConfig
+from promptchain.tool import Tool
+
+tool = Tool()
+
+
+@tool.func()
+def lookup_order(order_id: str) -> str:
+    """Looks an order up by id."""
+    return f"order {order_id} shipped"
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def monitor_loop_lag(samples: List[float], interval: float = 0.01) -> None:
+    # sleep(interval) 实际多花的时间就是事件循环被阻塞的时间
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+def build_chain(args, server: MockLLMServer) -> ChainProcessor:
+    model_config = {"tools": tool.tools} if args.tools else None
+    if args.provider == "openai":
+        model = DeepseekChatMessageModel("mock", "mock-chat", model_config, base_url=server.openai_base_url, api_key="mock")
+    else:
+        model = OllamaChatMessageModel("mock", "mock-chat", model_config, host=server.url)
+    chain = ChainProcessor(Messages(messages=[
+        SystemMessage(content="You are a support agent."),
+        HumanMessage(content="Where is my order 42? " + "Please check the details. " * args.prompt_words),
+    ]), stream=args.stream, name="load_test")
+    chain | model
+    if args.tools:
+        chain | tool | model
+    return chain
+
+
+async def run(args) -> Dict:
+    config = MockServerConfig(
+        latency=args.latency,
+        chunk_delay=args.chunk_delay,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        max_concurrency=args.server_concurrency,
+        seed=args.seed,
+    )
+    server = MockLLMServer(config).start_in_thread()
+    latencies: List[float] = []
+    lag: List[float] = []
+    errors: Dict[str, int] = {}
+    remaining = args.requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            chain = build_chain(args, server)
+            start = time.perf_counter()
+            try:
+                await chain.invoke()
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    lag_task = asyncio.create_task(monitor_loop_lag(lag))
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    finally:
+        elapsed = time.perf_counter() - start
+        lag_task.cancel()
+        await aclose_clients()
+        server.stop_thread()
+    return {"elapsed": elapsed, "latencies": latencies, "lag": lag, "errors": errors, "server": dict(server.stats)}
+
+
+def report(args, result: Dict) -> None:
+    latencies, lag = result["latencies"], result["lag"]
+    print(f"{args.requests} chains, {args.concurrency} concurrent, provider={args.provider}, "
+        f"stream={args.stream}, tools={args.tools}")
+    print(f"elapsed      {result['elapsed']:.2f} s")
+    print(f"throughput   {len(latencies) / result['elapsed']:.1f} chains/s")
+    print(f"latency      p50 {percentile(latencies, 0.5) * 1000:.1f} ms   p95 {percentile(latencies, 0.95) * 1000:.1f} ms"
+        f"   p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+    print(f"loop lag     p50 {percentile(lag, 0.5) * 1000:.2f} ms   p99 {percentile(lag, 0.99) * 1000:.2f} ms"
+        f"   max {max(lag, default=0) * 1000:.2f} ms")
+    print(f"errors       {result['errors'] or 'none'}")
+    print(f"server       {result['server']}")
+    retried = sum(child.value for _, child in metrics.HTTP_RETRYABLE.children())
+    print(f"client saw   {retried:.0f} retryable (429/5xx) responses")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description="Load test chains against the local mock server.")
+    arg_parser.add_argument("--concurrency", type=int, default=20)
+    arg_parser.add_argument("--requests", type=int, default=500)
+    arg_parser.add_argument("--provider", choices=("openai", "ollama"), default="openai")
+    arg_parser.add_argument("--stream", action="store_true")
+    arg_parser.add_argument("--tools", action="store_true", help="model -> tool -> model chains")
+    arg_parser.add_argument("--prompt-words", type=int, default=20)
+    arg_parser.add_argument("--latency", type=Latency.parse, default=Latency("lognormal", 0.05, 0.5))
+    arg_parser.add_argument("--chunk-delay", type=Latency.parse, default=Latency())
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    arg_parser.add_argument("--server-concurrency", type=int, default=None, help="429 above this many in-flight requests")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args(argv)
+    report(args, asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Models for benchmarks that answer instantly, so only the framework's own overhead is measured.
+"""
+from typing import Any, Dict
+
+from promptchain.llm import ChatMessageModel
+from promptchain.message import AIMessage, Messages
+
+
+class StubChatMessageModel(ChatMessageModel):
+    """
+    Goes through the same request path as the real models (history selection, payload
+    building, cache lookup) and returns a fixed AIMessage instead of calling a provider.
+    """
+
+    def __init__(self, name: str = "stub", reply: str = "ok", **kwargs) -> None:
+        super().__init__(name, "stub", None, **kwargs)
+        self.reply = reply
+
+    def build_request(self, messages: Messages) -> Dict[str, Any]:
+        request = dict(self.model_config)
+        request["model"] = self.model_name
+        request["messages"] = self.build_payload(messages, "openai")
+        return request
+
+    async def invoke(self, messages: Messages, context: Dict[str, Any] = None):
+        request = self.build_request(messages)
+        ticket, cached = await self.cache_lookup(messages, request, context)
+        if cached is not None:
+            return cached
+        message = AIMessage.trusted(content=self.reply)
+        self.cache_store(ticket, message)
+        return message
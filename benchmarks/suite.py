@@ -0,0 +1,313 @@
+"""
+Micro-benchmark suite for the framework's own overhead.
+
+    python benchmarks/suite.py                       run every case
+    python benchmarks/suite.py -k messages           only cases whose name contains "messages"
+    python benchmarks/suite.py --save                write benchmarks/baselines/baseline.json
+    python benchmarks/suite.py --compare             compare with the saved baseline, exit 1 on regressions
+    python benchmarks/suite.py --compare old.json --threshold 0.1
+    python benchmarks/suite.py --save --accept tool.invoke   replace only these cases in the saved baseline
+
+Every case reports the best ns/op over several repeats. A calibration loop of plain Python
+is timed with each run and results are compared relative to it, so a baseline saved on one
+machine (or one busy afternoon) stays meaningful on another. Async runnables are driven
+without an event loop where none of them awaits real I/O, so the numbers are framework cost
+only; the tool cases run on a loop because tool calls are scheduled as concurrent tasks.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
+from pydantic import BaseModel
+from rich.console import Console
+
+from promptchain import parser as parser_module
+from promptchain.chain_processor import CompiledChain
+from promptchain.code_utils import extract_code
+from promptchain.message import AIMessage, HumanMessage, Message, Messages, SystemMessage, ToolCallMessage, ToolMessage
+from promptchain.parser import PydanticParser
+from promptchain.prompt import HumanMessagePromptTemplate
+from promptchain.tool import Tool
+
+from stub import StubChatMessageModel
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "baseline.json")
+DEFAULT_THRESHOLD = 0.25
+
+# name -> (factory returning the callable to time, operations per call)
+CASES: Dict[str, tuple] = {}
+
+
+def case(name: str, per: int = 1):
+    """Registers a benchmark. The decorated function does the setup and returns the callable to time."""
+    def decorator(factory: Callable[[], Callable[[], object]]):
+        CASES[name] = (factory, per)
+        return factory
+    return decorator
+
+
+def run_sync(coroutine):
+    # 被测的协程内部没有真正的 await，直接驱动一次即可，避免把事件循环的开销算进去
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("benchmark coroutine awaited real I/O")
+
+
+def history(size: int) -> Messages:
+    messages = Messages(messages=[SystemMessage(content="you are a helpful assistant")])
+    for i in range(size):
+        messages.add_message(HumanMessage(content=f"question {i} about python lists"))
+        messages.add_message(AIMessage(content=f"answer {i}: use list comprehensions"))
+    return messages
+
+
+# --- Message / Messages ---
+
+@case("message.construct")
+def _():
+    return lambda: HumanMessage(content="what is a generator?")
+
+
+@case("message.trusted")
+def _():
+    return lambda: AIMessage.trusted(content="a function that yields")
+
+
+@case("messages.add")
+def _():
+    messages = history(50)
+    message = HumanMessage(content="one more question")
+    return lambda: messages + message
+
+
+@case("messages.query.role")
+def _():
+    messages = history(5000)
+    return lambda: messages.query(role="assistant", start=-20)
+
+
+@case("messages.query.content")
+def _():
+    messages = history(5000)
+    messages.build_token_index()
+    return lambda: messages.query(content_contains="question 4321 about")
+
+
+@case("messages.union")
+def _():
+    left, right = history(100), history(150)
+    return lambda: left | right
+
+
+@case("messages.difference")
+def _():
+    left, right = history(150), history(100)
+    return lambda: left - right
+
+
+# --- runnables ---
+
+@case("template.invoke")
+def _():
+    template = HumanMessagePromptTemplate.from_template("Translate {text} into {language}.")
+    context = {"text": "hello world", "language": "French"}
+    return lambda: run_sync(template.invoke(None, context))
+
+
+class Answer(BaseModel):
+    name: str
+    score: float
+    tags: List[str]
+
+
+@case("parser.invoke")
+def _():
+    # rich 的输出写到 devnull，保留渲染的开销但不刷屏
+    parser_module.console = Console(file=open(os.devnull, "w"))
+    parser = PydanticParser(Answer)
+    messages = Messages(messages=[AIMessage(content='Sure: {"name": "x", "score": 0.5, "tags": ["a", "b"]} done')])
+    context = {}
+    return lambda: run_sync(parser.invoke(messages, context))
+
+
+@case("extract_code")
+def _():
+    text = "Here you go:\n```python\ndef add(a, b):\n    return a + b\n```\nand\n```bash\necho hi\n```\n" * 3
+    return lambda: extract_code(text)
+
+
+def tool_call_messages(name: str) -> Messages:
+    call = ToolCallMessage(content="", tool_call=ChatCompletionMessageToolCall(
+        id="call_1", type="function", function=Function(name=name, arguments='{"a": 1, "b": 2}')))
+    return Messages(messages=[HumanMessage(content="1 + 2?"), call])
+
+
+@case("tool.invoke")
+def _():
+    tool = Tool()
+
+    @tool.func()
+    def bench_add(a: int, b: int) -> int:
+        """Adds two numbers."""
+        return a + b
+
+    # tool 调用会 gather 并在线程池中执行同步函数，这里需要真正的事件循环
+    loop = asyncio.new_event_loop()
+    messages = tool_call_messages("bench_add")
+    return lambda: loop.run_until_complete(tool.invoke(messages, {}))
+
+
+@case("tool.invoke.async")
+def _():
+    tool = Tool()
+
+    @tool.func()
+    async def bench_async_add(a: int, b: int) -> int:
+        """Adds two numbers."""
+        return a + b
+
+    loop = asyncio.new_event_loop()
+    messages = tool_call_messages("bench_async_add")
+    return lambda: loop.run_until_complete(tool.invoke(messages, {}))
+
+
+@case("chain.node", per=10)
+def _():
+    chain = CompiledChain([StubChatMessageModel(f"stub_{i}") for i in range(10)], history(5))
+    return lambda: run_sync(chain.invoke())
+
+
+@case("chain.empty")
+def _():
+    chain = CompiledChain([], history(5))
+    return lambda: run_sync(chain.invoke())
+
+
+# --- runner ---
+
+def calibrate() -> float:
+    def loop():
+        total = 0
+        for i in range(1000):
+            total += i * i
+        return total
+    return measure(loop, 1)
+
+
+def measure(fn: Callable[[], object], per: int, min_time: float = 0.2, repeat: int = 5) -> float:
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    number = max(int(number * min_time / max(elapsed, 1e-9)), 1)
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number / per * 1e9
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(pattern: Optional[str] = None, min_time: float = 0.2) -> Dict:
+    results = {}
+    for name, (factory, per) in CASES.items():
+        if pattern and pattern not in name:
+            continue
+        results[name] = measure(factory(), per, min_time)
+        print(f"{name:<28}{results[name]:>12,.0f} ns/op")
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "calibration_ns": calibrate(),
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Returns the cases slower than the baseline by more than `threshold`, relative to calibration."""
+    scale = current["calibration_ns"] / baseline["calibration_ns"]
+    regressions = []
+    print(f"\nvs {baseline.get('commit')} (machine speed factor {scale:.2f})")
+    print(f"{'case':<28}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, ns in current["results"].items():
+        if name not in baseline["results"]:
+            # 新增的 case 没有可比较的值，列出来，需要用 --accept 加入 baseline
+            print(f"{name:<28}{'-':>12}{ns:>12,.0f}{'new':>10}")
+            continue
+        expected = baseline["results"][name] * scale
+        change = ns / expected - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<28}{expected:>12,.0f}{ns:>12,.0f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def accept(current: Dict, path: str, names: List[str]) -> Dict:
+    """
+    Returns the baseline at `path` with `names` replaced by the current results.
+    The new values are scaled to the baseline's calibration, the other cases keep their old values
+    so accepting one slowdown does not hide another.
+    """
+    with open(path, encoding="utf-8") as file:
+        baseline = json.load(file)
+    scale = baseline["calibration_ns"] / current["calibration_ns"]
+    for name in names:
+        if name not in current["results"]:
+            raise SystemExit(f"cannot accept {name}: the case did not run")
+        baseline["results"][name] = current["results"][name] * scale
+        baseline.setdefault("accepted", {})[name] = current["commit"]
+    return baseline
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("-k", dest="pattern", help="only run cases whose name contains this text")
+    arg_parser.add_argument("--save", nargs="?", const=BASELINE_PATH, help="save the results as a baseline")
+    arg_parser.add_argument("--compare", nargs="?", const=BASELINE_PATH, help="compare with a saved baseline")
+    arg_parser.add_argument("--accept", action="append", metavar="CASE",
+        help="with --save, replace only this case in the existing baseline and keep the others (repeatable)")
+    arg_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+        help=f"allowed slowdown before a case counts as a regression (default {DEFAULT_THRESHOLD})")
+    arg_parser.add_argument("--min-time", type=float, default=0.2, help="seconds per repeat")
+    args = arg_parser.parse_args(argv)
+    if args.accept and not args.save:
+        arg_parser.error("--accept requires --save")
+
+    current = run(args.pattern, args.min_time)
+    status = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            regressions = compare(current, json.load(file), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            status = 1
+    if args.save:
+        saved = current
+        if args.accept:
+            saved = accept(current, args.save, args.accept)
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(saved, file, indent=2)
+            file.write("\n")
+        print(f"\nsaved {args.save}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,11 +9,13 @@ from promptchain.chain_processor import ChainProcessor
 from promptchain.processors import PrintMarkdownProcessor
 from promptchain.llm import DeepseekChatMessageModel
 from promptchain.tool import Tool
+from promptchain.cache import ToolCache
 console = Console()
 
 tool_manager = Tool()
 
-@tool_manager.func()
+# 相同城市的气温 10 分钟内直接使用缓存的结果
+@tool_manager.func(cache=ToolCache(ttl=600))
 def get_weather(city_name:str)->str:
     """
     返回指定城市的温度
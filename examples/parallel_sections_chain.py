@@ -0,0 +1,51 @@
+import asyncio
+
+from rich.console import Console
+from rich.markdown import Markdown
+
+from promptchain.message import SystemMessage,Messages
+from promptchain.prompt import HumanMessagePromptTemplate
+from promptchain.chain_processor import ChainProcessor
+from promptchain.chain import Parallel
+from promptchain.llm import DeepseekChatMessageModel
+
+console = Console()
+
+# snowball 中 content 这一步的三个 section 互不依赖，可以同时生成
+llm = DeepseekChatMessageModel("section_writer")
+
+
+class SaveContent:
+    """把分支最后一条消息保存到 context 中"""
+    def __init__(self, output_key:str):
+        self.output_key = output_key
+
+    async def invoke(self, messages, context):
+        context[self.output_key] = messages.get_last_message().content
+
+
+async def main():
+    sections = [
+        "Introduction to Functional Programming",
+        "Core Functional Concepts in Python",
+        "Advanced Functional Patterns",
+    ]
+    initial_context = {"title": "Unlocking Functional Python: A Deep Dive"}
+    branches = {}
+    for index, section in enumerate(sections):
+        initial_context[f"section_{index}"] = section
+        section_prompt = HumanMessagePromptTemplate.from_template(
+            "For the article '{title}', write one paragraph for the section: {section_" + str(index) + "}"
+        )
+        branches[f"section_{index}"] = [section_prompt, llm, SaveContent(f"content_{index}")]
+
+    chain = ChainProcessor(Messages(messages=[SystemMessage(content="You are a technical writer.")]))
+    # 三个分支并发执行，分支的 context 更新合并回主链，消息不进入主链历史
+    chain | Parallel(branches, merge="context", max_concurrency=3)
+
+    context = await chain.invoke(initial_context)
+    for index, section in enumerate(sections):
+        console.print(Markdown(f"## {section}\n{context[f'content_{index}']}"))
+
+if __name__ == "__main__":
+    asyncio.run(main())
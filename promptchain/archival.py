@@ -0,0 +1,455 @@
+import asyncio
+import inspect
+import json
+import math
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from promptchain.config import PromptChainConfig, EmbeddingConfig
+from promptchain.message import Messages
+
+MANIFEST_NAME = "manifest.json"
+
+
+@dataclass
+class ArchivalRecord:
+    id: str
+    text: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    score: float = 0.0
+
+
+@dataclass
+class _Segment:
+    name: str
+    rows: int = 0
+    sealed: bool = False
+    deleted: Set[int] = field(default_factory=set)
+
+
+class ArchivalStorage:
+    """
+    Append-only archival memory backed by memory-mapped float32 segments.
+
+    Each segment is made of three files in `path`:
+        <name>.f32    raw float32 embeddings, one row of `embedding_dim` values per record
+        <name>.jsonl  one JSON line of metadata (id, text, metadata) per record
+        <name>.idx    uint64 byte offsets into the .jsonl, so a hit's metadata is read with one seek
+
+    Writes go to the active segment; it is sealed once it holds `segment_rows` rows and a new
+    one is started. Searches memory-map every segment and score it in blocks of `block_rows`
+    rows, so only one block per segment is resident at a time. Deleted rows are tombstoned and
+    dropped when segments are merged. Merging happens automatically:
+        - once more than `max_segments` sealed segments exist, segments of about the same size
+          are merged into one larger segment, so a row is rewritten only O(log N) times over
+          the life of the store;
+        - a sealed segment whose share of deleted rows exceeds `max_deleted_ratio` is rewritten.
+    `compact()` merges all sealed segments into one.
+
+    Vectors are L2-normalized on insert so the dot product is the cosine similarity.
+    Searches may run in other threads while records are added; the files of merged segments are
+    only removed once no search is reading them.
+    """
+
+    def __init__(self,
+            path: str,
+            embedding_dim: int,
+            segment_rows: int = 262144,
+            max_segments: int = 8,
+            block_rows: int = 65536,
+            max_deleted_ratio: float = 0.25) -> None:
+        self.path = path
+        self.embedding_dim = embedding_dim
+        self.segment_rows = segment_rows
+        self.max_segments = max_segments
+        self.block_rows = block_rows
+        self.max_deleted_ratio = max_deleted_ratio
+        self._lock = threading.RLock()
+        self._segments: List[_Segment] = []
+        self._next_segment = 0
+        # 正在被 search 读取的 segment 数量，合并掉的 segment 等到没有读者时才删除文件
+        self._readers: Dict[str, int] = {}
+        self._retired: List[_Segment] = []
+        # id -> [(segment, row)]，第一次 delete 时建立，之后随写入和合并更新
+        self._id_index: Optional[Dict[str, List[Tuple[_Segment, int]]]] = None
+        os.makedirs(path, exist_ok=True)
+        self._load_manifest()
+
+    @classmethod
+    def from_config(cls, config: PromptChainConfig, embedding_config: EmbeddingConfig, **kwargs) -> "ArchivalStorage":
+        if config.archival_storage_type != "json":
+            raise ValueError(f"Unsupported archival_storage_type '{config.archival_storage_type}', only 'json' is supported.")
+        return cls(config.archival_storage_path, embedding_config.embedding_dim, **kwargs)
+
+    # --- manifest ---
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, MANIFEST_NAME)
+
+    def _load_manifest(self):
+        manifest_path = self._manifest_path()
+        if not os.path.exists(manifest_path):
+            self._save_manifest()
+            return
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        if manifest["embedding_dim"] != self.embedding_dim:
+            raise ValueError(f"Archival storage at '{self.path}' has embedding_dim {manifest['embedding_dim']}, got {self.embedding_dim}.")
+        self._next_segment = manifest["next_segment"]
+        self._segments = [_Segment(**{**segment, "deleted": set(segment["deleted"])}) for segment in manifest["segments"]]
+        # 上次写入可能在更新 manifest 前中断，以 .idx 中的实际行数为准
+        for segment in self._segments:
+            if not segment.sealed:
+                self._repair(segment)
+
+    def _save_manifest(self):
+        manifest = {
+            "embedding_dim": self.embedding_dim,
+            "next_segment": self._next_segment,
+            "segments": [{**segment.__dict__, "deleted": sorted(segment.deleted)} for segment in self._segments],
+        }
+        tmp_path = self._manifest_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+        os.replace(tmp_path, self._manifest_path())
+
+    def _file(self, segment: _Segment, suffix: str) -> str:
+        return os.path.join(self.path, f"{segment.name}{suffix}")
+
+    def _repair(self, segment: _Segment):
+        """Truncates the three files of the active segment to the last fully written row."""
+        row_bytes = 4 * self.embedding_dim
+        idx_rows = os.path.getsize(self._file(segment, ".idx")) // 8
+        vec_rows = os.path.getsize(self._file(segment, ".f32")) // row_bytes
+        rows = min(idx_rows, vec_rows)
+        meta_end = 0
+        if rows:
+            offsets = np.fromfile(self._file(segment, ".idx"), dtype=np.uint64, count=rows)
+            with open(self._file(segment, ".jsonl"), "rb") as file:
+                file.seek(int(offsets[-1]))
+                line = file.readline()
+            if line.endswith(b"\n"):
+                meta_end = int(offsets[-1]) + len(line)
+            else:
+                rows -= 1
+                meta_end = int(offsets[-1])
+        for suffix, size in ((".idx", rows * 8), (".f32", rows * row_bytes), (".jsonl", meta_end)):
+            with open(self._file(segment, suffix), "r+b") as file:
+                file.truncate(size)
+        segment.rows = rows
+
+    def _new_segment(self) -> _Segment:
+        segment = _Segment(name=f"segment-{self._next_segment:06d}")
+        self._next_segment += 1
+        self._segments.append(segment)
+        for suffix in (".f32", ".jsonl", ".idx"):
+            open(self._file(segment, suffix), "wb").close()
+        return segment
+
+    def _active_segment(self) -> _Segment:
+        if not self._segments or self._segments[-1].sealed:
+            return self._new_segment()
+        return self._segments[-1]
+
+    # --- writes ---
+
+    def add(self,
+            texts: Sequence[str],
+            embeddings: Any,
+            metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+            ids: Optional[Sequence[str]] = None) -> List[str]:
+        """
+        Appends records and returns their ids.
+
+        Args:
+            texts: The passages to store.
+            embeddings: A (len(texts), embedding_dim) array-like.
+            metadatas: Optional metadata dict per passage.
+            ids: Optional ids, generated as "<segment>:<row>" when omitted.
+        """
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.embedding_dim)
+        if len(vectors) != len(texts):
+            raise ValueError(f"Got {len(texts)} texts but {len(vectors)} embeddings.")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            added_ids = self._write(texts, vectors, metadatas, ids)
+            self._save_manifest()
+            self._maybe_compact()
+        return added_ids
+
+    def _write(self, texts, vectors, metadatas, ids) -> List[str]:
+        # 写入当前活跃的 segment，写满后封存并切换到新的 segment
+        added_ids: List[str] = []
+        start = 0
+        while start < len(texts):
+            segment = self._active_segment()
+            count = min(len(texts) - start, self.segment_rows - segment.rows)
+            added_ids.extend(self._append(segment, texts[start:start + count], vectors[start:start + count],
+                metadatas[start:start + count] if metadatas else None,
+                ids[start:start + count] if ids else None))
+            start += count
+            if segment.rows >= self.segment_rows:
+                segment.sealed = True
+        return added_ids
+
+    def _append(self, segment: _Segment, texts, vectors, metadatas, ids) -> List[str]:
+        added_ids = []
+        with open(self._file(segment, ".jsonl"), "ab") as meta_file, open(self._file(segment, ".idx"), "ab") as idx_file:
+            offset = meta_file.tell()
+            offsets = np.empty(len(texts), dtype=np.uint64)
+            lines = []
+            for i, text in enumerate(texts):
+                record_id = ids[i] if ids else f"{segment.name}:{segment.rows + i}"
+                line = json.dumps({
+                    "id": record_id,
+                    "text": text,
+                    "metadata": metadatas[i] if metadatas else {},
+                }, ensure_ascii=False).encode("utf-8") + b"\n"
+                offsets[i] = offset
+                offset += len(line)
+                lines.append(line)
+                added_ids.append(record_id)
+                if self._id_index is not None:
+                    self._id_index.setdefault(record_id, []).append((segment, segment.rows + i))
+            meta_file.write(b"".join(lines))
+            # 先写向量和元数据，最后写 .idx，中断时以 .idx 的行数为准
+            with open(self._file(segment, ".f32"), "ab") as vec_file:
+                vec_file.write(np.ascontiguousarray(vectors).tobytes())
+            idx_file.write(offsets.tobytes())
+        segment.rows += len(texts)
+        return added_ids
+
+    def delete(self, record_ids: Iterable[str]) -> int:
+        """Tombstones records by id, the space is reclaimed by compact(). Returns the number deleted."""
+        deleted = 0
+        with self._lock:
+            index = self._build_id_index()
+            for record_id in set(record_ids):
+                for segment, row in index.get(record_id, ()):
+                    if row not in segment.deleted:
+                        segment.deleted.add(row)
+                        deleted += 1
+            self._save_manifest()
+            self._maybe_compact()
+        return deleted
+
+    def _build_id_index(self) -> Dict[str, List[Tuple[_Segment, int]]]:
+        if self._id_index is None:
+            self._id_index = {}
+            for segment in self._segments:
+                for row, record in enumerate(self._iter_metadata(segment)):
+                    self._id_index.setdefault(record["id"], []).append((segment, row))
+        return self._id_index
+
+    def _unindex(self, record_id: str, segment: _Segment) -> None:
+        locations = [location for location in self._id_index.get(record_id, ()) if location[0] is not segment]
+        if locations:
+            self._id_index[record_id] = locations
+        else:
+            self._id_index.pop(record_id, None)
+
+    def _maybe_compact(self) -> None:
+        sealed = [segment for segment in self._segments if segment.sealed]
+        dirty = [segment for segment in sealed if len(segment.deleted) > self.max_deleted_ratio * segment.rows]
+        if dirty:
+            self._merge(dirty)
+            sealed = [segment for segment in self._segments if segment.sealed]
+        while len(sealed) > self.max_segments:
+            self._merge(self._merge_candidates(sealed))
+            sealed = [segment for segment in self._segments if segment.sealed]
+
+    def _merge_candidates(self, sealed: List[_Segment]) -> List[_Segment]:
+        # 按大小分层，每层大约是上一层的 factor 倍，只合并同一层的 segment，
+        # 合并结果进入更高的层，所以每行最多被重写 log_factor(N / segment_rows) 次
+        factor = max(2, self.max_segments // 2)
+        tiers: Dict[int, List[_Segment]] = {}
+        for segment in sealed:
+            size = max(segment.rows - len(segment.deleted), 1) / self.segment_rows
+            tiers.setdefault(int(math.floor(math.log(size, factor))) if size > 1 else 0, []).append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= 2:
+                return tiers[tier]
+        return sorted(sealed, key=lambda segment: segment.rows - len(segment.deleted))[:2]
+
+    def compact(self) -> None:
+        """Rewrites all sealed segments into a single segment, dropping deleted rows."""
+        with self._lock:
+            sealed = [segment for segment in self._segments if segment.sealed]
+            if sealed:
+                self._merge(sealed)
+
+    def _merge(self, segments: List[_Segment]) -> None:
+        # 合并后的 segment 不受 segment_rows 限制，位置在活跃的 segment 之前
+        merged = _Segment(name=f"segment-{self._next_segment:06d}")
+        self._next_segment += 1
+        for suffix in (".f32", ".jsonl", ".idx"):
+            open(self._file(merged, suffix), "wb").close()
+        for segment in segments:
+            vectors = self._vectors(segment)
+            deleted = segment.deleted
+            records = self._iter_metadata(segment)
+            for start in range(0, segment.rows, self.block_rows):
+                stop = min(start + self.block_rows, segment.rows)
+                block = [next(records) for _ in range(start, stop)]
+                if self._id_index is not None:
+                    for record in block:
+                        self._unindex(record["id"], segment)
+                keep = [row for row in range(start, stop) if row not in deleted]
+                if not keep:
+                    continue
+                kept = [block[row - start] for row in keep]
+                self._append(merged, [record["text"] for record in kept], np.asarray(vectors[keep]),
+                    [record["metadata"] for record in kept], [record["id"] for record in kept])
+            del vectors
+        merged.sealed = True
+        remaining = [segment for segment in self._segments if segment not in segments]
+        sealed = [segment for segment in remaining if segment.sealed]
+        active = [segment for segment in remaining if not segment.sealed]
+        self._segments = sealed + ([merged] if merged.rows else []) + active
+        self._save_manifest()
+        self._retired.extend(segments + ([] if merged.rows else [merged]))
+        self._remove_retired()
+
+    def _remove_retired(self) -> None:
+        # 仍有 search 在读取的 segment 留到最后一个读者结束时删除
+        retired = []
+        for segment in self._retired:
+            if self._readers.get(segment.name):
+                retired.append(segment)
+                continue
+            for suffix in (".f32", ".jsonl", ".idx"):
+                os.remove(self._file(segment, suffix))
+        self._retired = retired
+
+    # --- reads ---
+
+    def _vectors(self, segment: _Segment) -> np.ndarray:
+        if segment.rows == 0:
+            return np.empty((0, self.embedding_dim), dtype=np.float32)
+        return np.memmap(self._file(segment, ".f32"), dtype=np.float32, mode="r", shape=(segment.rows, self.embedding_dim))
+
+    def _iter_metadata(self, segment: _Segment):
+        with open(self._file(segment, ".jsonl"), "rb") as file:
+            for _ in range(segment.rows):
+                yield json.loads(file.readline())
+
+    def _read_records(self, segment: _Segment, rows: Sequence[int]) -> List[Dict[str, Any]]:
+        offsets = np.memmap(self._file(segment, ".idx"), dtype=np.uint64, mode="r", shape=(segment.rows,))
+        records = []
+        with open(self._file(segment, ".jsonl"), "rb") as file:
+            for row in rows:
+                file.seek(int(offsets[row]))
+                records.append(json.loads(file.readline()))
+        return records
+
+    def search(self, query: Any, top_k: int = 5) -> List[ArchivalRecord]:
+        """Returns the top_k records with the highest cosine similarity to `query`."""
+        query = np.asarray(query, dtype=np.float32).reshape(self.embedding_dim)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        with self._lock:
+            segments = [(segment, segment.rows, np.fromiter(segment.deleted, dtype=np.int64, count=len(segment.deleted)))
+                for segment in self._segments]
+            for segment, _, _ in segments:
+                self._readers[segment.name] = self._readers.get(segment.name, 0) + 1
+        try:
+            return self._search(query, top_k, segments)
+        finally:
+            with self._lock:
+                for segment, _, _ in segments:
+                    self._readers[segment.name] -= 1
+                    if not self._readers[segment.name]:
+                        del self._readers[segment.name]
+                self._remove_retired()
+
+    def _search(self, query: np.ndarray, top_k: int, segments: List[Tuple[_Segment, int, np.ndarray]]) -> List[ArchivalRecord]:
+        # (score, segment index, row) 的候选集合，每个 block 只保留 top_k
+        best_scores = np.empty(0, dtype=np.float32)
+        best_refs: List[Tuple[int, int]] = []
+        for segment_index, (segment, rows, deleted) in enumerate(segments):
+            if rows == 0:
+                continue
+            vectors = np.memmap(self._file(segment, ".f32"), dtype=np.float32, mode="r", shape=(rows, self.embedding_dim))
+            for start in range(0, rows, self.block_rows):
+                scores = np.asarray(vectors[start:start + self.block_rows] @ query)
+                if deleted.size:
+                    local = deleted[(deleted >= start) & (deleted < start + len(scores))] - start
+                    scores[local] = -np.inf
+                k = min(top_k, len(scores))
+                candidates = np.argpartition(-scores, k - 1)[:k]
+                best_scores = np.concatenate([best_scores, scores[candidates]])
+                best_refs.extend((segment_index, start + int(row)) for row in candidates)
+                if len(best_scores) > top_k:
+                    keep = np.argpartition(-best_scores, top_k - 1)[:top_k]
+                    best_scores = best_scores[keep]
+                    best_refs = [best_refs[i] for i in keep]
+            del vectors
+
+        order = np.argsort(-best_scores)
+        results = []
+        for i in order:
+            if not np.isfinite(best_scores[i]):
+                continue
+            segment_index, row = best_refs[i]
+            record = self._read_records(segments[segment_index][0], [row])[0]
+            results.append(ArchivalRecord(id=record["id"], text=record["text"], metadata=record["metadata"], score=float(best_scores[i])))
+        return results
+
+    def __len__(self):
+        with self._lock:
+            return sum(segment.rows - len(segment.deleted) for segment in self._segments)
+
+    def __repr__(self):
+        return f"ArchivalStorage(path='{self.path}', rows={len(self)}, segments={len(self._segments)})"
+
+
+class ArchivalMemory:
+    """
+    Chain runnable that retrieves passages related to the last user message from an
+    ArchivalStorage and puts them into the context.
+
+    context[output_key] holds the passages joined by blank lines, ready to be used as a
+    prompt template variable, and context[f"{output_key}_records"] the ArchivalRecord list.
+    """
+    name: str = "ArchivalMemory"
+
+    def __init__(self,
+            storage: ArchivalStorage,
+            embed: Callable[[str], Any],
+            top_k: int = 5,
+            output_key: str = "archival_passages",
+            min_score: float = 0.0) -> None:
+        self.storage = storage
+        self.embed = embed
+        self.top_k = top_k
+        self.output_key = output_key
+        self.min_score = min_score
+
+    async def invoke(self, messages: Messages, context: Dict[str, Any]) -> None:
+        query = None
+        for message in reversed(messages.messages):
+            if message.role == "user":
+                query = message.content
+                break
+        if query is None:
+            context[self.output_key] = ""
+            context[f"{self.output_key}_records"] = []
+            return None
+
+        vector = self.embed(query)
+        if inspect.isawaitable(vector):
+            vector = await vector
+        # 检索是 CPU 密集的操作，放到线程中执行，避免阻塞 event loop
+        records = await asyncio.to_thread(self.storage.search, vector, self.top_k)
+        records = [record for record in records if record.score >= self.min_score]
+        context[self.output_key] = "\n\n".join(record.text for record in records)
+        context[f"{self.output_key}_records"] = records
+        return None
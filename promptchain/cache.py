@@ -0,0 +1,382 @@
+import asyncio
+import json
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+# 在 context 中设置该 key 为 True，本次调用跳过缓存(既不读取也不写入)
+CACHE_BYPASS_KEY = "cache_bypass"
+
+# 这些请求参数不影响模型输出，不参与计算缓存 key
+IGNORED_REQUEST_FIELDS = frozenset({"stream", "stream_options", "timeout", "keep_alive"})
+
+
+def canonical_json(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def make_cache_key(request: Dict[str, Any], messages: Optional[Sequence[Any]] = None) -> str:
+    """
+    Hashes a provider request (model, messages, tools, temperature, ...) into a cache key.
+    Transport-only fields such as stream and timeout are ignored.
+
+    When the Message objects the request was built from are given, their cached digests
+    replace request["messages"], so long histories are not serialized again for every lookup.
+    """
+    payload = {k: v for k, v in request.items() if k not in IGNORED_REQUEST_FIELDS}
+    if messages is not None:
+        payload["messages"] = [message.digest for message in messages]
+    return hashlib.sha256(canonical_json(payload).encode("utf-8")).hexdigest()
+
+
+class BaseCache(ABC):
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """get() for the event loop, tiers doing blocking I/O run it in a thread."""
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any) -> None:
+        self.set(key, value)
+
+    def _record(self, value: Optional[Any]) -> Optional[Any]:
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class MemoryLRUCache(BaseCache):
+    """In-process LRU cache, entries are evicted when `maxsize` is reached or after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None) -> None:
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return self._record(None)
+            created, value = entry
+            if self.ttl is not None and time.monotonic() - created > self.ttl:
+                del self._data[key]
+                return self._record(None)
+            self._data.move_to_end(key)
+            return self._record(value)
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "size": len(self._data), "maxsize": self.maxsize}
+
+
+class SQLiteCache(BaseCache):
+    """
+    Persistent cache tier, values are stored as JSON in a single SQLite table.
+
+    aget/aset run the queries in a worker thread so they don't block the event loop.
+    Entries older than `ttl` seconds are dropped, and once the table holds more than
+    `max_rows` entries the oldest ones are deleted.
+    """
+
+    def __init__(self, path: str = "promptchain_cache.db", ttl: Optional[float] = None, table: str = "llm_cache",
+            max_rows: Optional[int] = 100_000) -> None:
+        super().__init__()
+        # 表名直接拼接在 SQL 中，只允许字母、数字和下划线
+        if not re.fullmatch(r"\w+", table):
+            raise ValueError(f"Invalid table name '{table}', only letters, digits and underscores are allowed.")
+        self.path = path
+        self.ttl = ttl
+        self.table = table
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_created ON {table} (created)")
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        # 调用方持有 self._lock；_rows 是行数的上限估计(INSERT OR REPLACE 覆盖时也会加一)
+        if self.ttl is not None:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE created < ?", (time.time() - self.ttl,))
+        if self.max_rows is not None:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY created DESC, rowid DESC LIMIT -1 OFFSET ?)", (self.max_rows,))
+        self._rows = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return self._record(None)
+            value, created = row
+            if self.ttl is not None and time.time() - created > self.ttl:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return self._record(None)
+        return self._record(json.loads(value))
+
+    def set(self, key: str, value: Any) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created) VALUES (?, ?, ?)",
+                (key, data, time.time()),
+            )
+            self._rows += 1
+            if self.max_rows is not None and self._rows > self.max_rows:
+                self._evict()
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Any) -> None:
+        await asyncio.to_thread(self.set, key, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._rows = 0
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class LLMCache:
+    """
+    Exact-match response cache used by ChatMessageModel.
+
+    Lookups go to the memory tier first, then to the optional persistent tier; persistent
+    hits are promoted to memory. Values must be JSON serializable.
+
+    Args:
+        memory: The in-process tier, defaults to a MemoryLRUCache with 1024 entries.
+        persistent: Optional second tier, e.g. SQLiteCache("cache.db").
+    """
+
+    def __init__(self, memory: Optional[BaseCache] = None, persistent: Optional[BaseCache] = None) -> None:
+        self.memory = memory if memory is not None else MemoryLRUCache()
+        self.persistent = persistent
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            value = self.persistent.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            self.persistent.set(key, value)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """get() for the event loop, the persistent tier is read without blocking it."""
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            value = await self.persistent.aget(key)
+            if value is not None:
+                self.memory.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def aset(self, key: str, value: Any) -> None:
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            await self.persistent.aset(key, value)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        result = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory": self.memory.stats(),
+        }
+        if self.persistent is not None:
+            result["persistent"] = self.persistent.stats()
+        return result
+
+
+class ToolCache:
+    """
+    Result cache of a single tool, enabled with Tool.func(cache=ToolCache(...)).
+
+    Keys are the tool name plus its validated arguments, so defaults and coercion ("3" vs 3)
+    don't create separate entries. Concurrent calls with the same key share one execution.
+    Failed calls are not cached.
+
+    Args:
+        ttl: Seconds a result stays valid, None keeps it until evicted.
+        maxsize: Entries kept in memory.
+        persistent: Optional shared tier, e.g. SQLiteCache("tools.db", table="tool_cache"). It can be
+            shared by several tools and processes; the ttl of each tool is checked on read.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, maxsize: int = 256, persistent: Optional[BaseCache] = None) -> None:
+        self.ttl = ttl
+        self.memory = MemoryLRUCache(maxsize=maxsize, ttl=ttl)
+        self.persistent = persistent
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        # key -> 正在执行的 task，相同参数的并发调用等待同一个结果
+        self._pending: Dict[str, "asyncio.Task"] = {}
+
+    @staticmethod
+    def make_key(tool_name: str, arguments: Dict[str, Any]) -> str:
+        return hashlib.sha256(canonical_json({"tool": tool_name, "arguments": arguments}).encode("utf-8")).hexdigest()
+
+    def _fresh(self, entry: Optional[Dict[str, Any]]) -> Optional[str]:
+        if entry is None or (self.ttl is not None and time.time() - entry["created"] > self.ttl):
+            return None
+        return entry["content"]
+
+    def get(self, key: str) -> Optional[str]:
+        content = self._fresh(self.memory.get(key))
+        if content is None and self.persistent is not None:
+            entry = self.persistent.get(key)
+            content = self._fresh(entry)
+            if content is not None:
+                self.memory.set(key, entry)
+        return content
+
+    def set(self, key: str, content: str) -> None:
+        entry = {"content": content, "created": time.time()}
+        self.memory.set(key, entry)
+        if self.persistent is not None:
+            self.persistent.set(key, entry)
+
+    async def aget(self, key: str) -> Optional[str]:
+        content = self._fresh(self.memory.get(key))
+        if content is None and self.persistent is not None:
+            entry = await self.persistent.aget(key)
+            content = self._fresh(entry)
+            if content is not None:
+                self.memory.set(key, entry)
+        return content
+
+    async def _call_and_store(self, key: str, call: Callable[[], Awaitable[str]]) -> str:
+        content = await call()
+        entry = {"content": content, "created": time.time()}
+        self.memory.set(key, entry)
+        if self.persistent is not None:
+            await self.persistent.aset(key, entry)
+        return content
+
+    async def get_or_call(self, key: str, call: Callable[[], Awaitable[str]]) -> Tuple[str, str]:
+        """
+        Returns (content, result) where result is "hit", "coalesced" or "miss"; on a miss `call`
+        runs once and its content is stored.
+        """
+        loop = asyncio.get_running_loop()
+        task = self._pending.get(key)
+        if task is not None and task.get_loop() is loop:
+            self.coalesced += 1
+            return await asyncio.shield(task), "coalesced"
+        content = await self.aget(key)
+        if content is not None:
+            self.hits += 1
+            return content, "hit"
+        # 读取持久层时可能有相同参数的调用已经开始执行
+        task = self._pending.get(key)
+        if task is not None and task.get_loop() is loop:
+            self.coalesced += 1
+            return await asyncio.shield(task), "coalesced"
+        self.misses += 1
+        task = loop.create_task(self._call_and_store(key, call))
+        self._pending[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        # shield: 等待的调用被取消时不影响其他共享这个结果的调用
+        return await asyncio.shield(task), "miss"
+
+    def _finish(self, key: str, task: "asyncio.Task") -> None:
+        if self._pending.get(key) is task:
+            del self._pending[key]
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses + self.coalesced
+        result = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / total if total else 0.0,
+            "size": len(self.memory),
+            "maxsize": self.memory.maxsize,
+        }
+        if self.persistent is not None:
+            result["persistent"] = self.persistent.stats()
+        return result
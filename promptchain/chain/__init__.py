@@ -0,0 +1,9 @@
+from .parallel import Parallel,BranchResult,merge_append,merge_namespace,merge_context_only
+
+__all__ = (
+    "Parallel",
+    "BranchResult",
+    "merge_append",
+    "merge_namespace",
+    "merge_context_only"
+)
@@ -0,0 +1,145 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from promptchain.message import Message, Messages
+from promptchain.chain_processor import ChainProcessor, Runnable, run_chain
+
+
+@dataclass
+class BranchResult:
+    name: str
+    # 分支新产生的消息(不包含 fork 时复制过去的历史)
+    messages: List[Message] = field(default_factory=list)
+    # 分支中新增或者被修改的 context 字段
+    context: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[BaseException] = None
+
+
+MergeStrategy = Callable[[List[BranchResult], Messages, Dict[str, Any]], Optional[List[Message]]]
+
+
+def merge_append(results: List[BranchResult], messages: Messages, context: Dict[str, Any]) -> List[Message]:
+    """Writes every branch's context updates into the shared context (later branches win) and appends their messages in branch order."""
+    merged = []
+    for result in results:
+        context.update(result.context)
+        merged.extend(result.messages)
+    return merged
+
+
+def merge_namespace(results: List[BranchResult], messages: Messages, context: Dict[str, Any]) -> List[Message]:
+    """Stores each branch's context updates under context[branch_name] so branches can't overwrite each other."""
+    merged = []
+    for result in results:
+        context[result.name] = result.context
+        merged.extend(result.messages)
+    return merged
+
+
+def merge_context_only(results: List[BranchResult], messages: Messages, context: Dict[str, Any]) -> None:
+    """Like merge_append but drops the branch messages, useful when branches only feed parsers."""
+    for result in results:
+        context.update(result.context)
+    return None
+
+
+MERGE_STRATEGIES: Dict[str, MergeStrategy] = {
+    "append": merge_append,
+    "namespace": merge_namespace,
+    "context": merge_context_only,
+}
+
+Branch = Union[ChainProcessor, Runnable, List[Runnable]]
+
+
+class Parallel:
+    """
+    A chain node that runs several sub-chains concurrently and merges their outputs.
+
+    Every branch starts from its own copy of the current messages and a shallow copy of
+    the context, so branches never see each other's writes. Once all branches finish,
+    `merge` folds their results back into the parent chain.
+
+    Args:
+        branches: Sub-chains keyed by name. A branch can be a ChainProcessor (only its
+            chain_list is used), a list of runnables or a single runnable.
+        merge: "append", "namespace", "context" or a callable taking
+            (results, messages, context) and returning the messages to add.
+        max_concurrency: Maximum number of branches running at the same time, None means no limit.
+        fail_fast: If True the first failing branch cancels the others and the error is raised.
+            Otherwise every branch runs to completion, failed branches are skipped by the merge
+            and their errors are stored in context[f"{name}_error"].
+    """
+    name: str = "Parallel"
+    span_kind = "parallel"
+
+    def __init__(self,
+            branches: Dict[str, Branch],
+            merge: Union[str, MergeStrategy] = "append",
+            max_concurrency: Optional[int] = None,
+            fail_fast: bool = True) -> None:
+        if isinstance(merge, str):
+            if merge not in MERGE_STRATEGIES:
+                raise ValueError(f"Unknown merge strategy '{merge}'. Expected one of {list(MERGE_STRATEGIES)} or a callable.")
+            merge = MERGE_STRATEGIES[merge]
+        self.branches = {name: self._as_chain_list(branch) for name, branch in branches.items()}
+        self.merge = merge
+        self.max_concurrency = max_concurrency
+        self.fail_fast = fail_fast
+
+    @staticmethod
+    def _as_chain_list(branch: Branch) -> List[Runnable]:
+        if isinstance(branch, ChainProcessor):
+            return list(branch.chain_list)
+        if isinstance(branch, (list, tuple)):
+            return list(branch)
+        return [branch]
+
+    async def _run_branch(self, name: str, chain_list: List[Runnable], messages: Messages,
+            context: Dict[str, Any], semaphore: Optional[asyncio.Semaphore]) -> BranchResult:
+        branch_messages = Messages(messages=list(messages.messages))
+        branch_context = dict(context)
+        # 等待 semaphore 的时间记录为 branch span 的 queue_wait
+        queued_at = time.perf_counter()
+        if semaphore is not None:
+            async with semaphore:
+                await run_chain(chain_list, branch_messages, branch_context, name=f"{self.name}.{name}", queued_at=queued_at)
+        else:
+            await run_chain(chain_list, branch_messages, branch_context, name=f"{self.name}.{name}", queued_at=queued_at)
+
+        updates = {
+            key: value for key, value in branch_context.items()
+            if key not in context or context[key] is not value
+        }
+        return BranchResult(name=name, messages=branch_messages.messages[len(messages.messages):], context=updates)
+
+    async def invoke(self, messages: Messages, context: Dict[str, Any]) -> Optional[List[Message]]:
+        semaphore = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency else None
+        tasks = [
+            asyncio.ensure_future(self._run_branch(name, chain_list, messages, context, semaphore))
+            for name, chain_list in self.branches.items()
+        ]
+
+        if self.fail_fast:
+            try:
+                results = await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+        else:
+            outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+            results = []
+            for name, outcome in zip(self.branches, outcomes):
+                if isinstance(outcome, BaseException):
+                    context[f"{name}_error"] = str(outcome)
+                else:
+                    results.append(outcome)
+
+        return self.merge(results, messages, context)
+
+    def __repr__(self):
+        return f"Parallel(branches={list(self.branches)}, max_concurrency={self.max_concurrency}, fail_fast={self.fail_fast})"
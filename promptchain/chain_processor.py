@@ -1,41 +1,277 @@
+import asyncio
+import time
 from abc import ABC,abstractmethod
-from typing import Any,Protocol,List,Dict
-from dataclasses import dataclass
+from typing import Any,Protocol,List,Dict,Optional,Iterable,AsyncIterator,Tuple
+from dataclasses import dataclass,field
 
 from promptchain.message import Message,Messages
+from promptchain.stream import MessageStream
+from promptchain import metrics, tracing
 
 # 协议，在 python 协议是不需要显示实现
 class Runnable(Protocol):
     async def invoke(self, messages: Messages, context: Dict[str, Any]) -> Messages|Message:
         ...
 
+# 支持流式输出的 runnable(例如 ChatMessageModel)
+class StreamingRunnable(Runnable, Protocol):
+    def stream(self, messages: Messages, context: Dict[str, Any]) -> MessageStream:
+        ...
+
+# 可以直接消费上一个节点流式输出的 runnable(例如 PrintMarkdownProcessor)
+class StreamConsumer(Runnable, Protocol):
+    async def invoke_stream(self, stream: MessageStream, messages: Messages, context: Dict[str, Any]) -> Messages|Message|None:
+        ...
+
 @dataclass
 class ChainProcessor:
-    chain_list:List[Runnable] 
+    chain_list:List[Runnable]
     messages:Messages
     context: Dict[str, Any]
+    stream: bool
 
-    def __init__(self,messages:Messages):
+    def __init__(self,messages:Messages, stream:bool = False, name:str = "chain"):
         self.chain_list =[]
         self.messages = messages
         self.context = {}
+        # 开启后模型逐 token 输出，下一个节点如果实现了 invoke_stream 会边生成边消费
+        self.stream = stream
+        # metrics 和 tracing 中 chain 的名称
+        self.name = name
 
     def __or__(self, runnable: Runnable):
         self.chain_list.append(runnable)
         return self
 
-    async def invoke(self,initial_context: Dict[str, Any] = None):
+    async def invoke(self,initial_context: Dict[str, Any] = None, stream: Optional[bool] = None):
         if initial_context:
             self.context.update(initial_context)
-            
-        for runnable in self.chain_list:
-            
-            response_message = await runnable.invoke(self.messages, self.context)
-            # TODO 并且是 message shape ("assistant","内容") {"role":"assistant","content":内容}
-            # ["assistant","content"]
-            if response_message is not None:
-                self.messages.add_message(response_message)
-        # TODO 
+        stream = self.stream if stream is None else stream
+        await run_chain(self.chain_list, self.messages, self.context, stream, self.name)
+        # TODO
         return self.context
 
+    def compile(self) -> "CompiledChain":
+        """
+        Freezes the current chain definition into a CompiledChain that can be run many times,
+        also concurrently. self.messages is used as the initial history of every run.
+        """
+        return CompiledChain(self.chain_list, self.messages, self.stream, self.name)
+
+    async def batch(self, contexts: Iterable[Dict[str, Any]], max_concurrency: Optional[int] = None,
+            return_exceptions: bool = False) -> List["RunState"]:
+        return await self.compile().batch(contexts, max_concurrency, return_exceptions)
+
+    def as_completed(self, contexts: Iterable[Dict[str, Any]], max_concurrency: Optional[int] = None,
+            return_exceptions: bool = False) -> AsyncIterator[Tuple[int, "RunState"]]:
+        return self.compile().as_completed(contexts, max_concurrency, return_exceptions)
+
+
+@dataclass
+class RunState:
+    """The mutable state of a single run of a CompiledChain."""
+    messages: Messages
+    context: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[BaseException] = None
+    # 进入队列的时间(time.perf_counter)，用于计算 tracing 中的 queue_wait
+    queued_at: Optional[float] = None
+
+
+class CompiledChain:
+    """
+    An immutable chain definition. Each invoke gets a fresh RunState holding its own copy of
+    the initial messages and its own context, so one CompiledChain can serve many requests.
+
+    The runnables themselves are shared between runs and must not keep per-request state.
+    """
+
+    def __init__(self, chain_list: Iterable[Runnable], messages: Optional[Messages] = None, stream: bool = False,
+            name: str = "chain") -> None:
+        self.chain_list: Tuple[Runnable, ...] = tuple(chain_list)
+        self.initial_messages: Tuple[Message, ...] = tuple(messages.messages) if messages is not None else ()
+        self.stream = stream
+        self.name = name
+
+    def new_state(self, initial_context: Optional[Dict[str, Any]] = None, messages: Optional[Messages] = None) -> RunState:
+        history = messages.messages if messages is not None else self.initial_messages
+        return RunState(
+            messages=Messages(messages=list(history)),
+            context=dict(initial_context) if initial_context else {},
+        )
+
+    async def run(self, state: RunState, stream: Optional[bool] = None) -> RunState:
+        await run_chain(self.chain_list, state.messages, state.context, self.stream if stream is None else stream,
+            self.name, state.queued_at)
+        return state
+
+    async def invoke(self, initial_context: Optional[Dict[str, Any]] = None, messages: Optional[Messages] = None,
+            stream: Optional[bool] = None) -> RunState:
+        """
+        Runs the chain once.
+
+        Args:
+            initial_context: Context for this run, it is copied so the caller's dict is not modified.
+            messages: Optional history to start from instead of the compiled initial messages.
+
+        Returns:
+            RunState: The messages and context produced by this run.
+        """
+        return await self.run(self.new_state(initial_context, messages), stream)
+
+    async def as_completed(self, contexts: Iterable[Dict[str, Any]], max_concurrency: Optional[int] = None,
+            return_exceptions: bool = False) -> AsyncIterator[Tuple[int, RunState]]:
+        """
+        Runs the chain once per context and yields (index, RunState) as runs finish.
+
+        `contexts` is consumed lazily, at most `max_concurrency` runs are in flight (no limit when None,
+        which consumes the whole iterable up front). With return_exceptions a failed run is yielded
+        with RunState.error set, otherwise the first error cancels the remaining runs and is raised.
+        """
+        iterator = enumerate(contexts)
+        pending = set()
+
+        async def run_one(index: int, context: Dict[str, Any], queued_at: float) -> Tuple[int, RunState]:
+            state = self.new_state(context)
+            state.queued_at = queued_at
+            try:
+                await self.run(state)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                state.error = e
+            return index, state
+
+        def fill():
+            for index, context in iterator:
+                pending.add(asyncio.ensure_future(run_one(index, context, time.perf_counter())))
+                if max_concurrency and len(pending) >= max_concurrency:
+                    return
+
+        try:
+            fill()
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    yield task.result()
+                fill()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def batch(self, contexts: Iterable[Dict[str, Any]], max_concurrency: Optional[int] = None,
+            return_exceptions: bool = False) -> List[RunState]:
+        """Runs the chain once per context and returns the RunStates in input order."""
+        results: Dict[int, RunState] = {}
+        async for index, state in self.as_completed(contexts, max_concurrency, return_exceptions):
+            results[index] = state
+        return [results[index] for index in range(len(results))]
+
+    def __repr__(self):
+        return f"CompiledChain(nodes={len(self.chain_list)}, initial_messages={len(self.initial_messages)})"
+
+
+def add_output(messages: Messages, output: Any) -> int:
+    """
+    Adds a runnable's return value to the history, None is ignored and lists are added in order.
+    Returns the number of messages added.
+    """
+    if output is None:
+        return 0
+    # TODO 并且是 message shape ("assistant","内容") {"role":"assistant","content":内容}
+    # ["assistant","content"]
+    if isinstance(output, (list, tuple, Messages)):
+        count = 0
+        for item in output:
+            messages.add_message(item)
+            count += 1
+        return count
+    messages.add_message(output)
+    return 1
+
+
+async def run_chain(chain_list: List[Runnable], messages: Messages, context: Dict[str, Any], stream: bool = False,
+        name: str = "chain", queued_at: Optional[float] = None):
+    """
+    Runs the runnables in order against `messages` and `context`, both are updated in place.
+
+    The duration of the run and of every runnable is recorded in the metrics registry
+    (promptchain.metrics). When tracing is enabled (tracing.enable_tracing) the run and every
+    runnable also get a span, `name` and `queued_at` (a time.perf_counter() value) describe
+    the run's own span.
+    """
+    started = time.perf_counter()
+    tracer = tracing.get_tracer()
+    if tracer is None:
+        try:
+            await _run_nodes(chain_list, messages, context, stream, name, None)
+        finally:
+            metrics.CHAIN_LATENCY.labels(name).observe(time.perf_counter() - started)
+        return
+
+    queue_wait = started - queued_at if queued_at is not None else 0.0
+    span, token = tracer.start_span(name, "chain", len(messages), queue_wait, nodes=len(chain_list))
+    input_count = len(messages)
+    try:
+        await _run_nodes(chain_list, messages, context, stream, name, tracer)
+    except BaseException as e:
+        tracer.end_span(span, token, len(messages) - input_count, e)
+        raise
+    finally:
+        metrics.CHAIN_LATENCY.labels(name).observe(time.perf_counter() - started)
+    tracer.end_span(span, token, len(messages) - input_count)
+
+
+async def _run_nodes(chain_list: List[Runnable], messages: Messages, context: Dict[str, Any], stream: bool,
+        chain_name: str, tracer: Optional[tracing.Tracer]):
+    index = 0
+    ready_at = time.perf_counter()
+    while index < len(chain_list):
+        runnable = chain_list[index]
+        index += 1
+
+        consumer = None
+        streaming = stream and hasattr(runnable, "stream")
+        if streaming and index < len(chain_list) and hasattr(chain_list[index], "invoke_stream"):
+            consumer = chain_list[index]
+            index += 1
+
+        name, kind = tracing.span_name(runnable), tracing.span_kind(runnable)
+        span = token = None
+        if tracer is not None:
+            attributes = {"consumer": tracing.span_name(consumer)} if consumer is not None else {}
+            span, token = tracer.start_span(name, kind, len(messages), time.perf_counter() - ready_at, **attributes)
+        started = time.perf_counter()
+        try:
+            added = await _run_node(runnable, consumer, streaming, messages, context)
+        except BaseException as e:
+            metrics.NODE_ERRORS.labels(chain_name, name, kind).inc()
+            if span is not None:
+                tracer.end_span(span, token, error=e)
+            raise
+        finally:
+            ready_at = time.perf_counter()
+            metrics.NODE_LATENCY.labels(chain_name, name, kind).observe(ready_at - started)
+        if span is not None:
+            tracer.end_span(span, token, added)
+
+
+async def _run_node(runnable: Runnable, consumer: Optional["StreamConsumer"], streaming: bool,
+        messages: Messages, context: Dict[str, Any]) -> int:
+    if streaming:
+        response_message, consumer_output = await _invoke_stream(runnable, consumer, messages, context)
+        return add_output(messages, response_message) + add_output(messages, consumer_output)
+    return add_output(messages, await runnable.invoke(messages, context))
+
 
+async def _invoke_stream(runnable: StreamingRunnable, consumer: Optional[StreamConsumer], messages: Messages, context: Dict[str, Any]):
+    message_stream = runnable.stream(messages, context)
+    consumer_output = None
+    if consumer is not None:
+        consumer_output = await consumer.invoke_stream(message_stream, messages, context)
+    # consumer 可能没有读完，剩余部分在这里读完，保证完整的 AIMessage 进入历史
+    response_message = await message_stream.collect()
+    context.setdefault("time_to_first_token", {})[getattr(runnable, "name", type(runnable).__name__)] = message_stream.time_to_first_token
+    return response_message, consumer_output
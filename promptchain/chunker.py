@@ -0,0 +1,227 @@
+import re
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from promptchain.config import EmbeddingConfig
+from promptchain.tokens import CJK_CHARS, count_tokens
+
+# 按照这个顺序寻找切分点，尽量在段落、句子、单词的边界处切分
+SOFT_BOUNDARIES = ("\n\n", "\n", "。", ". ", "！", "？", "! ", "? ", " ")
+# 汉字每两个切分一次(count_tokens 中恰好是 3 个 token)，其他文字按空白切分且最长 32 个字符，
+# 没有空白的文本也能在 chunk 内切开
+TOKEN_PATTERN = re.compile(rf"[{CJK_CHARS}]{{1,2}}\s*|[^\s{CJK_CHARS}]{{1,32}}\s*|\s+")
+# token 模式下等待下一个 block 补全的末尾片段的最大长度(字符)，超过后直接切分，缓冲区不会无限增长
+MAX_PENDING_CHARS = 1 << 16
+
+
+def regex_tokenize(text: str) -> List[str]:
+    """
+    Splits text into pieces that keep their trailing whitespace, so "".join(pieces) == text:
+    words of at most 32 characters and runs of at most two CJK characters.
+    """
+    return TOKEN_PATTERN.findall(text)
+
+
+@dataclass
+class Chunk:
+    text: str
+    index: int
+    # 起始位置：char 模式下是原文中的字符位置，token 模式下是第一个 piece 在 tokenizer 输出中的序号
+    start: int
+    source: Optional[str] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+def iter_file(path: str, block_size: int = 1 << 20, encoding: str = "utf-8") -> Iterator[str]:
+    """Reads a text file lazily in blocks of `block_size` characters."""
+    with open(path, "r", encoding=encoding) as file:
+        while True:
+            block = file.read(block_size)
+            if not block:
+                return
+            yield block
+
+
+def batched(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class TextChunker:
+    """
+    Generator based chunker that never holds more than one chunk (plus one input block) in memory.
+
+    Args:
+        chunk_size: Maximum chunk length, in characters or tokens depending on `unit`.
+        overlap: How much of the end of a chunk is repeated at the start of the next one.
+        unit: "char" to count characters, "token" to count tokens as tokens.count_tokens does,
+            the same count used for the context window.
+        tokenizer: In "token" mode, splits text into the pieces chunks are cut between, their
+            concatenation must be the original text. Defaults to regex_tokenize.
+        soft_boundary: In "char" mode, fraction of the chunk at its end searched for a
+            paragraph/sentence/word boundary to cut at instead of cutting mid-word.
+    """
+
+    def __init__(self,
+            chunk_size: int = 300,
+            overlap: int = 0,
+            unit: str = "char",
+            tokenizer: Optional[Callable[[str], List[str]]] = None,
+            soft_boundary: float = 0.2) -> None:
+        if overlap >= chunk_size:
+            raise ValueError(f"overlap ({overlap}) must be smaller than chunk_size ({chunk_size}).")
+        if unit not in ("char", "token"):
+            raise ValueError(f"Unknown unit '{unit}', expected 'char' or 'token'.")
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.unit = unit
+        self.tokenizer = tokenizer if tokenizer else regex_tokenize
+        self.soft_boundary = soft_boundary
+
+    @classmethod
+    def from_config(cls, config: EmbeddingConfig, **kwargs) -> "TextChunker":
+        return cls(chunk_size=config.embedding_chuck_size, **kwargs)
+
+    def chunk(self, text: Union[str, Iterable[str]], source: Optional[str] = None) -> Iterator[Chunk]:
+        """Chunks a string or an iterable of text blocks (e.g. iter_file) lazily."""
+        blocks = [text] if isinstance(text, str) else text
+        pieces = self._chunk_chars(blocks) if self.unit == "char" else self._chunk_tokens(blocks)
+        for index, (start, piece) in enumerate(pieces):
+            yield Chunk(text=piece, index=index, start=start, source=source)
+
+    def chunk_file(self, path: str, block_size: int = 1 << 20, encoding: str = "utf-8") -> Iterator[Chunk]:
+        return self.chunk(iter_file(path, block_size, encoding), source=path)
+
+    def chunk_files(self, paths: Iterable[str], **kwargs) -> Iterator[Chunk]:
+        for path in paths:
+            yield from self.chunk_file(path, **kwargs)
+
+    def _cut_position(self, buffer: str, pos: int) -> int:
+        # 在 chunk 末尾 soft_boundary 范围内寻找最合适的切分点，返回 chunk 的长度
+        window_start = max(self.overlap + 1, int(self.chunk_size * (1 - self.soft_boundary)))
+        for boundary in SOFT_BOUNDARIES:
+            position = buffer.rfind(boundary, pos + window_start, pos + self.chunk_size)
+            if position != -1:
+                return position + len(boundary) - pos
+        return self.chunk_size
+
+    def _chunk_chars(self, blocks: Iterable[str]):
+        # buffer 只保存尚未输出的文本，pos 指向下一个 chunk 的起点，避免反复复制整个 block
+        buffer = ""
+        pos = 0
+        base = 0
+        emitted = False
+        for block in blocks:
+            buffer = buffer[pos:] + block
+            base += pos
+            pos = 0
+            while len(buffer) - pos >= self.chunk_size:
+                cut = self._cut_position(buffer, pos)
+                yield base + pos, buffer[pos:pos + cut]
+                emitted = True
+                pos += cut - self.overlap
+        rest = buffer[pos:]
+        if rest.strip() and (not emitted or len(rest) > self.overlap):
+            yield base + pos, rest
+
+    def _split(self, piece: str, weight: int) -> Iterator[Tuple[str, int]]:
+        # 超过 chunk_size 的 piece(例如自定义 tokenizer 的长单词)先按 regex_tokenize，再按字符对半切分，
+        # 只有单个字符本身超过 chunk_size 时才会输出更大的 chunk
+        if weight <= self.chunk_size or len(piece) == 1:
+            yield piece, weight
+            return
+        parts = regex_tokenize(piece)
+        if len(parts) == 1:
+            middle = len(piece) // 2
+            parts = [piece[:middle], piece[middle:]]
+        for part in parts:
+            yield from self._split(part, count_tokens(part))
+
+    def _take(self, weights: List[int], pos: int) -> int:
+        # 从 pos 开始不超过 chunk_size 的最长片段，至少包含一个 piece，返回结束位置
+        end = pos
+        size = 0
+        while end < len(weights) and (end == pos or size + weights[end] <= self.chunk_size):
+            size += weights[end]
+            end += 1
+        return end
+
+    def _overlap_start(self, weights: List[int], pos: int, end: int) -> int:
+        # 下一个 chunk 的起点：向前重复不超过 overlap 个 token，并且至少前进一个 piece
+        start = end
+        size = 0
+        while start > pos + 1 and size + weights[start - 1] <= self.overlap:
+            size += weights[start - 1]
+            start -= 1
+        return start
+
+    def _chunk_tokens(self, blocks: Iterable[str]):
+        # pieces 只保存尚未输出的部分，weights 是每个 piece 的 count_tokens，total 为 pos 之后的总数
+        pieces: List[str] = []
+        weights: List[int] = []
+        pos = 0
+        base = 0
+        total = 0
+        pending = ""
+        emitted_to = 0
+        for block in blocks:
+            # block 的最后一个 piece 可能被截断，留到下一个 block 一起切分
+            block_pieces = self.tokenizer(pending + block)
+            pending = block_pieces.pop() if block_pieces else ""
+            if len(pending) > MAX_PENDING_CHARS:
+                block_pieces.append(pending)
+                pending = ""
+            split = [part for piece in block_pieces for part in self._split(piece, count_tokens(piece))]
+            block_pieces = [piece for piece, _ in split]
+            block_weights = [weight for _, weight in split]
+            pieces = pieces[pos:] + block_pieces
+            weights = weights[pos:] + block_weights
+            base += pos
+            pos = 0
+            total += sum(block_weights)
+            # 缓冲的 token 达到一个 chunk 就先输出，再读取下一个 block
+            while total >= self.chunk_size:
+                end = self._take(weights, pos)
+                yield base + pos, "".join(pieces[pos:end])
+                emitted_to = base + end
+                start = self._overlap_start(weights, pos, end)
+                total -= sum(weights[pos:start])
+                pos = start
+        if pending:
+            for piece, weight in self._split(pending, count_tokens(pending)):
+                pieces.append(piece)
+                weights.append(weight)
+        while pos < len(pieces) and (emitted_to == 0 or emitted_to < base + len(pieces)):
+            end = self._take(weights, pos)
+            yield base + pos, "".join(pieces[pos:end])
+            emitted_to = base + end
+            pos = self._overlap_start(weights, pos, end)
+
+
+async def ingest(
+        chunks: Iterable[Chunk],
+        embed: Callable[[List[str]], Awaitable[Any]],
+        storage: Any,
+        batch_size: int = 64) -> int:
+    """
+    Streams chunks into an archival storage, embedding `batch_size` chunks at a time.
+
+    `embed` is a batch embedding function such as build_batch_embedding_model and `storage`
+    anything with an ArchivalStorage compatible add(texts, embeddings, metadatas).
+    Returns the number of chunks stored.
+    """
+    total = 0
+    for batch in batched(chunks, batch_size):
+        texts = [chunk.text for chunk in batch]
+        embeddings = await embed(texts)
+        storage.add(texts, embeddings, [
+            {"source": chunk.source, "index": chunk.index, "start": chunk.start, **chunk.metadata}
+            for chunk in batch
+        ])
+        total += len(batch)
+    return total
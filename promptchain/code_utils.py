@@ -14,6 +14,8 @@ from typing import List,Tuple,Union
 #   The [ \t]* matches the potential spaces before closing ``` (the spec allows indentation).
 CODE_BLOCK_PATTERN = r"```[ \t]*(\w+)?[ \t]*\r?\n(.*?)\r?\n[ \t]*```"
 UNKNOWN = "unknown"
+# ExtractCodeProcessor 发出的 tool call 的函数名，arguments 为 {"language": ..., "code": ...}
+CODE_TOOL_NAME = "run_code"
 
 def content_str(content)->str:
     if content is None:
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Optional,Union
 from dataclasses import dataclass
 
 
@@ -6,6 +6,8 @@ from dataclasses import dataclass
 class BaseModelConfig:
     model_name:str
     model_endpoint:Optional[str] = None 
+    # ollama 的 keep_alive，例如 "10m" 或者秒数，-1 表示常驻内存
+    keep_alive:Optional[Union[float,str]] = None
 
 @dataclass
 class LLMConfig(BaseModelConfig):
@@ -20,5 +22,20 @@ class EmbeddingConfig(BaseModelConfig):
 
 @dataclass
 class PromptChainConfig:
-    archival_storage_type = "json"
-    archival_storage_path = "db"
\ No newline at end of file
+    # archival memory 元数据的存储格式，向量保存在 memory-mapped 的 float32 文件中
+    archival_storage_type:str = "json"
+    archival_storage_path:str = "db"
+    # 对话历史的 append-only 日志，所有 session 共用一个目录
+    conversation_store_path:str = "db/conversations"
+
+@dataclass
+class HTTPClientConfig:
+    # 连接池配置，同一个 base_url 的模型实例共享一个连接池
+    max_connections:int = 100
+    max_keepalive_connections:int = 20
+    keepalive_expiry:float = 30.0
+    # 每次请求的超时时间(秒)
+    timeout:float = 60.0
+    connect_timeout:float = 10.0
+    # 安装了 h2 才会真正启用 HTTP/2
+    http2:bool = True
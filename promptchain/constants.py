@@ -1,12 +1,64 @@
-import yaml
+import os
+from typing import Any, Dict, Optional
 
 __CTX_VARS_NAME__ = "context"
 
-# 获取 deepseek API
-def get_config():
-    with open("D:/config.yaml","r") as file:
-        config = yaml.safe_load(file)
-    return config
+DEEPSEEK_BASE_URL = 'https://api.deepseek.com'
 
-DEEPSEEK_API_KEY = get_config()['DEEPSEEK_API_KEY']
-DEEPSEEK_BASE_URL = 'https://api.deepseek.com'
\ No newline at end of file
+# 配置文件的路径可以通过环境变量指定，默认沿用原来的位置
+CONFIG_PATH_ENV = "PROMPTCHAIN_CONFIG"
+DEFAULT_CONFIG_PATH = "D:/config.yaml"
+
+# configure() 设置的配置或路径，第一次 get_config() 时才读取文件
+_config: Optional[Dict[str, Any]] = None
+_config_override: Optional[Dict[str, Any]] = None
+_config_path: Optional[str] = None
+
+
+def configure(config: Optional[Dict[str, Any]] = None, path: Optional[str] = None) -> None:
+    """
+    Overrides where the settings come from, call it before the first model is used.
+
+    Args:
+        config: Settings to use directly, e.g. {"DEEPSEEK_API_KEY": "sk-..."}; no file is read.
+        path: A YAML file to read instead of $PROMPTCHAIN_CONFIG or D:/config.yaml.
+    """
+    global _config, _config_override, _config_path
+    _config = None
+    _config_override = dict(config) if config is not None else None
+    _config_path = path
+
+
+def get_config() -> Dict[str, Any]:
+    """
+    The settings, loaded on first use.
+
+    Precedence: configure(config=...), then environment variables (DEEPSEEK_API_KEY), then
+    the YAML file from configure(path=...), $PROMPTCHAIN_CONFIG or D:/config.yaml. A missing
+    default file is not an error, only a missing explicitly given one is.
+    """
+    global _config
+    if _config_override is not None:
+        return _config_override
+    if _config is None:
+        config = {}
+        path = _config_path or os.environ.get(CONFIG_PATH_ENV)
+        if path or os.path.exists(DEFAULT_CONFIG_PATH):
+            import yaml
+            with open(path or DEFAULT_CONFIG_PATH, "r") as file:
+                config = yaml.safe_load(file) or {}
+        if os.environ.get("DEEPSEEK_API_KEY"):
+            config["DEEPSEEK_API_KEY"] = os.environ["DEEPSEEK_API_KEY"]
+        _config = config
+    return _config
+
+
+def get_deepseek_api_key() -> Optional[str]:
+    return get_config().get("DEEPSEEK_API_KEY")
+
+
+def __getattr__(name: str) -> Any:
+    # 兼容 from promptchain.constants import DEEPSEEK_API_KEY，读取推迟到访问时
+    if name == "DEEPSEEK_API_KEY":
+        return get_deepseek_api_key()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from promptchain.config import PromptChainConfig
+from promptchain.message import Message, Messages, ToolCallMessage, MessageRecord
+
+LOG_NAME = "conversations.log"
+INDEX_NAME = "conversations.idx"
+
+# 每条记录前的 header：payload 长度和 payload 的 crc32
+RECORD_HEADER = struct.Struct("<II")
+# .idx 中每条消息一个定长条目
+INDEX_DTYPE = np.dtype([("session", "<u8"), ("offset", "<u8"), ("length", "<u8")])
+
+
+def session_hash(session: str) -> int:
+    """64 bit hash of a session name, stable across processes."""
+    return int.from_bytes(hashlib.blake2b(session.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def encode_message(session: str, message: Message) -> bytes:
+    record = {"s": session, "r": message.role, "c": message.content}
+    tool_call_id = getattr(message, "tool_call_id", None)
+    if tool_call_id is not None:
+        record["i"] = tool_call_id
+    if isinstance(message, ToolCallMessage):
+        tool_calls = message.tool_call if isinstance(message.tool_call, list) else [message.tool_call]
+        record["k"] = [tool_call.model_dump() for tool_call in tool_calls]
+        record["l"] = isinstance(message.tool_call, list)
+    payload = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_message(record: Dict) -> Message:
+    # 写入前已经校验过，读取时不再做 pydantic 校验
+    if "k" in record:
+        from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall
+        tool_calls = [ChatCompletionMessageToolCall.model_validate(tool_call) for tool_call in record["k"]]
+        return ToolCallMessage.trusted(content=record["c"], tool_call=tool_calls if record["l"] else tool_calls[0])
+    return Message.from_record(MessageRecord(record["r"], record["c"], record.get("i")))
+
+
+class ConversationStore:
+    """
+    Durable, append-only store for chat histories of many sessions.
+
+    All sessions share two files in `path`:
+        conversations.log  records of <length, crc32> header + JSON payload, in append order
+        conversations.idx  one fixed size (session hash, offset, length) entry per record
+
+    Appends write the log record first and the index entry last, so a crash leaves at most
+    a torn tail that is detected by the CRC and truncated on the next open. Reads memory-map
+    the log and decode only the records that are asked for, loading the tail of a 100k
+    message session does not touch the rest of the file.
+    """
+
+    def __init__(self, path: str, fsync: bool = False) -> None:
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._log_path = os.path.join(path, LOG_NAME)
+        self._index_path = os.path.join(path, INDEX_NAME)
+        for file_path in (self._log_path, self._index_path):
+            if not os.path.exists(file_path):
+                open(file_path, "wb").close()
+        self._repair()
+        self._log = open(self._log_path, "ab")
+        self._reader = open(self._log_path, "rb")
+        self._index_file = open(self._index_path, "ab")
+        self._map: Optional[mmap.mmap] = None
+        self._map_size = 0
+        # session hash -> 该 session 每条记录在 .idx 中的行号，第一次访问时构建
+        self._rows: Dict[int, List[int]] = {}
+        # 本次打开之后追加的 (session hash, offset, length)，不在 memmap 的范围内
+        self._entries: List[tuple] = []
+        self._load_index()
+
+    @classmethod
+    def from_config(cls, config: PromptChainConfig, **kwargs) -> "ConversationStore":
+        return cls(config.conversation_store_path, **kwargs)
+
+    def _repair(self):
+        """Drops index entries past the end of the log and re-indexes complete records past the last entry."""
+        index_size = os.path.getsize(self._index_path)
+        entries = index_size // INDEX_DTYPE.itemsize
+        index = np.fromfile(self._index_path, dtype=INDEX_DTYPE, count=entries)
+        log_size = os.path.getsize(self._log_path)
+        # 索引指向的记录必须完整地写在 log 中
+        valid = int(np.searchsorted(index["offset"] + index["length"], log_size, side="right"))
+        end = int(index["offset"][valid - 1] + index["length"][valid - 1]) if valid else 0
+
+        recovered = []
+        with open(self._log_path, "rb") as log:
+            log.seek(end)
+            while True:
+                header = log.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                length, crc = RECORD_HEADER.unpack(header)
+                payload = log.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                session = json.loads(payload)["s"]
+                recovered.append((session_hash(session), end, RECORD_HEADER.size + length))
+                end += RECORD_HEADER.size + length
+
+        if valid != entries or index_size % INDEX_DTYPE.itemsize or end != log_size or recovered:
+            with open(self._log_path, "r+b") as log:
+                log.truncate(end)
+            with open(self._index_path, "r+b") as index_file:
+                index_file.truncate(valid * INDEX_DTYPE.itemsize)
+                index_file.seek(0, os.SEEK_END)
+                index_file.write(np.array(recovered, dtype=INDEX_DTYPE).tobytes())
+
+    def _load_index(self):
+        # .idx 很小(每条消息 24 字节)，memmap 之后按 session 过滤只需要一次向量化比较
+        entries = os.path.getsize(self._index_path) // INDEX_DTYPE.itemsize
+        self._index = np.memmap(self._index_path, dtype=INDEX_DTYPE, mode="r", shape=(entries,)) if entries else \
+            np.empty(0, dtype=INDEX_DTYPE)
+        self._entries = []
+
+    def _session_rows(self, session: str) -> List[int]:
+        return self._rows_for(session_hash(session))
+
+    def _rows_for(self, key: int) -> List[int]:
+        rows = self._rows.get(key)
+        if rows is None:
+            rows = self._rows[key] = np.flatnonzero(self._index["session"] == np.uint64(key)).tolist()
+        return rows
+
+    def _entry(self, row: int):
+        if row < len(self._index):
+            entry = self._index[row]
+            return int(entry["offset"]), int(entry["length"])
+        return self._entries[row - len(self._index)][1:]
+
+    def _read(self, offset: int, length: int) -> Dict:
+        if self._map is None or offset + length > self._map_size:
+            self._log.flush()
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._reader.fileno(), 0, access=mmap.ACCESS_READ)
+            self._map_size = len(self._map)
+        return json.loads(self._map[offset + RECORD_HEADER.size:offset + length])
+
+    # --- writes ---
+
+    def append(self, session: str, messages: Union[Message, Messages, Iterable[Message]]) -> int:
+        """Appends messages to a session and returns the new number of messages in it."""
+        if isinstance(messages, Message):
+            messages = [messages]
+        key = session_hash(session)
+        with self._lock:
+            rows = self._session_rows(session)
+            offset = self._log.tell()
+            records = []
+            entries = []
+            for message in messages:
+                record = encode_message(session, message)
+                entries.append((key, offset, len(record)))
+                records.append(record)
+                offset += len(record)
+            if not records:
+                return len(rows)
+            # 先写 log，再写索引，中断时 _repair 会以 log 中完整的记录为准
+            self._log.write(b"".join(records))
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            self._index_file.write(np.array(entries, dtype=INDEX_DTYPE).tobytes())
+            self._index_file.flush()
+            first_row = len(self._index) + len(self._entries)
+            self._entries.extend(entries)
+            rows.extend(range(first_row, first_row + len(entries)))
+            return len(rows)
+
+    def sync(self, session: str, messages: Messages) -> int:
+        """Appends the messages of `messages` that are not stored yet, assuming the stored part is a prefix."""
+        stored = self.count(session)
+        return self.append(session, messages.messages[stored:])
+
+    # --- reads ---
+
+    def count(self, session: str) -> int:
+        with self._lock:
+            return len(self._session_rows(session))
+
+    def sessions(self) -> List[str]:
+        """Names of all sessions, reads the first record of each one."""
+        with self._lock:
+            hashes = np.unique(self._index["session"]).tolist() + [key for key, _, _ in self._entries]
+            return [self._read(*self._entry(self._rows_for(key)[0]))["s"] for key in dict.fromkeys(hashes)]
+
+    def load(self,
+            session: str,
+            last: Optional[int] = None,
+            max_tokens: Optional[int] = None) -> Messages:
+        """
+        Loads a session, newest records are decoded first and loading stops early.
+
+        Args:
+            session: The session name.
+            last: Only load the last `last` messages.
+            max_tokens: Only load the newest messages whose token counts fit in this budget,
+                e.g. the context window of the model the history is sent to.
+        """
+        with self._lock:
+            rows = self._session_rows(session)
+            if last is not None:
+                rows = rows[max(len(rows) - last, 0):]
+            loaded = []
+            tokens = 0
+            for row in reversed(rows):
+                record = self._read(*self._entry(row))
+                if record["s"] != session:
+                    # 64 位哈希碰撞，属于其它 session
+                    continue
+                message = decode_message(record)
+                if max_tokens is not None:
+                    tokens += message.token_count
+                    if tokens > max_tokens:
+                        break
+                loaded.append(message)
+        loaded.reverse()
+        return Messages.model_construct(messages=loaded)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._log.close()
+            self._reader.close()
+            self._index_file.close()
+            if isinstance(self._index, np.memmap):
+                del self._index
+                self._index = np.empty(0, dtype=INDEX_DTYPE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,11 +1,10 @@
 
 from collections import defaultdict
-from typing import List, Callable, Dict, Any, Union
+from typing import List, Callable, Dict, Any, Union, ClassVar
 from pydantic import BaseModel, Field
 from promptchain.message import Message
 
-from rich.console import Console
-console = Console()
+from promptchain.utils import console
 
 # --- Event System ---
 # Default value of the dictionary will be a list of Callables
@@ -41,6 +40,7 @@ class Event(BaseModel):
     to its subscribers. Supports conditional triggering.
     """
     event_type: str
+    span_kind: ClassVar[str] = "event"
     # A condition function that takes message and context, returns True to trigger
     # Default is always True (unconditional trigger)
     condition: Callable[[Message, Dict[str, Any]], bool] = Field(default_factory=lambda: (lambda msg, ctx: True))
@@ -1,20 +1,193 @@
+import asyncio
+import time
+import weakref
 from abc import ABC,abstractmethod
-from typing import Any,Dict
+from dataclasses import astuple,dataclass
+from typing import TYPE_CHECKING,Any,Dict,Tuple,Optional,List,Sequence
 from uuid import uuid4
 
-import ollama
-from openai import AsyncOpenAI,OpenAI
+from promptchain.message import Message,Messages,AIMessage,ToolCallMessage
+from promptchain.stream import MessageStream
+from promptchain.cache import LLMCache,CACHE_BYPASS_KEY,make_cache_key
+from promptchain.constants import DEEPSEEK_BASE_URL,get_deepseek_api_key
+from promptchain.config import HTTPClientConfig,BaseModelConfig,LLMConfig
+from promptchain.tokens import TrimPolicy,trim_messages
+from promptchain.tracing import record_usage,set_attribute
+from promptchain import metrics
+from promptchain.utils import printd
 
-from rich.console import Console
+# httpx、openai、ollama 和 numpy 导入很慢，只在用到对应的后端时才导入
+if TYPE_CHECKING:
+    import httpx
+    import numpy as np
+    import ollama
+    from openai import AsyncOpenAI
+    from promptchain.semantic_cache import SemanticCache
 
+# 每个 (base_url, HTTPClientConfig) 共享一个 httpx 连接池，value 为 (event loop, client)
+_http_clients: Dict[Tuple[str, Tuple], Tuple[Any, "httpx.AsyncClient"]] = {}
+# 每个 (base_url, api_key, HTTPClientConfig) 一个 AsyncOpenAI，底层复用同一个连接池
+_openai_clients: Dict[Tuple[str, str, Tuple], Tuple["httpx.AsyncClient", "AsyncOpenAI"]] = {}
+# 每个 ollama host 复用一个 AsyncClient，key 为 host(None 表示默认 host)
+_ollama_clients: Dict[str|None, Tuple[Any, "ollama.AsyncClient"]] = {}
+# 正在关闭的旧连接池，保留引用直到关闭完成
+_closing: set = set()
 
-from promptchain.message import Messages,AIMessage,ToolCallMessage
-from promptchain.constants import DEEPSEEK_API_KEY,DEEPSEEK_BASE_URL
 
-console = Console()
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _current_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _is_stale(owner_loop, loop) -> bool:
+    # 连接池绑定在创建它的 event loop 上，loop 关闭或者切换后需要重新创建
+    if owner_loop is None:
+        return False
+    return owner_loop.is_closed() or (loop is not None and owner_loop is not loop)
+
+
+async def _close_quietly(close) -> None:
+    try:
+        await close()
+    except RuntimeError:
+        # 所属的 loop 已经关闭，连接无法正常断开，client 仍然标记为关闭，socket 随垃圾回收释放
+        pass
+
+
+def _close_replaced(owner_loop, close) -> None:
+    """Closes a pooled client that is being replaced, on its own loop when that loop is still running."""
+    if owner_loop is not None and owner_loop.is_running() and owner_loop is not _current_loop():
+        asyncio.run_coroutine_threadsafe(_close_quietly(close), owner_loop)
+        return
+    loop = _current_loop()
+    if loop is None:
+        asyncio.run(_close_quietly(close))
+        return
+    task = loop.create_task(_close_quietly(close))
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+async def _count_response(response: "httpx.Response") -> None:
+    # openai 和 ollama 的客户端对 429/5xx 会自动重试，这里按响应计数
+    host = response.request.url.host
+    metrics.HTTP_RESPONSES.labels(host, response.status_code).inc()
+    if response.status_code == 429 or response.status_code >= 500:
+        metrics.HTTP_RETRYABLE.labels(host).inc()
+
+
+def get_http_client(base_url:str, client_config:HTTPClientConfig|None = None) -> "httpx.AsyncClient":
+    """
+    Returns the pooled httpx.AsyncClient shared by every model talking to `base_url` with
+    the same `client_config`; models with different limits or timeouts get separate pools.
+
+    The pool keeps connections alive between requests and uses HTTP/2 when the
+    `h2` package is installed. A pool is bound to the event loop that first used it,
+    so a new pool is built (and the old one closed) when called from a different or closed loop.
+    """
+    config = client_config if client_config else HTTPClientConfig()
+    key = (base_url, astuple(config))
+    loop = _current_loop()
+    entry = _http_clients.get(key)
+    if entry is not None:
+        owner_loop, http_client = entry
+        if not http_client.is_closed:
+            if not _is_stale(owner_loop, loop):
+                if owner_loop is None and loop is not None:
+                    _http_clients[key] = (loop, http_client)
+                return http_client
+            _close_replaced(owner_loop, http_client.aclose)
+
+    import httpx
+    http_client = httpx.AsyncClient(
+        http2=config.http2 and _http2_available(),
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+        event_hooks={"response": [_count_response]},
+    )
+    _http_clients[key] = (loop, http_client)
+    return http_client
+
+
+def get_async_openai_client(
+        base_url:str = DEEPSEEK_BASE_URL,
+        api_key:str|None = None,
+        client_config:HTTPClientConfig|None = None) -> "AsyncOpenAI":
+    """
+    Returns a cached AsyncOpenAI client backed by the shared pool for `base_url` and `client_config`.
+    `api_key` defaults to DEEPSEEK_API_KEY from the configuration (see constants.configure).
+    """
+    from openai import AsyncOpenAI
+    if api_key is None:
+        api_key = get_deepseek_api_key()
+    if not api_key:
+        raise ValueError("No DeepSeek API key: pass api_key, set DEEPSEEK_API_KEY, or point PROMPTCHAIN_CONFIG "
+            "(or constants.configure) at a config file.")
+    http_client = get_http_client(base_url, client_config)
+    key = (base_url, api_key, astuple(client_config if client_config else HTTPClientConfig()))
+    entry = _openai_clients.get(key)
+    if entry is not None and entry[0] is http_client:
+        return entry[1]
+    client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+    _openai_clients[key] = (http_client, client)
+    return client
+
+
+def get_async_ollama_client(host:str|None = None) -> "ollama.AsyncClient":
+    """
+    Returns the ollama.AsyncClient shared by every model talking to `host`.
+
+    `host` defaults to OLLAMA_HOST / http://localhost:11434, same as the ollama module functions.
+    Like get_http_client, the client is rebuilt (and the old one closed) when the event loop changes.
+    """
+    loop = _current_loop()
+    entry = _ollama_clients.get(host)
+    if entry is not None:
+        owner_loop, client = entry
+        if not _is_stale(owner_loop, loop):
+            if owner_loop is None and loop is not None:
+                _ollama_clients[host] = (loop, client)
+            return client
+        _close_replaced(owner_loop, client.close)
+    import ollama
+    client = ollama.AsyncClient(host=host, event_hooks={"response": [_count_response]})
+    _ollama_clients[host] = (loop, client)
+    return client
+
+
+async def aclose_clients():
+    """Closes every pooled connection, call it before the event loop shuts down."""
+    for _, http_client in list(_http_clients.values()):
+        if not http_client.is_closed:
+            await http_client.aclose()
+    for _, client in list(_ollama_clients.values()):
+        # 重复关闭是安全的
+        await client.close()
+    loop = asyncio.get_running_loop()
+    closing = [task for task in _closing if task.get_loop() is loop]
+    if closing:
+        await asyncio.gather(*closing, return_exceptions=True)
+    _http_clients.clear()
+    _openai_clients.clear()
+    _ollama_clients.clear()
 
 def build_model(model):
     def invoke(prompt):
+        import ollama
         response = ollama.chat(
             model=model,
             messages=[{
@@ -28,6 +201,7 @@ def build_model(model):
 
 def build_embedding_model(model_name:str):
     def invoke(prompt_str:str):
+        import ollama
         response = ollama.embeddings(model=model_name, prompt=prompt_str)
         return response["embedding"]
     
@@ -37,6 +211,7 @@ def build_chat_message_model(model_name:str):
     def intial_system(system_content:str):
         def intial_assistent(asistent_content:str):
             def invoke(prompt_str:str):
+                import ollama
                 response =  ollama.chat(
                     model=model_name,
                     messages=[
@@ -59,9 +234,121 @@ def build_chat_message_model(model_name:str):
     return intial_system
 
 def build_chat_model(model_name:str):
+    # invoke 本身就是 async 的，直接复用异步版本
+    return build_async_chat_model(model_name)
+
+# --- 异步版本的工厂函数，使用共享的 AsyncClient，不会阻塞 event loop ---
+
+def _ollama_options(keep_alive) -> Dict[str, Any]:
+    return {"keep_alive": keep_alive} if keep_alive is not None else {}
+
+def build_async_model(model, host:str|None = None, keep_alive:float|str|None = None):
+    async def invoke(prompt):
+        response = await get_async_ollama_client(host).chat(
+            model=model,
+            messages=[{
+                "role":"user",
+                "content":prompt
+            }],
+            **_ollama_options(keep_alive)
+        )
+        return response['message']['content']
+    return invoke
+
+
+def build_async_embedding_model(model_name:str, host:str|None = None, keep_alive:float|str|None = None):
+    async def invoke(prompt_str:str):
+        response = await get_async_ollama_client(host).embeddings(
+            model=model_name, prompt=prompt_str, **_ollama_options(keep_alive))
+        return response["embedding"]
+
+    return invoke
+
+def build_batch_embedding_model(
+        model_name:str,
+        embedding_dim:int|None = None,
+        batch_size:int = 64,
+        max_concurrency:int = 4,
+        host:str|None = None,
+        keep_alive:float|str|None = None):
+    """
+    Builds an async function embedding many strings with Ollama's /api/embed, which accepts a list of inputs.
+
+    Inputs are split into batches of `batch_size`, at most `max_concurrency` requests are in flight
+    across all concurrent calls of the returned function,
+    and the result is a contiguous (len(texts), embedding_dim) float32 matrix in input order.
+    `embedding_dim` is usually EmbeddingConfig.embedding_dim; when None it is taken from the first response.
+    """
+    # 同一个模型的所有调用共享并发限制，key 为 event loop，value 为 Semaphore
+    semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+    async def embed_batch(texts:List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        semaphore = semaphores.get(loop)
+        if semaphore is None:
+            semaphore = semaphores[loop] = asyncio.Semaphore(max_concurrency)
+        async with semaphore:
+            response = await get_async_ollama_client(host).embed(
+                model=model_name, input=texts, **_ollama_options(keep_alive))
+        return response["embeddings"]
+
+    async def invoke(texts:Sequence[str]) -> "np.ndarray":
+        import numpy as np
+        texts = list(texts)
+        batches = [(start, texts[start:start + batch_size]) for start in range(0, len(texts), batch_size)]
+        dim = embedding_dim
+        result = None
+        if dim is None and batches:
+            # 不知道维度时先请求第一批，确定维度后再分配结果矩阵
+            start, batch = batches.pop(0)
+            first = np.asarray(await embed_batch(batch), dtype=np.float32)
+            dim = first.shape[1]
+            result = np.empty((len(texts), dim), dtype=np.float32)
+            result[start:start + len(batch)] = first
+        if result is None:
+            result = np.empty((len(texts), dim if dim else 0), dtype=np.float32)
+
+        async def fill(start:int, batch:List[str]):
+            block = np.asarray(await embed_batch(batch), dtype=np.float32)
+            if block.shape != (len(batch), dim):
+                raise ValueError(f"Expected embeddings of shape {(len(batch), dim)} from '{model_name}', got {block.shape}. Check EmbeddingConfig.embedding_dim.")
+            result[start:start + len(batch)] = block
+
+        await asyncio.gather(*(fill(start, batch) for start, batch in batches))
+        return result
+
+    return invoke
+
+def build_async_chat_message_model(model_name:str, host:str|None = None, keep_alive:float|str|None = None):
+    def intial_system(system_content:str):
+        def intial_assistent(asistent_content:str):
+            async def invoke(prompt_str:str):
+                response = await get_async_ollama_client(host).chat(
+                    model=model_name,
+                    messages=[
+                        {
+                            "role":"system",
+                            "content":system_content
+                        },
+                        {
+                            "role":"assistant",
+                            "content":asistent_content
+                        },
+                        {
+                            "role":"user",
+                            "content":prompt_str
+                        }],
+                    **_ollama_options(keep_alive)
+                )
+                return response['message']['content']
+            return invoke
+        return intial_assistent
+    return intial_system
+
+def build_async_chat_model(model_name:str, host:str|None = None, keep_alive:float|str|None = None):
     def intial_system(system_content:str):
         async def invoke(prompt_str:str):
-            response =  ollama.chat(
+            response = await get_async_ollama_client(host).chat(
                 model=model_name,
                 messages=[
                     {
@@ -71,7 +358,8 @@ def build_chat_model(model_name:str):
                     {
                         "role":"user",
                         "content":prompt_str
-                    }]
+                    }],
+                **_ollama_options(keep_alive)
             )
             return response['message']['content']
         return invoke
@@ -79,12 +367,25 @@ def build_chat_model(model_name:str):
 
 # TODO 更新到 ollama 最新版本，支持 think 开启和关闭
 
+@dataclass
+class CacheTicket:
+    # 精确缓存的 key，以及语义缓存的 namespace 和向量，未命中时用于写回缓存
+    key:Optional[str] = None
+    namespace:Optional[str] = None
+    vector:Any = None
+
 class ChatMessageModel(ABC):
+    span_kind = "model"
+
     def __init__(self,
             name:str,     
             model_name:str,
             client:str|Any,
-            model_config:Dict[str,Any]|None = None
+            model_config:Dict[str,Any]|None = None,
+            cache:LLMCache|None = None,
+            semantic_cache:"SemanticCache|None" = None,
+            context_window:int|None = None,
+            trim_policy:TrimPolicy|None = None
             ) -> None:
         self.name = name
         self.model_id = uuid4()
@@ -92,83 +393,305 @@ class ChatMessageModel(ABC):
         
         self.model_name = model_name
         self.model_config = model_config if model_config else {}
+        # 精确匹配的响应缓存和语义缓存，默认关闭
+        self.cache = cache
+        self.semantic_cache = semantic_cache
+        # 每次请求前按照 trim_policy 裁剪历史，保证不超过 context_window
+        self.context_window = context_window
+        self.trim_policy = trim_policy
     @abstractmethod
     async def invoke(self,messages:Messages, context: Dict[str, Any]):
         pass
 
-class DeepseekChatMessageModel(ChatMessageModel):
-    def __init__(self, name, model_name:str = "deepseek-chat", model_config:Dict[str,Any]|None = None):
-        client = OpenAI(api_key=DEEPSEEK_API_KEY,base_url=DEEPSEEK_BASE_URL)
-        super().__init__(name, model_name,client, model_config)
+    def record_usage(self, prompt_tokens:int|None, completion_tokens:int|None) -> None:
+        """Adds the token usage reported by the provider to the current span and the token counters."""
+        record_usage(prompt_tokens, completion_tokens)
+        if prompt_tokens:
+            metrics.MODEL_TOKENS.labels(self.name, "prompt").inc(prompt_tokens)
+        if completion_tokens:
+            metrics.MODEL_TOKENS.labels(self.name, "completion").inc(completion_tokens)
 
-    async def invoke(self,messages:Messages, context: Dict[str, Any] = None):
+    def observe_latency(self, started:float) -> None:
+        metrics.MODEL_LATENCY.labels(self.name).observe(time.perf_counter() - started)
+
+    def select_messages(self, messages:Messages) -> List[Message]:
+        """
+        Returns the part of the history sent to the model.
 
-        updated_messages  = []
-        for message in messages.messages:
-            if message.role in ['user','assistant','system']:
-                updated_messages.append(message.model_dump())
-            else:
-                updated_messages.append({
-                    "role":message.role,
-                    "content":message.content,
-                    "tool_call_id":message.tool_call_id
-                })
-
-
-        # 更新 model config 的配置
-        console.print(messages)
-        if self.model_config:
-            self.model_config['messages'] = updated_messages
-            self.model_config['model'] = self.model_name
+        The budget is context_window minus the tokens reserved for the reply (max_tokens, or
+        options.num_predict for ollama). Without a context_window only trim_policy is applied, without either
+        the whole history is sent.
+        """
+        if self.context_window is None and self.trim_policy is None:
+            return messages.messages
+        if self.context_window is None:
+            budget = float("inf")
         else:
-            self.model_config = {
-                "model":self.model_name,
-                "messages":updated_messages,
-            }
-
-        console.print(self.model_config)
-        response = self.client.chat.completions.create(**self.model_config)
-        if response.choices[0].message.content:
-            ai_message = AIMessage(content=response.choices[0].message.content)
-            return ai_message
-        elif response.choices[0].message.tool_calls:
+            reserved = self.model_config.get("max_tokens") or self.model_config.get("options", {}).get("num_predict") or 0
+            budget = self.context_window - reserved
+        return trim_messages(messages.messages, budget, self.trim_policy)
+
+    def build_payload(self, messages:Messages, fmt:str, selected:List[Message]|None = None) -> List[Dict[str, Any]]:
+        # 没有裁剪时直接复用 Messages 缓存的 payload，裁剪后只拼接每条消息缓存的 dict
+        if selected is None:
+            selected = self.select_messages(messages)
+        if selected is messages.messages:
+            return messages.payload(fmt)
+        return [message.to_payload(fmt) for message in selected]
+
+    async def cache_lookup(self, messages:Messages, request:Dict[str,Any], context: Dict[str, Any] = None,
+            selected:List[Message]|None = None) -> Tuple[CacheTicket, Optional[AIMessage]]:
+        """
+        Looks the request up in the exact cache first and then in the semantic cache.
+        Returns (ticket, cached_message); pass the ticket to cache_store once the provider answered.
+        `selected` is the result of select_messages used to build the request, computed again when omitted.
+        context[CACHE_BYPASS_KEY] skips both caches for this call.
+        """
+        ticket = CacheTicket()
+        if context and context.get(CACHE_BYPASS_KEY):
+            return ticket, None
+        if self.cache is None and self.semantic_cache is None:
+            return ticket, None
+
+        # 用消息的 digest 计算 key，不必再序列化整个历史
+        if selected is None:
+            selected = self.select_messages(messages)
+        if self.cache is not None:
+            ticket.key = make_cache_key(request, selected)
+            cached = await self.cache.aget(ticket.key)
+            if cached is not None:
+                set_attribute("cache", "exact")
+                metrics.CACHE_LOOKUPS.labels(self.name, "exact").inc()
+                return ticket, AIMessage(**cached)
+
+        last_message = messages.get_last_message()
+        if self.semantic_cache is not None and last_message is not None and last_message.role == "user":
+            # 除最后一条用户消息外的请求内容(system prompt、历史、模型参数)相同才可以复用答案
+            ticket.namespace = make_cache_key(request, selected[:-1])
+            ticket.vector, answer = await self.semantic_cache.lookup(ticket.namespace, last_message.content)
+            if answer is not None:
+                set_attribute("cache", "semantic")
+                metrics.CACHE_LOOKUPS.labels(self.name, "semantic").inc()
+                return ticket, AIMessage.trusted(content=answer)
+        metrics.CACHE_LOOKUPS.labels(self.name, "miss").inc()
+        return ticket, None
+
+    async def cache_store(self, ticket:CacheTicket, message) -> None:
+        # 只缓存普通的回复，tool call 的 id 每次都不同，不做缓存
+        if not isinstance(message, AIMessage):
+            return
+        if ticket.key is not None:
+            await self.cache.aset(ticket.key, {"role": message.role, "content": message.content})
+        if ticket.vector is not None:
+            self.semantic_cache.store(ticket.namespace, ticket.vector, message.content)
+
+    def stream(self, messages:Messages, context: Dict[str, Any] = None) -> MessageStream:
+        """
+        Returns a MessageStream over the response deltas, the request is sent on first iteration.
+        Backends without native streaming fall back to invoke and yield the whole content at once.
+        """
+        return MessageStream(self._stream(messages, context))
+
+    async def _stream(self, messages:Messages, context: Dict[str, Any] = None):
+        message = await self.invoke(messages, context)
+        if message is not None:
+            yield message.content
+            yield message
+
+class DeepseekChatMessageModel(ChatMessageModel):
+    def __init__(self,
+            name,
+            model_name:str = "deepseek-chat",
+            model_config:Dict[str,Any]|None = None,
+            base_url:str = DEEPSEEK_BASE_URL,
+            api_key:str|None = None,
+            client_config:HTTPClientConfig|None = None,
+            timeout:float|None = None,
+            cache:LLMCache|None = None,
+            semantic_cache:"SemanticCache|None" = None,
+            context_window:int|None = None,
+            trim_policy:TrimPolicy|None = None):
+        # client 在第一次请求时从共享连接池中获取，不再每个实例单独创建
+        super().__init__(name, model_name, None, model_config, cache, semantic_cache, context_window, trim_policy)
+        self.base_url = base_url
+        # 没有传入时在第一次请求时从配置中读取
+        self.api_key = api_key
+        self.client_config = client_config
+        self.timeout = timeout
+
+    @classmethod
+    def from_config(cls, name:str, config:LLMConfig, model_config:Dict[str,Any]|None = None, **kwargs):
+        if config.model_endpoint:
+            kwargs.setdefault("base_url", config.model_endpoint)
+        return cls(name, config.model_name, model_config, context_window=config.context_window, **kwargs)
+
+    def get_client(self) -> "AsyncOpenAI":
+        return get_async_openai_client(self.base_url, self.api_key, self.client_config)
+
+    def build_request(self, messages:Messages, selected:List[Message]|None = None) -> Dict[str, Any]:
+        # 每次请求构建新的参数，不修改 self.model_config，多个 chain 可以并发使用同一个模型
+        request = dict(self.model_config)
+        request['model'] = self.model_name
+        request['messages'] = self.build_payload(messages, "openai", selected)
+        if self.timeout is not None and 'timeout' not in request:
+            request['timeout'] = self.timeout
+        return request
+
+    async def invoke(self,messages:Messages, context: Dict[str, Any] = None):
+        printd(messages)
+        # 裁剪只做一次，请求和缓存 key 使用同一份结果
+        selected = self.select_messages(messages)
+        request = self.build_request(messages, selected)
+        printd(request)
+        ticket, cached = await self.cache_lookup(messages, request, context, selected)
+        if cached is not None:
+            return cached
+        started = time.perf_counter()
+        response = await self.get_client().chat.completions.create(**request)
+        self.observe_latency(started)
+        if response.usage is not None:
+            self.record_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+        if response.choices[0].message.tool_calls:
+            # 一次回复中可能有多个 tool call，全部保留，只有一个时保持原来的单个对象；同时返回的文本也保留
+            tool_calls = response.choices[0].message.tool_calls
             tool_message = ToolCallMessage(
-                content=response.choices[0].message.content,
-                tool_call=response.choices[0].message.tool_calls[0])
+                content=response.choices[0].message.content or "",
+                tool_call=tool_calls if len(tool_calls) > 1 else tool_calls[0])
             return tool_message
+        elif response.choices[0].message.content:
+            ai_message = AIMessage.trusted(content=response.choices[0].message.content)
+            await self.cache_store(ticket, ai_message)
+            return ai_message
+
+    async def _stream(self, messages:Messages, context: Dict[str, Any] = None):
+        selected = self.select_messages(messages)
+        request = self.build_request(messages, selected)
+        ticket, cached = await self.cache_lookup(messages, request, context, selected)
+        if cached is not None:
+            yield cached.content
+            yield cached
+            return
+        request['stream'] = True
+        # 最后一个 chunk 中带有 token 用量
+        request.setdefault('stream_options', {"include_usage": True})
+        started = time.perf_counter()
+        response = await self.get_client().chat.completions.create(**request)
+
+        # tool call 的 id/name/arguments 会被拆分到多个 chunk 中，按照 index 拼接
+        tool_calls: Dict[int, Dict[str, str]] = {}
+        content_parts = []
+        async for chunk in response:
+            if chunk.usage is not None:
+                self.record_usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                yield delta.content
+            for tool_call in delta.tool_calls or []:
+                acc = tool_calls.setdefault(tool_call.index, {"id": "", "name": "", "arguments": ""})
+                if tool_call.id:
+                    acc["id"] = tool_call.id
+                if tool_call.function:
+                    acc["name"] += tool_call.function.name or ""
+                    acc["arguments"] += tool_call.function.arguments or ""
+        self.observe_latency(started)
+
+        # 文本已经作为 delta 输出，最后的 ToolCallMessage 中同时带有文本和 tool call，和非流式一致
+        if tool_calls:
+            from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
+            calls = [
+                ChatCompletionMessageToolCall(
+                    id=acc["id"],
+                    type="function",
+                    function=Function(name=acc["name"], arguments=acc["arguments"]))
+                for _, acc in sorted(tool_calls.items())
+            ]
+            yield ToolCallMessage(content="".join(content_parts), tool_call=calls if len(calls) > 1 else calls[0])
+        else:
+            ai_message = AIMessage.trusted(content="".join(content_parts))
+            await self.cache_store(ticket, ai_message)
+            yield ai_message
         
 class OllamaChatMessageModel(ChatMessageModel):
     # Ollama model_config 
-    def __init__(self, name, model_name,  model_config = None):
-        super().__init__(name, model_name, "ollama", model_config)
+    def __init__(self, name, model_name,  model_config = None, host:str|None = None, keep_alive:float|str|None = None,
+            cache:LLMCache|None = None, semantic_cache:"SemanticCache|None" = None,
+            context_window:int|None = None, trim_policy:TrimPolicy|None = None):
+        super().__init__(name, model_name, "ollama", model_config, cache, semantic_cache, context_window, trim_policy)
+        self.host = host
+        # 模型在 ollama 中驻留的时间，避免每次请求都重新加载模型
+        self.keep_alive = keep_alive
 
-    async def invoke(self,messages:Messages, context: Dict[str, Any] = None):
+    @classmethod
+    def from_config(cls, name:str, config:BaseModelConfig, model_config:Dict[str,Any]|None = None, **kwargs):
+        if isinstance(config, LLMConfig):
+            kwargs.setdefault("context_window", config.context_window)
+        return cls(name, config.model_name, model_config, host=config.model_endpoint, keep_alive=config.keep_alive, **kwargs)
+
+    def get_client(self) -> "ollama.AsyncClient":
+        return get_async_ollama_client(self.host)
+
+    def build_request(self, messages:Messages, selected:List[Message]|None = None) -> Dict[str, Any]:
         # TODO context 提取到模型相关配置
         # TODO 对于模型配置进行抽象
+        request = dict(self.model_config)
+        request['model'] = self.model_name
+        request['messages'] = self.build_payload(messages, "ollama", selected)
+        if self.keep_alive is not None and 'keep_alive' not in request:
+            request['keep_alive'] = self.keep_alive
+        return request
 
-        # 更新 model config 的配置
-        if self.model_config:
-            self.model_config['messages'] = messages.model_dump()['messages']
-            self.model_config['model'] = self.model_name
-        else:
-            self.model_config = {
-                "model":self.model_name,
-                "messages":messages.model_dump()['messages'],
-
-            }
-        # 在这里打印 self.model_config
-        response = ollama.chat(**self.model_config)
+    async def invoke(self,messages:Messages, context: Dict[str, Any] = None):
+        selected = self.select_messages(messages)
+        request = self.build_request(messages, selected)
+        ticket, ai_message = await self.cache_lookup(messages, request, context, selected)
+        if ai_message is None:
+            started = time.perf_counter()
+            response = await self.get_client().chat(**request)
+            self.observe_latency(started)
+            self.record_usage(response.get('prompt_eval_count'), response.get('eval_count'))
 
-        
-        # 如果 content=response['message']['content'] 为空，而
-        
+            
+            # 如果 content=response['message']['content'] 为空，而
+            
 
-        ai_message = AIMessage(content=response['message']['content'])
+            ai_message = AIMessage.trusted(content=response["message"]["content"])
+            await self.cache_store(ticket, ai_message)
         
         if context is not None:
             context['llm_output'] = ai_message
             
         return ai_message
 
+    async def _stream(self, messages:Messages, context: Dict[str, Any] = None):
+        selected = self.select_messages(messages)
+        request = self.build_request(messages, selected)
+        ticket, cached = await self.cache_lookup(messages, request, context, selected)
+        if cached is not None:
+            if context is not None:
+                context['llm_output'] = cached
+            yield cached.content
+            yield cached
+            return
+        request['stream'] = True
+        parts = []
+        started = time.perf_counter()
+        async for part in await self.get_client().chat(**request):
+            if part.get('done'):
+                self.record_usage(part.get('prompt_eval_count'), part.get('eval_count'))
+            content = part['message']['content']
+            if content:
+                parts.append(content)
+                yield content
+        self.observe_latency(started)
+
+        ai_message = AIMessage.trusted(content="".join(parts))
+        await self.cache_store(ticket, ai_message)
+        if context is not None:
+            context['llm_output'] = ai_message
+        yield ai_message
+
 
 
@@ -1,22 +1,105 @@
-from typing import List, Literal, Union, Dict,Generator,Tuple,Any
-from pydantic import BaseModel, Field,ValidationError
-from rich.console import Console
+from typing import List, Literal, Union, Dict,Generator,Tuple,Any,NamedTuple,Optional,Iterable,Sequence
+from bisect import bisect_left,bisect_right
+import time
+import json
+import hashlib
+from pydantic import BaseModel, Field,ValidationError,PrivateAttr
 import re
-from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
-
-console = Console()
+from promptchain.tokens import count_message_tokens
 
 
 # 
 
+PAYLOAD_FORMATS = ('openai', 'ollama')
+
+# Message.trusted 使用的每个类的字段模板
+_TRUSTED_TEMPLATES: Dict[type, Dict[str, Any]] = {}
+_object_setattr = object.__setattr__
+# 直接调用 BaseModel 的 slot 描述符，比 object.__setattr__ 按名字查找快
+_new_instance = object.__new__
+_set_dict = BaseModel.__dict__['__dict__'].__set__
+_set_fields_set = BaseModel.__dict__['__pydantic_fields_set__'].__set__
+_set_extra = BaseModel.__dict__['__pydantic_extra__'].__set__
+_set_private = BaseModel.__dict__['__pydantic_private__'].__set__
+
+
+def _build_trusted(cls: type, values: Dict[str, Any], fields_set: set) -> 'Message':
+    message = _new_instance(cls)
+    _set_dict(message, values)
+    _set_fields_set(message, fields_set)
+    _set_extra(message, None)
+    _set_private(message, None)
+    return message
+
+
+def _trusted_template(cls: type) -> Dict[str, Any]:
+    template = _TRUSTED_TEMPLATES.get(cls)
+    if template is None:
+        # 按字段顺序排列的默认值，保证 repr 和 model_dump 的字段顺序与正常构造一致
+        template = _TRUSTED_TEMPLATES[cls] = {
+            name: None if field.is_required() else field.default for name, field in cls.model_fields.items()
+        }
+    return template
+
 class Message(BaseModel):
     role: Literal['system', 'assistant', 'user', 'tool']
     content: str
 
+    # 由内容派生的缓存放在 slot 中，不参与比较、哈希和序列化，model_copy 也不会复制
+    # (PrivateAttr 会让每次构造多出一次初始化，开销比校验本身还大)
+    __slots__ = ('_token_count', '_digest', '_payloads')
+
     # Ensure Message instances are hashable for set operations in Messages container
     class Config:
         frozen = True
 
+    @property
+    def token_count(self) -> int:
+        """Number of tokens of this message, counted once and cached on the instance."""
+        try:
+            return self._token_count
+        except AttributeError:
+            _object_setattr(self, '_token_count', count_message_tokens(self))
+            return self._token_count
+
+    @property
+    def digest(self) -> str:
+        """
+        sha256 of the role, content and any extra fields (tool_call_id, tool_call), computed once.
+        Stable across processes, used as the dedup key for set operations, caching and storage.
+        """
+        try:
+            return self._digest
+        except AttributeError:
+            extra = {k: v for k, v in self.__dict__.items() if k not in ('role', 'content')}
+            header = self.role if not extra else self.role + json.dumps(extra, sort_keys=True, ensure_ascii=False, default=str)
+            # content 可能是很大的 tool 输出，分段写入避免再拼接一次
+            digest = hashlib.sha256(header.encode('utf-8'))
+            digest.update(b'\0')
+            digest.update(self.content.encode('utf-8'))
+            _object_setattr(self, '_digest', digest.hexdigest())
+            return self._digest
+
+    def to_payload(self, fmt: str = 'openai') -> Dict[str, Any]:
+        """
+        The message in a provider's wire format ('openai' or 'ollama'), built once per format
+        and cached. The returned dict is shared, callers must not modify it.
+        """
+        try:
+            payloads = self._payloads
+        except AttributeError:
+            payloads = {}
+            _object_setattr(self, '_payloads', payloads)
+        payload = payloads.get(fmt)
+        if payload is None:
+            if fmt not in PAYLOAD_FORMATS:
+                raise ValueError(f"Unknown payload format '{fmt}', expected one of {PAYLOAD_FORMATS}.")
+            payload = payloads[fmt] = self._build_payload(fmt)
+        return payload
+
+    def _build_payload(self, fmt: str) -> Dict[str, Any]:
+        return {'role': self.role, 'content': self.content}
+
     # --- TODO: 接收多种形式来构造的 Message ,{},(),[] ---
     # Using a custom validator for from_message to handle various inputs
     @classmethod
@@ -39,7 +122,7 @@ class Message(BaseModel):
         """
         if isinstance(message_input, str):
             # Default to 'user' role for plain string input
-            return cls(role='user', content=message_input)
+            return cls(**cls._coerce_input(message_input))
         elif isinstance(message_input, Dict):
             try:
                 # Direct parsing if it's a dict with role and content
@@ -54,40 +137,77 @@ class Message(BaseModel):
                         return cls(role=inferred_role, content=str(content_val))
                 raise ValueError(f"Invalid dictionary input for Message: {message_input}. Error: {e}")
         elif isinstance(message_input, (Tuple, List)):
-            if len(message_input) == 2:
-                role_str, content_str = message_input
-                # Basic validation for role string
-                if role_str not in ['system', 'assistant', 'user', 'tool']:
-                    raise ValueError(f"Invalid role '{role_str}' in tuple/list input. Must be 'system', 'assistant', 'user', or 'tool'.")
-                return cls(role=role_str, content=str(content_str))
-            else:
-                raise ValueError(f"Tuple or list input must have exactly two elements (role, content): {message_input}")
+            return cls(**cls._coerce_input(message_input))
         else:
             raise TypeError(f"Unsupported message input type: {type(message_input)}. Expected str, Dict, Tuple, or List.")
 
     # Override the default __init__ to use from_message for flexible construction
     def __init__(self, **data):
-        if 'role' not in data and 'content' not in data and len(data) == 1 and isinstance(list(data.values())[0], (str, Dict, Tuple, List)):
+        # 最常见的关键字参数构造放在最前面，只做一次 pydantic 校验
+        if 'content' in data:
+            if 'role' in data:
+                super().__init__(**data)
+                return
+            try:
+                super().__init__(**data)
+            except ValidationError:
+                # inferred_role = self._infer_role_from_content(data['content'])
+                inferred_role = "user"
+                super().__init__(role=inferred_role, content=data['content'])
+        elif 'role' not in data and len(data) == 1 and isinstance(next(iter(data.values())), (str, Dict, Tuple, List)):
             # This handles cases like Message({'role': 'user', 'content': 'hi'})
             # or Message("hello"), Message(('user', 'hello')) directly as primary arg
-            instance = self.from_message(list(data.values())[0])
-            super().__init__(**instance.dict())
-        elif 'role' in data and 'content' in data:
-            super().__init__(**data)
+            value = next(iter(data.values()))
+            if isinstance(value, Dict):
+                instance = self.from_message(value)
+                super().__init__(**instance.__dict__)
+            else:
+                # str/tuple/list 直接转换为字段，不再额外构造一个中间实例
+                super().__init__(**self._coerce_input(value))
         else:
-            # Fallback for direct dict or other structured inputs if from_message doesn't catch
-            # This allows Pydantic's default validation to kick in for standard dicts
             try:
                 super().__init__(**data)
             except ValidationError:
-                # If direct init fails, try to use from_message logic
-                if 'content' in data:
-                    # inferred_role = self._infer_role_from_content(data['content'])
-                    inferred_role = "user"
-                    super().__init__(role=inferred_role, content=data['content'])
-                else:
-                    raise ValueError(f"Could not construct Message from input: {data}. Missing 'role' or 'content' keys for direct init, and no suitable inference possible.")
-    
+                raise ValueError(f"Could not construct Message from input: {data}. Missing 'role' or 'content' keys for direct init, and no suitable inference possible.")
+
+    @staticmethod
+    def _coerce_input(message_input: Union[str, Tuple, List]) -> Dict[str, str]:
+        if isinstance(message_input, str):
+            return {'role': 'user', 'content': message_input}
+        if len(message_input) != 2:
+            raise ValueError(f"Tuple or list input must have exactly two elements (role, content): {message_input}")
+        role_str, content_str = message_input
+        if role_str not in ['system', 'assistant', 'user', 'tool']:
+            raise ValueError(f"Invalid role '{role_str}' in tuple/list input. Must be 'system', 'assistant', 'user', or 'tool'.")
+        return {'role': role_str, 'content': str(content_str)}
+
+    @classmethod
+    def trusted(cls, **data) -> 'Message':
+        """
+        Builds a message without validation, for data that is already known to be valid
+        (provider responses, stored history). Defaults such as AIMessage.role are still filled in,
+        unknown keys are not filtered out.
+        """
+        values = _trusted_template(cls).copy()
+        values.update(data)
+        return _build_trusted(cls, values, set(data))
+
+    def to_record(self) -> 'MessageRecord':
+        return MessageRecord(self.role, self.content, getattr(self, 'tool_call_id', None))
+
+    @staticmethod
+    def from_record(record: 'MessageRecord') -> 'Message':
+        """Rebuilds the typed message (AIMessage, HumanMessage, ...) of a record without validation."""
+        role, content, tool_call_id = record
+        if tool_call_id is not None:
+            values = _trusted_template(ToolMessage).copy()
+            values['content'] = content
+            values['tool_call_id'] = tool_call_id
+            return _build_trusted(ToolMessage, values, {'content', 'tool_call_id'})
+        message_class = ROLE_MESSAGE_TYPES.get(role, Message)
+        # 只有 role 和 content 两个字段的消息，不需要复制模板
+        return _build_trusted(message_class, {'role': role, 'content': content}, {'role', 'content'})
+
     # def register_role_infer_strategy(self,strategy):
     #     self.strategy = strategy
 
@@ -136,10 +256,26 @@ class ToolMessage(Message):
     content: str
     tool_call_id: str
 
+    def _build_payload(self, fmt: str) -> Dict[str, Any]:
+        if fmt == 'ollama':
+            return {'role': self.role, 'content': self.content}
+        return {'role': self.role, 'content': self.content, 'tool_call_id': self.tool_call_id}
+
 class ToolCallMessage(Message):
     role:str = "tool"
     tool_call:Any
 
+    def _build_payload(self, fmt: str) -> Dict[str, Any]:
+        # 发送给模型时 tool call 是 assistant 消息的一部分
+        tool_calls = self.tool_call if isinstance(self.tool_call, list) else [self.tool_call]
+        if fmt == 'ollama':
+            calls = [{'function': {'name': tc.function.name, 'arguments': json.loads(tc.function.arguments or '{}')}}
+                     for tc in tool_calls]
+        else:
+            calls = [{'id': tc.id, 'type': 'function', 'function': {'name': tc.function.name, 'arguments': tc.function.arguments}}
+                     for tc in tool_calls]
+        return {'role': 'assistant', 'content': self.content, 'tool_calls': calls}
+
     def __repr__(self) -> str:
         """
         Returns a string representation of the object that can be used to recreate it.
@@ -147,11 +283,12 @@ class ToolCallMessage(Message):
         tool_call_reprs = []
         if isinstance(self.tool_call, list):
             for tc in self.tool_call:
-                if isinstance(tc, ChatCompletionMessageToolCall):
+                # openai 的 ChatCompletionMessageToolCall，不为了 isinstance 导入 openai
+                if hasattr(tc, "function"):
                     tool_call_reprs.append(
                         f"ChatCompletionMessageToolCall(id='{tc.id}', "
                         f"function=Function(arguments='{tc.function.arguments}', name='{tc.function.name}'), "
-                        f"type='{tc.type}', index={tc.index})"
+                        f"type='{tc.type}', index={getattr(tc, 'index', None)})"
                     )
                 else:
                     tool_call_reprs.append(repr(tc)) # Fallback for unexpected types
@@ -169,13 +306,13 @@ class ToolCallMessage(Message):
         tool_call_strs = []
         if isinstance(self.tool_call, list):
             for tc in self.tool_call:
-                if isinstance(tc, ChatCompletionMessageToolCall):
+                if hasattr(tc, "function"):
                     tool_call_strs.append(
                         f"  Tool Call ID: {tc.id}\n"
                         f"  Function Name: {tc.function.name}\n"
                         f"  Arguments: {tc.function.arguments}\n"
                         f"  Type: {tc.type}\n"
-                        f"  Index: {tc.index}"
+                        f"  Index: {getattr(tc, 'index', None)}"
                     )
                 else:
                     tool_call_strs.append(str(tc)) # Fallback
@@ -188,9 +325,166 @@ class ToolCallMessage(Message):
             f"{'\\n'.join(tool_call_strs)}"
         )
 
+# 热路径(存储、历史记录)使用的紧凑表示，只是一个 tuple
+class MessageRecord(NamedTuple):
+    role: str
+    content: str
+    tool_call_id: Optional[str] = None
+
+ROLE_MESSAGE_TYPES = {
+    'assistant': AIMessage,
+    'user': HumanMessage,
+    'system': SystemMessage,
+}
+
+# 倒排索引使用的分词，按照单词(包括连续的汉字)切分
+INDEX_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def _contains_sorted(values: List[int], value: int) -> bool:
+    position = bisect_left(values, value)
+    return position < len(values) and values[position] == value
+
+
+class MessagesView(Sequence):
+    """
+    Read-only result of Messages.query. It holds positions into the history instead of
+    copying it; messages added later are not part of the view and popping the history
+    invalidates it.
+    """
+
+    __slots__ = ("_messages", "_indices")
+
+    def __init__(self, messages: List[Message], indices: Sequence[int]) -> None:
+        self._messages = messages
+        self._indices = indices
+
+    @property
+    def indices(self) -> Sequence[int]:
+        """Positions of the matched messages in the original history."""
+        return self._indices
+
+    @property
+    def messages(self) -> List[Message]:
+        return [self._messages[i] for i in self._indices]
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return MessagesView(self._messages, self._indices[item])
+        return self._messages[self._indices[item]]
+
+    def __iter__(self) -> Generator[Message, None, None]:
+        messages = self._messages
+        for i in self._indices:
+            yield messages[i]
+
+    def __repr__(self):
+        return f"MessagesView(count={len(self._indices)})"
+
+    def query(self, role: str = None, content_contains: str = None) -> "MessagesView":
+        """Narrows the view further, a linear scan over the matched messages only."""
+        return MessagesView(self._messages, [
+            i for i in self._indices
+            if (role is None or self._messages[i].role == role)
+            and (content_contains is None or content_contains in self._messages[i].content)
+        ])
+
+    def get_last_message(self) -> Union[Message, None]:
+        return self._messages[self._indices[-1]] if self._indices else None
+
+    def get_first_message(self) -> Union[Message, None]:
+        return self._messages[self._indices[0]] if self._indices else None
+
+    def to_list(self) -> List[Message]:
+        return self.messages
+
+    def to_messages(self) -> "Messages":
+        """Copies the view into an independent Messages container."""
+        return Messages(messages=self.messages)
+
+
 class Messages(BaseModel):
     messages: List[Message] = Field(default_factory=list) # Initialize with an empty list
 
+    # 查询索引，在 add_message/pop_last_message 中增量更新；直接修改 self.messages 时在下次查询前补齐
+    _indexed_list: Optional[List[Message]] = PrivateAttr(default=None)
+    _role_index: Dict[str, List[int]] = PrivateAttr(default_factory=dict)
+    # 可选的倒排索引 token -> 包含该 token 的消息位置，由 build_token_index 开启
+    _token_index: Optional[Dict[str, List[int]]] = PrivateAttr(default=None)
+    # 每条消息加入容器的时间，随位置单调递增，时间范围查询可以转换为位置范围。
+    # 构造时传入的消息记为构造时间；直接 append 到 self.messages 或替换整个列表时，记为下次同步索引的时间
+    _timestamps: List[float] = PrivateAttr(default_factory=list)
+    # 构造时的 (列表, 消息数, 时间)，第一次同步索引时使用，构造时不建索引
+    _created: Optional[Tuple[List[Message], int, float]] = PrivateAttr(default=None)
+    # 每种 provider 格式的请求 payload，只追加新消息，pop 时截断
+    _payloads: Dict[str, List[Dict[str, Any]]] = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, __context: Any) -> None:
+        # 构造时就记录时间，+、| 以及 new_state 得到的新容器不会等到第一次查询才打时间戳
+        self._created = (self.messages, len(self.messages), time.time())
+
+    def __eq__(self, other: Any) -> bool:
+        # 只比较消息本身，不比较索引
+        if not isinstance(other, Messages):
+            return NotImplemented
+        return self.messages == other.messages
+
+    def build_token_index(self) -> None:
+        """Enables the inverted token index used by query(content_contains=...)."""
+        if self._token_index is None:
+            self._token_index = {}
+            for i, message in enumerate(self.messages[:len(self._timestamps)]):
+                self._index_tokens(i, message)
+        self._sync_index()
+
+    def _index_tokens(self, position: int, message: Message) -> None:
+        for token in set(INDEX_TOKEN_PATTERN.findall(message.content)):
+            self._token_index.setdefault(token, []).append(position)
+
+    def _partial_token_postings(self, token: str, open_start: bool, open_end: bool) -> List[int]:
+        """Positions of the messages with a word that can contain `token` at a query edge."""
+        index = self._token_index
+        if not open_start and not open_end:
+            return index.get(token, [])
+        if open_start and open_end:
+            words = [word for word in index if token in word]
+        elif open_start:
+            words = [word for word in index if word.endswith(token)]
+        else:
+            words = [word for word in index if word.startswith(token)]
+        if len(words) == 1:
+            return index[words[0]]
+        return sorted(set().union(*(index[word] for word in words)))
+
+    def _sync_index(self) -> None:
+        messages = self.messages
+        if self._indexed_list is not messages or len(self._timestamps) > len(messages):
+            # self.messages 被替换或者被直接截断，重建索引
+            self._indexed_list = messages
+            self._role_index = {}
+            self._timestamps = []
+            if self._token_index is not None:
+                self._token_index = {}
+            self._payloads = {}
+        if len(self._timestamps) == len(messages):
+            return
+        # 系统时间被回拨时也保持单调
+        now = max(time.time(), self._timestamps[-1]) if self._timestamps else time.time()
+        created_count, created_at = 0, now
+        if self._created is not None:
+            if self._created[0] is messages:
+                _, created_count, created_at = self._created
+            self._created = None
+        for i in range(len(self._timestamps), len(messages)):
+            message = messages[i]
+            self._role_index.setdefault(message.role, []).append(i)
+            self._timestamps.append(created_at if i < created_count else now)
+            if self._token_index is not None:
+                self._index_tokens(i, message)
+
     def _convert_to_message(self, item: Union[Message, Dict]|None) -> Message:
         if isinstance(item, Message):
             return item
@@ -206,6 +500,7 @@ class Messages(BaseModel):
         """Adds a single message to the list. Supports Message objects or dictionaries."""
         message = self._convert_to_message(message_input)
         self.messages.append(message)
+        self._sync_index()
 
     def __add__(self, other: Union[Message, Dict, List[Union[Message, Dict]]]):
         """
@@ -245,52 +540,107 @@ class Messages(BaseModel):
     def __or__(self, other: "Messages") -> "Messages":
         """
         计算两个 messages 集合的并集
-        返回一个新的 messages 包含 self 以及 other 中所有的 message
+        返回一个新的 messages 包含 self 以及 other 中所有的 message，按照出现的先后顺序
         """
         if not isinstance(other, Messages):
             raise TypeError(f"Unsupported operand type for |: 'Messages' and '{type(other).__name__}'")
-        
-        self_set = set(self.messages)
-        other_set = set(other.messages)
-        
-        return Messages(messages=list(self_set.union(other_set)))
+
+        # 按照 digest 去重，保留第一次出现的位置，结果保持对话顺序
+        seen = set()
+        merged = []
+        for message in (*self.messages, *other.messages):
+            if message.digest not in seen:
+                seen.add(message.digest)
+                merged.append(message)
+        return Messages(messages=merged)
 
     def __sub__(self, other: "Messages") -> "Messages":
         """
-        计算两个 message 的差集.
+        计算两个 message 的差集，保持 self 中的顺序.
         """
         if not isinstance(other, Messages):
             raise TypeError(f"Unsupported operand type for -: 'Messages' and '{type(other).__name__}'")
-        
-        self_set = set(self.messages)
-        other_set = set(other.messages)
-        
-        return Messages(messages=list(self_set.difference(other_set)))
+
+        seen = {message.digest for message in other.messages}
+        remaining = []
+        for message in self.messages:
+            if message.digest not in seen:
+                seen.add(message.digest)
+                remaining.append(message)
+        return Messages(messages=remaining)
     
-    def query(self, role: str = None, content_contains: str = None) -> "Messages":
+    def query(self,
+            role: str = None,
+            content_contains: str = None,
+            start: int = None,
+            end: int = None,
+            since: float = None,
+            until: float = None) -> MessagesView:
         """
         Queries messages based on specified criteria.
         
         Args:
             role (str, optional): Filters messages by role (e.g., 'user', 'assistant').
             content_contains (str, optional): Filters messages where content contains this substring.
+            start (int, optional): First position to include, negative values count from the end.
+            end (int, optional): Position to stop before, as in messages[start:end].
+            since (float, optional): Only messages added at or after this time.time() timestamp.
+                Messages passed to the constructor count as added when the container was created.
+            until (float, optional): Only messages added at or before this time.time() timestamp.
             
         Returns:
-            Messages: A new Messages object containing the filtered messages.
+            MessagesView: A view over the matched messages, in history order. Earlier versions
+            returned a new Messages container, call .to_messages() on the view to get one.
         """
-        filtered_messages = []
-        for msg in self.messages:
-            match = True
-            if role is not None and msg.role != role:
-                match = False
-            if content_contains is not None and content_contains not in msg.content:
-                match = False
-            
-            if match:
-                filtered_messages.append(msg)
-        
-        return Messages(messages=filtered_messages)
+        self._sync_index()
+        lo, hi, _ = slice(start, end).indices(len(self.messages))
+        if since is not None:
+            lo = max(lo, bisect_left(self._timestamps, since))
+        if until is not None:
+            hi = min(hi, bisect_right(self._timestamps, until))
+        if lo >= hi:
+            return MessagesView(self.messages, [])
+
+        postings = []
+        if role is not None:
+            postings.append(self._role_index.get(role, []))
+        if content_contains and self._token_index is not None:
+            # 两侧都是边界的 token 一定完整地出现在消息中，直接查索引；首尾的 token 可能只是单词的一部分，
+            # 没有这样的 token 时(例如只有一个单词)按前缀/后缀在词表中查找
+            matches = list(INDEX_TOKEN_PATTERN.finditer(content_contains))
+            interior = [match.group() for match in matches
+                if match.start() > 0 and match.end() < len(content_contains)]
+            if interior:
+                postings.extend(self._token_index.get(token, []) for token in interior)
+            else:
+                postings.extend(self._partial_token_postings(match.group(), match.start() == 0,
+                    match.end() == len(content_contains)) for match in matches)
+
+        if postings:
+            postings.sort(key=len)
+            smallest = postings[0]
+            candidates = smallest[bisect_left(smallest, lo):bisect_left(smallest, hi)]
+            for other in postings[1:]:
+                candidates = [i for i in candidates if _contains_sorted(other, i)]
+        else:
+            candidates = range(lo, hi)
+
+        if content_contains is not None:
+            messages = self.messages
+            candidates = [i for i in candidates if content_contains in messages[i].content]
+        return MessagesView(self.messages, candidates)
     
+    def payload(self, fmt: str = 'openai') -> List[Dict[str, Any]]:
+        """
+        The history in a provider's wire format. The list is kept between calls and only
+        extended with messages added since (pop_last_message truncates it), so building a
+        request costs time proportional to the change, not to the whole history.
+        """
+        self._sync_index()
+        cached = self._payloads.setdefault(fmt, [])
+        cached.extend(message.to_payload(fmt) for message in self.messages[len(cached):])
+        return list(cached)
+
     def get_last_message(self) -> Union[Message, None]:
         """Returns the last message in the collection, or None if empty."""
         return self.messages[-1] if self.messages else None
@@ -306,6 +656,29 @@ class Messages(BaseModel):
         """
         Removes and returns the last message in the collection, or None if empty.
         """
-        if self.messages:
-            return self.messages.pop()
-        return None
+        if not self.messages:
+            return None
+        self._sync_index()
+        message = self.messages.pop()
+        # 最后一条消息一定位于各个索引列表的末尾
+        self._timestamps.pop()
+        self._role_index[message.role].pop()
+        if self._token_index is not None:
+            for token in set(INDEX_TOKEN_PATTERN.findall(message.content)):
+                postings = self._token_index[token]
+                postings.pop()
+                if not postings:
+                    del self._token_index[token]
+        # payload 缓存可能还没有构建到这条消息
+        for cached in self._payloads.values():
+            del cached[len(self.messages):]
+        return message
+
+    def to_records(self) -> List[MessageRecord]:
+        """Returns the history as compact MessageRecord tuples, e.g. for storage."""
+        return [message.to_record() for message in self.messages]
+
+    @classmethod
+    def from_records(cls, records: Iterable[Union[MessageRecord, Tuple]]) -> "Messages":
+        """Rebuilds a history from trusted records without validating every message again."""
+        return cls.model_construct(messages=[Message.from_record(MessageRecord(*record)) for record in records])
@@ -0,0 +1,308 @@
+import math
+import os
+import threading
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# 秒为单位，覆盖本地节点(微秒级)到模型请求(分钟级)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Sharded:
+    """
+    Values are kept in one shard per thread, so updates never take a lock; only the first
+    update from a new thread registers its shard. Readers sum the shards.
+    """
+
+    def __init__(self, size: int) -> None:
+        self._size = size
+        self._shards: List[List[float]] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _shard(self) -> List[float]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = [0.0] * self._size
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _totals(self) -> List[float]:
+        with self._lock:
+            shards = list(self._shards)
+        return [sum(values) for values in zip(*shards)] if shards else [0.0] * self._size
+
+
+class CounterChild(_Sharded):
+    def __init__(self) -> None:
+        super().__init__(1)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._shard()[0] += amount
+
+    @property
+    def value(self) -> float:
+        return self._totals()[0]
+
+
+class GaugeChild:
+    # gauge 的 set 不能按线程分片求和，更新频率低，直接加锁
+    def __init__(self) -> None:
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class HistogramChild(_Sharded):
+    def __init__(self, buckets: Sequence[float]) -> None:
+        # 每个 bucket 的计数(最后一个是 +Inf)，然后是 sum 和 count
+        super().__init__(len(buckets) + 3)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float) -> None:
+        shard = self._shard()
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-2] += value
+        shard[-1] += 1
+
+    def snapshot(self) -> Tuple[List[float], float, float]:
+        """(cumulative bucket counts including +Inf, sum, count)"""
+        totals = self._totals()
+        cumulative = []
+        running = 0.0
+        for count in totals[:-2]:
+            running += count
+            cumulative.append(running)
+        return cumulative, totals[-2], totals[-1]
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile by linear interpolation inside its bucket, like PromQL histogram_quantile."""
+        cumulative, _, count = self.snapshot()
+        if not count:
+            return math.nan
+        rank = q * count
+        index = bisect_left(cumulative, rank)
+        if index >= len(self.buckets):
+            return self.buckets[-1]
+        lower = self.buckets[index - 1] if index > 0 else 0.0
+        below = cumulative[index - 1] if index > 0 else 0.0
+        in_bucket = cumulative[index] - below
+        return lower + (self.buckets[index] - lower) * ((rank - below) / in_bucket if in_bucket else 0.0)
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **kwargs):
+        key = tuple(str(v) for v in values) if values else tuple(str(kwargs[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}.")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def children(self) -> List[Tuple[Dict[str, str], object]]:
+        return [(dict(zip(self.labelnames, key)), child) for key, child in list(self._children.items())]
+
+    # 没有 label 的 metric 可以直接调用 inc/set/observe
+    def __getattr__(self, item):
+        if item.startswith("_") or self.labelnames:
+            raise AttributeError(item)
+        return getattr(self.labels(), item)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return CounterChild()
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return GaugeChild()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = (
+        key + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class MetricsRegistry:
+    """Holds the metrics of a process and renders them in the Prometheus text exposition format."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help: str, labelnames: Sequence[str], **kwargs) -> Metric:
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+        if not isinstance(metric, cls):
+            raise ValueError(f"Metric '{name}' is already registered as a {metric.type}.")
+        return metric
+
+    def counter(self, name: str, help: str = "", labelnames: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str = "", labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str = "", labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for labels, child in metric.children():
+                if isinstance(child, HistogramChild):
+                    cumulative, total, count = child.snapshot()
+                    for bound, value in zip((*child.buckets, math.inf), cumulative):
+                        lines.append(f"{metric.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {_format_value(value)}")
+                    lines.append(f"{metric.name}_sum{_format_labels(labels)} {_format_value(total)}")
+                    lines.append(f"{metric.name}_count{_format_labels(labels)} {_format_value(count)}")
+                else:
+                    lines.append(f"{metric.name}{_format_labels(labels)} {_format_value(child.value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, quantiles: Iterable[float] = (0.5, 0.95, 0.99)) -> Dict[str, List[Dict]]:
+        """p50/p95/p99 (by default) of every histogram, per label set."""
+        quantiles = tuple(quantiles)
+        result = {}
+        for metric in list(self._metrics.values()):
+            if isinstance(metric, Histogram):
+                result[metric.name] = [
+                    {**labels, "count": child.snapshot()[2], **{f"p{round(q * 100):g}": child.quantile(q) for q in quantiles}}
+                    for labels, child in metric.children()
+                ]
+        return result
+
+    def write(self, path: str) -> None:
+        """Dumps the exposition text to `path` atomically, e.g. for the node_exporter textfile collector."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(self.render())
+        os.replace(tmp_path, path)
+
+    def reset(self) -> None:
+        """Drops the recorded values, the metrics stay registered."""
+        for metric in list(self._metrics.values()):
+            with metric._lock:
+                metric._children = {}
+
+
+REGISTRY = MetricsRegistry()
+
+
+def start_http_server(port: int = 9464, addr: str = "0.0.0.0", registry: MetricsRegistry = REGISTRY) -> "ThreadingHTTPServer":
+    """Serves registry.render() on http://addr:port/metrics from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    threading.Thread(target=server.serve_forever, name="promptchain-metrics", daemon=True).start()
+    return server
+
+
+# --- 框架内置的指标 ---
+
+NODE_LATENCY = REGISTRY.histogram(
+    "promptchain_node_duration_seconds", "Wall time of each runnable in a chain.", ("chain", "node", "kind"))
+NODE_ERRORS = REGISTRY.counter(
+    "promptchain_node_errors_total", "Runnables that raised.", ("chain", "node", "kind"))
+CHAIN_LATENCY = REGISTRY.histogram(
+    "promptchain_chain_duration_seconds", "Wall time of a whole chain run.", ("chain",))
+MODEL_LATENCY = REGISTRY.histogram(
+    "promptchain_model_request_duration_seconds", "Provider request latency, cache hits excluded.", ("model",))
+MODEL_TOKENS = REGISTRY.counter(
+    "promptchain_model_tokens_total", "Tokens reported by the provider.", ("model", "type"))
+CACHE_LOOKUPS = REGISTRY.counter(
+    "promptchain_cache_lookups_total", "Response cache lookups by result (exact, semantic, miss).", ("model", "result"))
+TOOL_LATENCY = REGISTRY.histogram(
+    "promptchain_tool_duration_seconds", "Tool function execution time.", ("tool",))
+TOOL_ERRORS = REGISTRY.counter(
+    "promptchain_tool_errors_total", "Tool calls that failed.", ("tool",))
+TOOL_CACHE_LOOKUPS = REGISTRY.counter(
+    "promptchain_tool_cache_lookups_total", "Tool result cache lookups by result (hit, coalesced, miss).", ("tool", "result"))
+HTTP_RESPONSES = REGISTRY.counter(
+    "promptchain_http_responses_total", "Provider HTTP responses by host and status code.", ("host", "status"))
+HTTP_RETRYABLE = REGISTRY.counter(
+    "promptchain_http_retryable_responses_total", "429 and 5xx responses, each one is retried by the client.", ("host",))
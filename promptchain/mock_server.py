@@ -0,0 +1,433 @@
+"""
+A local stand-in for the DeepSeek (OpenAI chat completions) and Ollama APIs, for load tests and
+tests that must not call a real provider.
+
+    python -m promptchain.mock_server --port 8000 --latency lognormal:0.4,0.5 --rate-limit-rate 0.05
+
+Point DeepseekChatMessageModel at base_url=http://127.0.0.1:8000/v1 (any api_key) and
+OllamaChatMessageModel at host=http://127.0.0.1:8000.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from uuid import uuid4
+
+from promptchain.tokens import count_tokens
+
+
+@dataclass
+class Latency:
+    """
+    A latency distribution in seconds.
+
+    Args:
+        kind: fixed, uniform, lognormal or exponential.
+        a: The value (fixed), lower bound (uniform), median (lognormal) or mean (exponential).
+        b: Upper bound (uniform) or sigma (lognormal).
+    """
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.a
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(self.a), self.b) if self.a > 0 else 0.0
+        if self.kind == "exponential":
+            return rng.expovariate(1 / self.a) if self.a > 0 else 0.0
+        raise ValueError(f"Unknown latency distribution '{self.kind}'.")
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        """Parses `kind:a,b`, e.g. `0.2`, `uniform:0.1,0.5` or `lognormal:0.3,0.6`."""
+        kind, _, params = spec.rpartition(":")
+        values = [float(value) for value in params.split(",")]
+        return cls(kind or "fixed", *values)
+
+
+@dataclass
+class MockServerConfig:
+    # 首个 token(非流式时为整个响应)之前的延迟，以及流式输出中每个 chunk 之间的延迟
+    latency: Latency = field(default_factory=Latency)
+    chunk_delay: Latency = field(default_factory=Latency)
+    # 回复的内容，可以是固定字符串或者根据请求的 messages 生成
+    reply: Union[str, Callable[[List[Dict[str, Any]]], str], None] = None
+    # 流式输出时每个 chunk 包含的单词数
+    words_per_chunk: int = 1
+    # 按概率注入 500 和 429 错误
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    # 同时处理的请求超过 max_concurrency 时返回 429，None 表示不限制
+    max_concurrency: Optional[int] = None
+    retry_after: float = 0.05
+    # 请求中带有 tools 并且最后一条是用户消息时回复 tool call 的概率
+    tool_call_rate: float = 1.0
+    # 每次回复中 tool call 的数量，依次使用请求中的 tools
+    tool_calls_per_turn: int = 1
+    # 和 tool call 一起返回的文本，部分模型会在调用工具前先给出说明
+    tool_call_content: str = ""
+    embedding_dim: int = 64
+    seed: Optional[int] = None
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+def default_reply(messages: List[Dict[str, Any]]) -> str:
+    last = messages[-1] if messages else {}
+    content = last.get("content") or ""
+    if last.get("role") == "tool":
+        return f"The tool returned: {content[:200]}"
+    return f"This is a mock reply to: {content[:200]}"
+
+
+def _placeholder(schema: Dict[str, Any]) -> Any:
+    return {"integer": 1, "number": 1.0, "boolean": True, "array": [], "object": {}}.get(schema.get("type"), "mock")
+
+
+def _tool_arguments(tool: Dict[str, Any]) -> Dict[str, Any]:
+    parameters = tool.get("function", {}).get("parameters") or {}
+    properties = parameters.get("properties", {})
+    return {name: _placeholder(properties.get(name, {})) for name in parameters.get("required", properties.keys())}
+
+
+def _embedding(text: str, dim: int) -> List[float]:
+    # 相同文本得到相同的单位向量
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=32).digest()
+    rng = random.Random(digest)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class MockLLMServer:
+    """
+    Serves POST /v1/chat/completions (and /chat/completions), /api/chat, /api/embed and
+    /api/embeddings over plain HTTP/1.1 with keep-alive, streaming included.
+
+    Use it in a running event loop (`async with MockLLMServer(config) as server`) or in a
+    background thread (start_in_thread/stop_thread), which keeps its work off the loop being measured.
+
+    Args:
+        config: Latency, errors and replies, see MockServerConfig.
+        host: Interface to listen on.
+        port: Port to listen on, 0 picks a free one.
+    """
+
+    def __init__(self, config: Optional[MockServerConfig] = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.config = config if config else MockServerConfig()
+        self.host = host
+        self.port = port
+        self.rng = random.Random(self.config.seed)
+        # 按状态码统计的请求数
+        self.stats: Dict[int, int] = {}
+        self.in_flight = 0
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        # keep-alive 的连接，停止时主动关闭，否则 wait_closed 会一直等待客户端断开
+        self._writers = set()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def openai_base_url(self) -> str:
+        return self.url + "/v1"
+
+    # --- lifecycle ---
+
+    async def start(self) -> "MockLLMServer":
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "MockLLMServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    def start_in_thread(self) -> "MockLLMServer":
+        """Runs the server on its own event loop in a daemon thread."""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="promptchain-mock-server", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop_thread(self) -> None:
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    # --- HTTP ---
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                await self._dispatch(method, path.split("?")[0], body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        routes = {
+            "/v1/chat/completions": self._openai_chat,
+            "/chat/completions": self._openai_chat,
+            "/api/chat": self._ollama_chat,
+            "/api/embed": self._ollama_embed,
+            "/api/embeddings": self._ollama_embed,
+        }
+        self.in_flight += 1
+        try:
+            handler = routes.get(path)
+            if method != "POST" or handler is None:
+                raise _HTTPError(404, f"{method} {path} not found")
+            request = json.loads(body or b"{}")
+            self._inject_errors()
+            await handler(path, request, writer)
+        except _HTTPError as e:
+            self._write_json(writer, e.status, {"error": {"message": str(e), "type": "mock_error"}}, e.headers)
+        except (json.JSONDecodeError, AttributeError, KeyError, TypeError) as e:
+            self._write_json(writer, 400, {"error": {"message": str(e), "type": "invalid_request_error"}})
+        finally:
+            self.in_flight -= 1
+        await writer.drain()
+
+    def _inject_errors(self) -> None:
+        config = self.config
+        retry = {"retry-after": f"{config.retry_after:g}", "retry-after-ms": str(int(config.retry_after * 1000))}
+        if config.max_concurrency is not None and self.in_flight > config.max_concurrency:
+            raise _HTTPError(429, "Too many concurrent requests", retry)
+        if config.rate_limit_rate and self.rng.random() < config.rate_limit_rate:
+            raise _HTTPError(429, "Rate limit reached", retry)
+        if config.error_rate and self.rng.random() < config.error_rate:
+            raise _HTTPError(500, "Injected server error")
+
+    def _write_head(self, writer: asyncio.StreamWriter, status: int, headers: Dict[str, str]) -> None:
+        self.stats[status] = self.stats.get(status, 0) + 1
+        lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    def _write_json(self, writer: asyncio.StreamWriter, status: int, payload: Any,
+            headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._write_head(writer, status, {
+            "Content-Type": "application/json", "Content-Length": str(len(body)), **(headers or {})})
+        writer.write(body)
+
+    def _start_stream(self, writer: asyncio.StreamWriter, content_type: str) -> None:
+        self._write_head(writer, 200, {"Content-Type": content_type, "Transfer-Encoding": "chunked"})
+
+    @staticmethod
+    async def _write_chunk(writer: asyncio.StreamWriter, data: str) -> None:
+        encoded = data.encode("utf-8")
+        writer.write(f"{len(encoded):x}\r\n".encode("latin-1") + encoded + b"\r\n")
+        await writer.drain()
+
+    # --- reply generation ---
+
+    def _reply(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]]) -> Tuple[str, List[Dict]]:
+        """Returns (content, called_tools), the tools list is empty for a plain answer."""
+        last_role = messages[-1].get("role") if messages else None
+        if tools and last_role == "user" and self.rng.random() < self.config.tool_call_rate:
+            return self.config.tool_call_content, [tools[i % len(tools)] for i in range(self.config.tool_calls_per_turn)]
+        reply = self.config.reply
+        if callable(reply):
+            return reply(messages), []
+        return (reply if reply is not None else default_reply(messages)), []
+
+    def _chunks(self, content: str) -> List[str]:
+        words = content.split(" ")
+        size = max(self.config.words_per_chunk, 1)
+        return [" ".join(words[i:i + size]) + (" " if i + size < len(words) else "") for i in range(0, len(words), size)]
+
+    @staticmethod
+    def _prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+        return sum(count_tokens(message.get("content") or "") + 4 for message in messages)
+
+    # --- OpenAI ---
+
+    async def _openai_chat(self, path: str, request: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        messages = request.get("messages", [])
+        content, called = self._reply(messages, request.get("tools"))
+        prompt_tokens = self._prompt_tokens(messages)
+        completion_tokens = count_tokens(content) if content else 8
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+        tool_calls = [
+            {"id": f"call_{uuid4().hex[:24]}", "type": "function", "function": {
+                "name": tool["function"]["name"], "arguments": json.dumps(_tool_arguments(tool))}}
+            for tool in called
+        ]
+        base = {"id": f"chatcmpl-{uuid4().hex}", "created": int(time.time()), "model": request.get("model", "mock")}
+
+        await asyncio.sleep(self.config.latency.sample(self.rng))
+        if not request.get("stream"):
+            message = {"role": "assistant", "content": content or None}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            self._write_json(writer, 200, {**base, "object": "chat.completion", "usage": usage, "choices": [{
+                "index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}]})
+            return
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            return "data: " + json.dumps({**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": delta, "finish_reason": finish_reason}]}, ensure_ascii=False) + "\n\n"
+
+        self._start_stream(writer, "text/event-stream")
+        await self._write_chunk(writer, chunk({"role": "assistant", "content": ""}))
+        if content or not tool_calls:
+            for i, part in enumerate(self._chunks(content)):
+                if i:
+                    await asyncio.sleep(self.config.chunk_delay.sample(self.rng))
+                await self._write_chunk(writer, chunk({"content": part}))
+        if tool_calls:
+            # 和真实的 API 一样，先发送 id 和 name，arguments 分片发送
+            for index, tool_call in enumerate(tool_calls):
+                first = {**tool_call, "index": index, "function": {"name": tool_call["function"]["name"], "arguments": ""}}
+                await self._write_chunk(writer, chunk({"tool_calls": [first]}))
+                arguments = tool_call["function"]["arguments"]
+                for i in range(0, len(arguments), 8):
+                    await asyncio.sleep(self.config.chunk_delay.sample(self.rng))
+                    await self._write_chunk(writer, chunk({"tool_calls": [
+                        {"index": index, "function": {"arguments": arguments[i:i + 8]}}]}))
+        await self._write_chunk(writer, chunk({}, "tool_calls" if tool_calls else "stop"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            await self._write_chunk(writer, "data: " + json.dumps(
+                {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}) + "\n\n")
+        await self._write_chunk(writer, "data: [DONE]\n\n")
+        await self._write_chunk(writer, "")
+
+    # --- Ollama ---
+
+    async def _ollama_chat(self, path: str, request: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        messages = request.get("messages", [])
+        content, called = self._reply(messages, request.get("tools"))
+        started = time.perf_counter_ns()
+        base = {"model": request.get("model", "mock"), "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+        message = {"role": "assistant", "content": content}
+        if called:
+            message["tool_calls"] = [{"function": {"name": tool["function"]["name"], "arguments": _tool_arguments(tool)}}
+                for tool in called]
+
+        await asyncio.sleep(self.config.latency.sample(self.rng))
+
+        def done() -> Dict[str, Any]:
+            return {**base, "done": True, "done_reason": "stop", "total_duration": time.perf_counter_ns() - started,
+                "prompt_eval_count": self._prompt_tokens(messages), "eval_count": count_tokens(content)}
+
+        # ollama 默认流式输出
+        if not request.get("stream", True):
+            self._write_json(writer, 200, {**done(), "message": message})
+            return
+        self._start_stream(writer, "application/x-ndjson")
+        if called:
+            await self._write_chunk(writer, json.dumps({**base, "done": False, "message": message}) + "\n")
+        else:
+            for i, part in enumerate(self._chunks(content)):
+                if i:
+                    await asyncio.sleep(self.config.chunk_delay.sample(self.rng))
+                await self._write_chunk(writer, json.dumps(
+                    {**base, "done": False, "message": {"role": "assistant", "content": part}}, ensure_ascii=False) + "\n")
+        await self._write_chunk(writer, json.dumps({**done(), "message": {"role": "assistant", "content": ""}}) + "\n")
+        await self._write_chunk(writer, "")
+
+    async def _ollama_embed(self, path: str, request: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        await asyncio.sleep(self.config.latency.sample(self.rng))
+        dim = self.config.embedding_dim
+        if path == "/api/embeddings":
+            # 旧接口，一次一个 prompt
+            self._write_json(writer, 200, {"embedding": _embedding(request.get("prompt", ""), dim)})
+            return
+        inputs = request.get("input", "")
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        self._write_json(writer, 200, {
+            "model": request.get("model", "mock"),
+            "embeddings": [_embedding(text, dim) for text in inputs],
+            "prompt_eval_count": sum(count_tokens(text) for text in inputs),
+        })
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description="Local OpenAI / Ollama compatible mock server.")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument("--latency", type=Latency.parse, default=Latency(), help="e.g. 0.2, uniform:0.1,0.5, lognormal:0.3,0.6")
+    arg_parser.add_argument("--chunk-delay", type=Latency.parse, default=Latency())
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    arg_parser.add_argument("--max-concurrency", type=int, default=None)
+    arg_parser.add_argument("--seed", type=int, default=None)
+    args = arg_parser.parse_args(argv)
+    config = MockServerConfig(latency=args.latency, chunk_delay=args.chunk_delay, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, max_concurrency=args.max_concurrency, seed=args.seed)
+
+    async def serve():
+        async with MockLLMServer(config, args.host, args.port) as server:
+            print(f"mock server listening on {server.url} (OpenAI base_url {server.openai_base_url})")
+            await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
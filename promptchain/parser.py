@@ -5,10 +5,8 @@ from abc import ABC, abstractmethod
 
 from pydantic import BaseModel, Field, ValidationError
 from promptchain.message import AIMessage
-from rich.console import Console
-from rich.panel import Panel
 
-console = Console()
+from promptchain.utils import console
 
 # 如果实际文件路径不同，请根据您的 PromptChain 版本调整
 from promptchain.message import Messages, Message
@@ -20,6 +18,7 @@ class Parser(ABC):
     """
     一个抽象的解析器类，用于处理消息并可能更新上下文。
     """
+    span_kind = "parser"
     @abstractmethod
     async def invoke(self, messages: Messages, context: Dict[str, Any]) -> None:
         """
@@ -70,4 +69,4 @@ class PydanticParser( Parser, Generic[T]): # 继承 Tool 和 Parser
             context[f"{self.output_key}_raw_content"] = content
         
         # 按照 Parser 抽象方法的约定，不返回任何值 (返回 None)
-        return  AIMessage(content=json_obj)
\ No newline at end of file
+        return
\ No newline at end of file
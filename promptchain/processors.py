@@ -1,17 +1,21 @@
+import json
+import time
 from abc import ABC,abstractmethod
 from typing import Dict,Any,Union,Optional,List
 
-from rich.console import Console
+from rich.live import Live
 from rich.panel import Panel
 from rich.markdown import Markdown
 
 
-from promptchain.message import Message,Messages,ToolMessage
-from promptchain.code_utils import extract_code
+from promptchain.message import Message,Messages,ToolCallMessage
+from promptchain.code_utils import CODE_TOOL_NAME,UNKNOWN,extract_code
+from promptchain.stream import MessageStream
 
-console = Console()
+from promptchain.utils import console
 
 class Processor(ABC):
+    span_kind = "processor"
     name: str = "AbstractProcessor" 
     @abstractmethod
     async def invoke(self, messages: Messages, context: Dict[str, Any]) -> Optional[Union[Message, List[Message]]]:
@@ -20,9 +24,11 @@ class Processor(ABC):
 class PrintMarkdownProcessor(Processor):
     name: str = "PrintMarkdownProcessor"
 
-    def __init__(self,description:str):
+    def __init__(self,description:str, refresh_per_second:float = 8):
         super().__init__()
         self.description = description
+        # 流式输出时每次重新渲染整段 markdown，限制刷新频率
+        self.refresh_per_second = refresh_per_second
 
     async def invoke(self, messages: Messages, context: Dict[str, Any]) -> None: # Returns None
         """
@@ -42,6 +48,24 @@ class PrintMarkdownProcessor(Processor):
 
         return None # This processor's primary effect is a side-effect (printing)
 
+    async def invoke_stream(self, stream: MessageStream, messages: Messages, context: Dict[str, Any]) -> None:
+        """
+        Renders the streamed content progressively, refreshing at most `refresh_per_second` times.
+        """
+        min_interval = 1.0 / self.refresh_per_second
+        last_refresh = 0.0
+        with Live(console=console.get(), auto_refresh=False, vertical_overflow="visible") as live:
+            async for _ in stream:
+                now = time.perf_counter()
+                if now - last_refresh >= min_interval:
+                    live.update(Panel(Markdown(stream.content), title=self.description, expand=True), refresh=True)
+                    last_refresh = now
+            subtitle = None
+            if stream.time_to_first_token is not None:
+                subtitle = f"TTFT {stream.time_to_first_token:.2f}s"
+            live.update(Panel(Markdown(stream.content), title=self.description, subtitle=subtitle, expand=True), refresh=True)
+        return None
+
 class PrintJsonProcessor(Processor):
     name: str = "PrintJsonProcessor"
 
@@ -66,37 +90,39 @@ class PrintJsonProcessor(Processor):
 class ExtractCodeProcessor(Processor):
     name: str = "ExtractCodeProcessor"
 
-    async def invoke(self, messages: Messages, context: Dict[str, Any]) -> List[ToolMessage]:
+    async def invoke(self, messages: Messages, context: Dict[str, Any]) -> List[ToolCallMessage]:
         """
         Extracts code blocks from the content of the last message.
-        Returns a list of ToolMessage objects, each containing an extracted code block.
+        Returns a ToolCallMessage with one CODE_TOOL_NAME call per block, whose arguments hold
+        the code and its language, or an empty list when there is no code block.
         """
-        message = messages.last_message
+        message = messages.get_last_message()
         if not message:
             print(f"[{self.name}] No message to extract code from.")
             return []
 
-        extracted_tools = []
-        # extract_code is expected to return a list of (language, code) tuples
+        blocks = []
+        # extract_code returns a list of (language, code) tuples
         for lang, code_content in extract_code(message.content):
-            # You might want to include 'lang' in content or as a separate field in ToolMessage
-            extracted_tools.append(ToolMessage(
-                role="tool", # Assuming extracted code is meant for tool execution
-                content=code_content,
-                tool_name=lang # Storing language as tool_name for context
-            ))
-        
-        if not extracted_tools:
+            # 没有代码块时 extract_code 返回整段文本，这里不把它当作代码
+            if lang == UNKNOWN and code_content == message.content:
+                continue
+            blocks.append((lang or UNKNOWN, code_content))
+
+        if not blocks:
             print(f"[{self.name}] No code blocks found in the message.")
+            return []
 
-        return extracted_tools
-class ExtractCodeProcessor(Processor):
-    async def invoke(self, messages: Messages,context: Dict[str, Any]) -> Message:
-        message = messages.get_last_message()
-        result = []
-        if isinstance(message,Message):
-            for tool in extract_code(message.content):
-                result.append(ToolMessage(
-                    content=tool[1]
-                ))
-        return result
\ No newline at end of file
+        # 作为 assistant 的 tool_calls 发送给模型，CodeSandbox 的执行结果通过 tool_call_id 对应到代码块，
+        # 否则 OpenAI/DeepSeek 会拒绝没有对应 tool call 的 tool 消息
+        from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
+        tool_calls = [
+            ChatCompletionMessageToolCall(
+                # tool_call_id 在整个对话中唯一
+                id=f"code_{len(messages)}_{i}",
+                type="function",
+                function=Function(name=CODE_TOOL_NAME, arguments=json.dumps({"language": lang, "code": code}, ensure_ascii=False)),
+            )
+            for i, (lang, code) in enumerate(blocks)
+        ]
+        return [ToolCallMessage(content="", tool_call=tool_calls)]
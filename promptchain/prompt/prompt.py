@@ -1,4 +1,4 @@
-from typing import Dict,Optional,List,Any
+from typing import Dict,Optional,List,Any,ClassVar
 import re
 from pydantic import BaseModel, Field
 from promptchain.message import Message,AIMessage,HumanMessage,SystemMessage,Messages
@@ -6,6 +6,7 @@ from promptchain.message import Message,AIMessage,HumanMessage,SystemMessage,Mes
 class MessagePromptTemplate(BaseModel):
     template:str
     input_variables: List[str] = Field(default_factory=list)
+    span_kind: ClassVar[str] = "template"
     @classmethod
     def from_template(cls,template:str):
         variables = re.findall(r"\{(\w+)\}", template)
@@ -0,0 +1,264 @@
+"""
+Runs code blocks extracted from model replies in separate Python processes.
+
+    chain | model | ExtractCodeProcessor() | CodeSandbox() | model
+
+Every run gets a fresh process, so snippets can't see or break each other's state, but the
+processes are started ahead of time: a pool keeps `size` interpreters warm (started, with
+`preload` modules imported, waiting for their code) and replaces each one as it is used.
+The event loop only writes the code to a pipe and reads the output back.
+
+ExtractCodeProcessor sends the blocks to the model as assistant tool calls and CodeSandbox
+answers each call with a tool message, so the history stays valid for the next model request.
+
+CPU time and memory are limited with setrlimit and are not available on Windows; the wall
+time limit works everywhere.
+"""
+import asyncio
+import json
+import math
+import os
+import signal
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from promptchain import metrics
+from promptchain.code_utils import CODE_TOOL_NAME, UNKNOWN
+from promptchain.message import Messages, ToolCallMessage, ToolMessage
+from promptchain.utils import printd
+
+# 工作进程默认只继承这些环境变量，API key、云服务凭证等不会暴露给模型写的代码
+SAFE_ENV_VARS = ("PATH", "LANG", "LC_ALL", "LC_CTYPE", "TZ", "TMPDIR", "TEMP", "TMP",
+    "PYTHONHASHSEED", "PYTHONIOENCODING", "SYSTEMROOT")
+
+
+def minimal_env() -> Dict[str, str]:
+    """The parent's SAFE_ENV_VARS, enough to start Python and find the temp directory."""
+    return {name: os.environ[name] for name in SAFE_ENV_VARS if name in os.environ}
+
+
+# 子进程中运行的代码：导入 preload 模块后等待任务，设置资源限制，执行一次后退出
+_WORKER = r"""
+import json, sys
+for _name in sys.argv[1:]:
+    __import__(_name)
+_job = json.loads(sys.stdin.readline())
+try:
+    import resource
+except ImportError:
+    resource = None
+if resource is not None:
+    for _limit, _value in ((resource.RLIMIT_CPU, _job["cpu_time"]), (resource.RLIMIT_AS, _job["memory"])):
+        if _value:
+            _hard = resource.getrlimit(_limit)[1]
+            _value = _value if _hard == resource.RLIM_INFINITY else min(_value, _hard)
+            resource.setrlimit(_limit, (_value, _hard))
+exec(compile(_job["code"], "<sandbox>", "exec"), {"__name__": "__main__"})
+"""
+
+
+@dataclass
+class SandboxResult:
+    """Outcome of one run. exit_code is negative when the process was killed by a signal."""
+    stdout: str
+    stderr: str
+    exit_code: Optional[int]
+    duration: float
+    timed_out: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0 and not self.timed_out
+
+    def to_content(self, max_output: int = 10000) -> str:
+        """stdout and stderr as ToolMessage content, prefixed with the failure reason if the run failed."""
+        output = self.stdout + self.stderr
+        if len(output) > max_output:
+            output = output[:max_output] + f"\n... ({len(output) - max_output} more characters)"
+        if self.timed_out:
+            return f"Error: execution timed out after {self.duration:.1f} seconds\n{output}"
+        if self.exit_code is not None and self.exit_code < 0:
+            # 例如超过 CPU 时间限制时的 SIGXCPU
+            try:
+                reason = signal.Signals(-self.exit_code).name
+            except ValueError:
+                reason = f"signal {-self.exit_code}"
+            return f"Error: killed by {reason}\n{output}"
+        if self.exit_code != 0:
+            return f"Error: exit code {self.exit_code}\n{output}"
+        return output
+
+
+class SandboxPool:
+    """
+    A pool of warm Python worker processes, each runs one piece of code and is then replaced.
+
+    Args:
+        size: Number of warm workers and of runs executed at the same time.
+        preload: Modules imported by the workers before they receive code, e.g. ["numpy"].
+        python: The interpreter, defaults to the current one.
+        cwd: Working directory of the workers.
+        env: Extra environment variables of the workers.
+        inherit_env: Pass the whole environment of this process to the workers. By default they
+            only get SAFE_ENV_VARS, so provider API keys and other secrets stay out of reach
+            of the code they run.
+    """
+
+    def __init__(self, size: int = 4, preload: Sequence[str] = (), python: Optional[str] = None,
+            cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None, inherit_env: bool = False):
+        self.size = size
+        self.preload = list(preload)
+        self.python = python or sys.executable
+        self.cwd = cwd
+        self.env = {**(dict(os.environ) if inherit_env else minimal_env()), **(env or {})}
+        self._warm: List[asyncio.subprocess.Process] = []
+        self._spawning: set = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _spawn(self) -> asyncio.subprocess.Process:
+        return await asyncio.create_subprocess_exec(
+            self.python, "-c", _WORKER, *self.preload, cwd=self.cwd, env=self.env,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+
+    def _replenish(self) -> None:
+        # 后台补充一个预热的进程，不阻塞当前的执行
+        task = asyncio.get_running_loop().create_task(self._spawn())
+        self._spawning.add(task)
+        task.add_done_callback(self._spawned)
+
+    def _spawned(self, task: "asyncio.Task") -> None:
+        self._spawning.discard(task)
+        if not task.cancelled() and task.exception() is None:
+            self._warm.append(task.result())
+
+    async def start(self) -> None:
+        """Starts the warm workers, called by run() on first use."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        if self._loop is not None:
+            # 换了事件循环(例如多次 asyncio.run)，旧循环上的进程不能再用
+            self._kill_warm()
+        self._loop = loop
+        self._semaphore = asyncio.Semaphore(self.size)
+        self._warm.extend(await asyncio.gather(*(self._spawn() for _ in range(self.size))))
+
+    async def run(self, code: str, timeout: Optional[float] = 10.0, cpu_time: Optional[int] = None,
+            memory: Optional[int] = None) -> SandboxResult:
+        """
+        Runs Python code in a warm worker.
+
+        Args:
+            code: The source to execute as __main__.
+            timeout: Wall time limit in seconds, the worker is killed when it is exceeded.
+            cpu_time: CPU time limit in whole seconds.
+            memory: Address space limit in bytes.
+
+        Returns:
+            SandboxResult: Captured stdout/stderr and the exit code.
+        """
+        await self.start()
+        async with self._semaphore:
+            process = self._warm.pop() if self._warm else await self._spawn()
+            self._replenish()
+            job = {"code": code, "cpu_time": math.ceil(cpu_time) if cpu_time else None, "memory": memory}
+            job = json.dumps(job).encode("utf-8") + b"\n"
+            started = time.perf_counter()
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(job), timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                return SandboxResult("", "", process.returncode, time.perf_counter() - started, timed_out=True)
+            except BaseException:
+                # 调用方被取消时不留下孤儿进程
+                process.kill()
+                raise
+            return SandboxResult(stdout.decode("utf-8", "replace"), stderr.decode("utf-8", "replace"),
+                process.returncode, time.perf_counter() - started)
+
+    def _kill_warm(self) -> None:
+        for task in self._spawning:
+            task.cancel()
+        for process in self._warm:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+        self._warm.clear()
+        self._spawning.clear()
+
+    async def close(self) -> None:
+        """Stops the warm workers."""
+        # 等待后台补充的进程启动完，再一起结束
+        if self._spawning:
+            await asyncio.gather(*self._spawning, return_exceptions=True)
+        warm = list(self._warm)
+        self._kill_warm()
+        for process in warm:
+            await process.wait()
+        self._loop = None
+
+
+class CodeSandbox:
+    """
+    Runnable that executes the code blocks ExtractCodeProcessor put in a ToolCallMessage and answers
+    each call with a ToolMessage holding its output. The blocks run concurrently, each in its own worker.
+
+    Args:
+        pool: The worker pool, a SandboxPool(size=4) is created if not given.
+        timeout: Wall time limit of a block in seconds.
+        cpu_time: CPU time limit of a block in seconds.
+        memory: Memory limit of a block in bytes.
+        languages: Languages of the blocks to run, other blocks get an error message.
+        max_output: Characters of output kept in the ToolMessage.
+    """
+    span_kind = "tool"
+
+    def __init__(self, pool: Optional[SandboxPool] = None, timeout: Optional[float] = 10.0, cpu_time: Optional[int] = 5,
+            memory: Optional[int] = 512 * 1024 * 1024, languages: Sequence[str] = ("python", "py", "python3"),
+            max_output: int = 10000, name: str = "sandbox"):
+        self.pool = pool if pool is not None else SandboxPool()
+        self.timeout = timeout
+        self.cpu_time = cpu_time
+        self.memory = memory
+        self.languages = set(languages)
+        self.max_output = max_output
+        self.name = name
+
+    async def execute(self, tool_call) -> ToolMessage:
+        """Runs the code of one CODE_TOOL_NAME tool call."""
+        arguments = json.loads(tool_call.function.arguments or "{}")
+        language = arguments.get("language", UNKNOWN)
+        if language not in self.languages:
+            metrics.TOOL_ERRORS.labels(self.name).inc()
+            return ToolMessage(content=f"Error: code in language '{language}' is not supported by the sandbox.",
+                tool_call_id=tool_call.id)
+        result = await self.pool.run(arguments.get("code", ""), self.timeout, self.cpu_time, self.memory)
+        metrics.TOOL_LATENCY.labels(self.name).observe(result.duration)
+        if not result.ok:
+            metrics.TOOL_ERRORS.labels(self.name).inc()
+        return ToolMessage(content=result.to_content(self.max_output), tool_call_id=tool_call.id)
+
+    async def invoke(self, messages: Messages, context: Dict[str, Any]) -> List[ToolMessage]:
+        """
+        Runs the code blocks requested by the ToolCallMessage at the end of the history.
+
+        Returns:
+            List[ToolMessage]: One result per code block, in the order of the blocks.
+        """
+        message = messages.get_last_message()
+        blocks = []
+        if isinstance(message, ToolCallMessage):
+            tool_calls = message.tool_call if isinstance(message.tool_call, list) else [message.tool_call]
+            blocks = [tool_call for tool_call in tool_calls if tool_call.function.name == CODE_TOOL_NAME]
+        if not blocks:
+            printd("没有需要执行的代码")
+            return []
+        return list(await asyncio.gather(*(self.execute(block) for block in blocks)))
+
+    async def close(self) -> None:
+        await self.pool.close()
@@ -0,0 +1,129 @@
+import inspect
+import time
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from promptchain.utils import cosine_similarity
+
+EmbedFunction = Callable[[str], Union[List[float], Awaitable[List[float]]]]
+
+
+class SemanticCache:
+    """
+    Opt-in cache that answers paraphrased prompts with a previously generated reply.
+
+    The last user turn is embedded with `embed` (e.g. build_async_embedding_model or
+    build_embedding_model) and compared against every cached prompt of the same
+    namespace in one matrix product. The best match is returned when its cosine
+    similarity is at least `threshold`.
+
+    Args:
+        embed: Sync or async function mapping a string to its embedding.
+        threshold: Minimum cosine similarity for a hit, higher is stricter.
+        capacity: Maximum number of cached prompts, the least recently used entry is evicted.
+        history_size: Number of recent lookups kept for `report()`.
+    """
+
+    def __init__(self, embed: EmbedFunction, threshold: float = 0.92, capacity: int = 1024, history_size: int = 1000) -> None:
+        self.embed = embed
+        self.threshold = threshold
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # 最近每次查询的最高相似度，用于评估不同阈值下的命中率
+        self.recent_scores: deque = deque(maxlen=history_size)
+
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None  # (capacity, dim)，已经归一化
+        # namespace 映射为整数，按 namespace 过滤时可以直接做向量化比较
+        self._namespace_ids: Dict[str, int] = {}
+        self._namespace_of = np.full(capacity, -1, dtype=np.int64)
+        self._answers: List[Optional[str]] = [None] * capacity
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._size = 0
+
+    async def embed_text(self, text: str) -> np.ndarray:
+        vector = self.embed(text)
+        if inspect.isawaitable(vector):
+            vector = await vector
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def search(self, namespace: str, vector: np.ndarray) -> Tuple[Optional[str], float]:
+        """Returns (answer, similarity) of the closest entry in `namespace`, answer is None below the threshold."""
+        with self._lock:
+            namespace_id = self._namespace_ids.get(namespace)
+            if self._vectors is None or namespace_id is None:
+                best_index, best_score = -1, -1.0
+            else:
+                scores = cosine_similarity(self._vectors[:self._size], vector, normalized=True)
+                scores = np.where(self._namespace_of[:self._size] == namespace_id, scores, -1.0)
+                best_index = int(np.argmax(scores))
+                best_score = float(scores[best_index])
+
+            self.recent_scores.append(best_score)
+            if best_index >= 0 and best_score >= self.threshold:
+                self.hits += 1
+                self._last_used[best_index] = time.monotonic()
+                return self._answers[best_index], best_score
+            self.misses += 1
+            return None, best_score
+
+    async def lookup(self, namespace: str, text: str) -> Tuple[np.ndarray, Optional[str]]:
+        """Embeds `text` and searches the cache, the vector is returned so a miss can be stored without re-embedding."""
+        vector = await self.embed_text(text)
+        answer, _ = self.search(namespace, vector)
+        return vector, answer
+
+    def store(self, namespace: str, vector: np.ndarray, answer: str) -> None:
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+            if self._size < self.capacity:
+                index = self._size
+                self._size += 1
+            else:
+                index = int(np.argmin(self._last_used))
+                self.evictions += 1
+            self._vectors[index] = vector
+            self._namespace_of[index] = self._namespace_ids.setdefault(namespace, len(self._namespace_ids))
+            self._answers[index] = answer
+            self._last_used[index] = time.monotonic()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vectors = None
+            self._namespace_ids.clear()
+            self._namespace_of[:] = -1
+            self._answers = [None] * self.capacity
+            self._last_used[:] = 0
+            self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def report(self, thresholds: Optional[Iterable[float]] = None) -> Dict[str, Any]:
+        """
+        Hit/miss counters plus the hit rate the recent lookups would have had at other
+        thresholds, to help pick a threshold that trades accuracy against savings.
+        """
+        thresholds = thresholds if thresholds is not None else (0.80, 0.85, 0.90, 0.92, 0.95, 0.98)
+        scores = np.fromiter(self.recent_scores, dtype=np.float64)
+        total = self.hits + self.misses
+        return {
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": self._size,
+            "capacity": self.capacity,
+            "evictions": self.evictions,
+            "hit_rate_at": {
+                t: float((scores >= t).mean()) if scores.size else 0.0 for t in thresholds
+            },
+        }
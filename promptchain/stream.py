@@ -0,0 +1,85 @@
+import time
+from typing import AsyncIterator, Callable, List, Optional, Union
+
+from promptchain.message import Message, AIMessage
+
+
+class MessageStream:
+    """
+    An async iterator over the content deltas of one model response.
+
+    The source yields `str` deltas as they arrive from the provider. It may yield a
+    `Message` as its last item to replace the assembled message (e.g. a ToolCallMessage).
+    The stream can only be consumed once; `collect()` drains whatever is left and
+    returns the final message, so the complete response still ends up in history.
+    """
+
+    def __init__(self,
+            source: AsyncIterator[Union[str, Message]],
+            build_message: Callable[[str], Message] = None) -> None:
+        self._source = source
+        self._build_message = build_message if build_message else (lambda content: AIMessage.trusted(content=content))
+        self._parts: List[str] = []
+        self._message: Optional[Message] = None
+        self._done = False
+        self.started_at: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        if self._done:
+            return
+        if self.started_at is None:
+            self.started_at = time.perf_counter()
+        async for item in self._source:
+            if isinstance(item, Message):
+                self._message = item
+                continue
+            if not item:
+                continue
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self._parts.append(item)
+            yield item
+        self._finish()
+
+    def _finish(self):
+        if self._done:
+            return
+        self._done = True
+        self.finished_at = time.perf_counter()
+        if self._message is None:
+            self._message = self._build_message(self.content)
+
+    async def collect(self) -> Message:
+        """Consumes the remaining deltas and returns the assembled message."""
+        async for _ in self:
+            pass
+        self._finish()
+        return self._message
+
+    @property
+    def content(self) -> str:
+        return "".join(self._parts)
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    @property
+    def message(self) -> Optional[Message]:
+        """The final message, available once the stream is exhausted."""
+        return self._message
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        """Seconds between the request being sent and the first content delta."""
+        if self.started_at is None or self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    def __repr__(self):
+        return f"MessageStream(done={self._done}, chars={sum(len(p) for p in self._parts)})"
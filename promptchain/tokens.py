@@ -0,0 +1,205 @@
+import re
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Callable, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    from promptchain.message import Message
+
+# 每条消息除了内容之外的固定开销(role、分隔符等)，与 OpenAI 的计算方式接近
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# CJK 统一汉字(含扩展 A)和兼容汉字，近似分词和 chunker 都按这个范围识别汉字
+CJK_CHARS = "㐀-鿿豈-﫿"
+
+# 没有安装 tiktoken 时的近似分词，按 BPE 的切分方式往多估：
+# 连续的汉字每个算 1.5 个 token，英文单词每 3 个字母一个 token，最多 3 位数字、
+# 每个标点或其他文字的字符、每段换行或连续空白(代码缩进)各算一个 token
+_APPROX_TOKEN_PATTERN = re.compile(rf"([{CJK_CHARS}]+)|([A-Za-z]+)|\d{{1,3}}|\s*\n\s*|\s{{2,}}|[^\sA-Za-z\d]")
+
+_tokenizer: Optional[Callable[[str], int]] = None
+
+
+def _default_tokenizer() -> Callable[[str], int]:
+    global _tokenizer
+    if _tokenizer is None:
+        try:
+            import tiktoken
+            encoding = tiktoken.get_encoding("cl100k_base")
+            _tokenizer = lambda text: len(encoding.encode(text, disallowed_special=()))
+        except Exception:
+            # 没有安装 tiktoken，或者离线时第一次使用无法下载 cl100k_base
+            _tokenizer = _approximate_tokens
+    return _tokenizer
+
+
+def _approximate_tokens(text: str) -> int:
+    tokens = 0
+    for cjk, word in _APPROX_TOKEN_PATTERN.findall(text):
+        if cjk:
+            tokens += (3 * len(cjk) + 1) // 2
+        elif word:
+            tokens += (len(word) + 2) // 3
+        else:
+            tokens += 1
+    return tokens
+
+
+def set_tokenizer(count: Optional[Callable[[str], int]]) -> None:
+    """Replaces the token counter used for every message, None restores the default."""
+    global _tokenizer
+    _tokenizer = count
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """
+    Counts tokens with tiktoken when installed, otherwise with an approximation that errs on
+    the high side (long words, code and CJK text count more than one token per word or run).
+    """
+    if not text:
+        return 0
+    return _default_tokenizer()(text)
+
+
+def count_message_tokens(message: "Message") -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS + count_tokens(message.content)
+    tool_call = getattr(message, "tool_call", None)
+    if tool_call is not None:
+        tokens += count_tokens(str(tool_call))
+    return tokens
+
+
+def count_messages_tokens(messages: Sequence["Message"]) -> int:
+    # Message.token_count 在每条消息上只计算一次
+    return sum(message.token_count for message in messages)
+
+
+class ContextWindowExceededError(ValueError):
+    pass
+
+
+class TrimPolicy(ABC):
+    """Chooses which messages of a history are sent to the model."""
+
+    @abstractmethod
+    def select(self, messages: Sequence["Message"], budget: int) -> List[int]:
+        """Returns the indices of the messages to keep, in ascending order."""
+        pass
+
+
+class TokenBudget(TrimPolicy):
+    """Keeps the system messages and as many of the newest messages as fit in the budget."""
+
+    def select(self, messages: Sequence["Message"], budget: int) -> List[int]:
+        system = [i for i, message in enumerate(messages) if message.role == "system"]
+        remaining = budget - sum(messages[i].token_count for i in system)
+        kept = []
+        for i in range(len(messages) - 1, -1, -1):
+            if messages[i].role == "system":
+                continue
+            remaining -= messages[i].token_count
+            if remaining < 0:
+                break
+            kept.append(i)
+        return sorted(system + kept)
+
+
+class KeepLastTurns(TrimPolicy):
+    """Keeps the system messages plus the last `turns` user turns and everything after them."""
+
+    def __init__(self, turns: int) -> None:
+        if turns < 1:
+            raise ValueError(f"turns must be at least 1, got {turns}.")
+        self.turns = turns
+
+    def select(self, messages: Sequence["Message"], budget: int) -> List[int]:
+        user_indices = [i for i, message in enumerate(messages) if message.role == "user"]
+        start = user_indices[-self.turns] if len(user_indices) >= self.turns else 0
+        return [i for i, message in enumerate(messages) if message.role == "system" or i >= start]
+
+
+def tool_call_ids(message: "Message") -> List[str]:
+    """The ids of the tool calls an assistant message makes, empty for other messages."""
+    tool_call = getattr(message, "tool_call", None)
+    if tool_call is None:
+        return []
+    calls = tool_call if isinstance(tool_call, list) else [tool_call]
+    return [getattr(call, "id", None) for call in calls]
+
+
+def tool_call_groups(messages: Sequence["Message"]) -> List[List[int]]:
+    """
+    Splits a history into units that must be kept or dropped together: an assistant tool_calls
+    message with all of its tool results, or a single other message. Units are in order of
+    their first message.
+    """
+    groups: List[List[int]] = []
+    owners = {}
+    for i, message in enumerate(messages):
+        ids = tool_call_ids(message)
+        if ids:
+            group = [i]
+            groups.append(group)
+            owners.update((call_id, group) for call_id in ids)
+            continue
+        group = owners.get(getattr(message, "tool_call_id", None))
+        if group is not None:
+            group.append(i)
+        else:
+            groups.append([i])
+    return groups
+
+
+class DropToolMessagesFirst(TrimPolicy):
+    """
+    Drops tool calls oldest first until the history fits. An assistant tool_calls message is
+    dropped together with all of its results, the APIs reject either one without the other.
+    The unit holding the last message is never dropped. If that is not enough the rest is
+    handled by the TokenBudget fallback of trim_messages.
+    """
+
+    def select(self, messages: Sequence["Message"], budget: int) -> List[int]:
+        dropped = set()
+        total = count_messages_tokens(messages)
+        for group in tool_call_groups(messages):
+            if total <= budget:
+                break
+            if messages[group[0]].role != "tool" or group[-1] == len(messages) - 1:
+                continue
+            dropped.update(group)
+            total -= sum(messages[i].token_count for i in group)
+        return [i for i in range(len(messages)) if i not in dropped]
+
+
+def trim_messages(messages: Sequence["Message"], budget: int, policy: Optional[TrimPolicy] = None) -> List["Message"]:
+    """
+    Applies `policy` and then guarantees the result fits in `budget` tokens.
+
+    The policy's selection is trimmed further with TokenBudget when it is still too large. A
+    tool_calls message is only kept together with all of its results, and the selection never
+    starts with a tool result whose call is not in it. Raises ContextWindowExceededError when
+    even the system messages plus the last message do not fit.
+    """
+    policy = policy if policy is not None else TokenBudget()
+    kept = policy.select(messages, budget)
+    if count_messages_tokens([messages[i] for i in kept]) > budget:
+        kept = [kept[i] for i in TokenBudget().select([messages[i] for i in kept], budget)]
+
+    # tool call 和它的结果要么一起保留，要么一起丢弃
+    kept_set = set(kept)
+    for group in tool_call_groups(messages):
+        if tool_call_ids(messages[group[0]]) and not kept_set.issuperset(group):
+            kept_set.difference_update(group)
+    kept = sorted(kept_set)
+    # 被保留的历史不能以 tool 结果开头(它对应的 tool call 不在历史中)
+    first = next((n for n, i in enumerate(kept) if messages[i].role != "system"), None)
+    while (first is not None and first < len(kept) - 1 and messages[kept[first]].role == "tool"
+            and not tool_call_ids(messages[kept[first]])):
+        kept.pop(first)
+
+    selected = [messages[i] for i in kept]
+    if messages and (not kept or kept[-1] != len(messages) - 1):
+        raise ContextWindowExceededError(
+            f"The last message does not fit in the context window budget of {budget} tokens "
+            f"({count_messages_tokens(selected) + messages[-1].token_count} needed)."
+        )
+    return selected
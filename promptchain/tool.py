@@ -1,64 +1,112 @@
-import json
+import asyncio
+import contextvars
+import functools
 import inspect
-from typing import Dict,Any,List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict,Any,List,Optional,Type
+from pydantic import BaseModel,ConfigDict,ValidationError,create_model
+from promptchain.cache import CACHE_BYPASS_KEY,ToolCache
 from promptchain.message import AIMessage,Messages,ToolMessage,ToolCallMessage
-from rich.console import Console
+from promptchain.utils import console,printd
+from promptchain import metrics
+
+def compile_arguments(func) -> Type[BaseModel]:
+    """
+    Builds a pydantic model of a function's parameters, used to validate and coerce tool call arguments.
+
+    Args:
+        func: The function, its annotations and defaults become the model's fields.
+
+    Returns:
+        Type[BaseModel]: A model that rejects unknown arguments.
+    """
+    fields = {}
+    for name, param in inspect.signature(func).parameters.items():
+        if param.kind in (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD):
+            continue
+        annotation = Any if param.annotation is inspect.Parameter.empty else param.annotation
+        default = ... if param.default is inspect.Parameter.empty else param.default
+        fields[name] = (annotation, default)
+    return create_model(f"{func.__name__}_arguments", __config__=ConfigDict(extra="forbid"), **fields)
+
+
+def parameters_schema(arguments_model: Type[BaseModel]) -> Dict[str, Any]:
+    """The JSON schema of a tool's parameters in the format the chat APIs expect."""
+    schema = arguments_model.model_json_schema()
+    schema.pop("title", None)
+    schema.setdefault("required", [])
+    for name, prop in schema["properties"].items():
+        prop.pop("title", None)
+        # 没有类型注解的参数沿用原来的 string
+        if not any(key in prop for key in ("type", "$ref", "anyOf", "allOf", "enum")):
+            prop["type"] = "string"
+        prop.setdefault("description", f"The {name} for the function.")
+    return schema
+
+
+def format_validation_error(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc']) or 'arguments'}: {e['msg']}" for e in error.errors())
+
+
+class RegisteredFunction:
+    """A registered tool function with its compiled argument validator, tool description and optional cache."""
+    __slots__ = ("func", "arguments_model", "spec", "fields", "cache")
+
+    def __init__(self, func, arguments_model: Type[BaseModel], spec: Dict[str, Any], cache: Optional[ToolCache] = None):
+        self.func = func
+        self.arguments_model = arguments_model
+        self.spec = spec
+        self.fields = tuple(arguments_model.model_fields)
+        self.cache = cache
+
+    def validate(self, arguments: Optional[str]) -> BaseModel:
+        """Parses and validates the JSON arguments, raises ValidationError."""
+        return self.arguments_model.model_validate_json(arguments or "{}")
+
+    def kwargs(self, validated: BaseModel) -> Dict[str, Any]:
+        # 不用 model_dump，嵌套的 pydantic 模型保持为实例传给函数
+        return {name: getattr(validated, name) for name in self.fields}
+
 
-console = Console()
 class Tool:
     """
     A class to register functions and automatically generate their tool descriptions.
     """
-    function_mapping = {}  # Stores the registered functions
+    span_kind = "tool"
 
-    def __init__(self):
+    def __init__(self, max_workers: int = 8, timeout: Optional[float] = 30.0):
+        """
+        Args:
+            max_workers (int): Size of the thread pool running sync tool functions.
+            timeout (float, optional): Default time limit of a single tool call in seconds, None for no limit.
+        """
         self.tools = []  # Stores the generated tool descriptions
+        # Stores the registered functions, 每个实例一份，不同实例的同名工具互不影响
+        self.function_mapping: Dict[str, RegisteredFunction] = {}
+        self.max_workers = max_workers
+        self.timeout = timeout
+        # 每个工具自己的超时时间，没有设置的使用 self.timeout
+        self.timeouts: Dict[str, Optional[float]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
 
-    def func(self, description: str = None):
+    def func(self, description: str = None, timeout: Optional[float] = None, cache: Optional[ToolCache] = None):
         """
         A decorator to register a function and automatically generate its tool description.
 
+        The argument validator is compiled here from the signature, so a call only has to parse
+        and coerce its JSON arguments once. str/int/float/bool, lists, dicts, Optionals, enums
+        and pydantic models are supported; unannotated parameters accept any JSON value.
+
         Args:
             description (str, optional): An optional description for the tool. If not provided,
                                          it will attempt to use the function's docstring.
+            timeout (float, optional): Time limit of a call to this tool, defaults to the Tool's timeout.
+            cache (ToolCache, optional): Caches the results of this tool, for pure or slowly changing
+                                         lookups. Off by default.
         """
         def decorator(func):
-            # Register the function in function_mapping
-            self.function_mapping[func.__name__] = func
-
-            # Automatically generate parameter description from function signature
-            parameters = {
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-            sig = inspect.signature(func)
-            for name, param in sig.parameters.items():
-                json_schema_type = "string" # 默认值
-                if param.annotation is not inspect.Parameter.empty:
-                    # 将 Python 类型映射到 JSON Schema 类型
-                    if param.annotation is str:
-                        json_schema_type = "string"
-                    elif param.annotation is int:
-                        json_schema_type = "integer"
-                    elif param.annotation is float:
-                        json_schema_type = "number"
-                    elif param.annotation is bool:
-                        json_schema_type = "boolean"
-                    # 这里可以根据需要添加更多复杂的类型映射，例如 list -> array, dict -> object
-                    # 如果需要支持 Union 或 Optional 类型，还需要更复杂的解析逻辑
-                    else:
-                        # 对于复杂类型，可能需要更详细的错误处理或默认回退
-                        print(f"Warning: Unhandled type annotation '{param.annotation}' for parameter '{name}'. Defaulting to 'string'.")
-                        json_schema_type = "string" # 未识别的类型默认回退到 string
-
-                parameters["properties"][name] = {
-                    "type": json_schema_type,
-                    "description": f"The {name} for the function." # Generic description, can be enhanced
-                }
-                # 假定所有没有默认值的参数都是必需的
-                if param.default is inspect.Parameter.empty:
-                    parameters["required"].append(name)
+            arguments_model = compile_arguments(func)
 
             # 获取函数描述，优先使用装饰器参数，然后是 docstring
             func_description = description if description else inspect.getdoc(func)
@@ -71,66 +119,129 @@ class Tool:
                 "function": {
                     "name": func.__name__,
                     "description": func_description.strip(), # Remove leading/trailing whitespace
-                    "parameters": parameters,
+                    "parameters": parameters_schema(arguments_model),
                 },
             }
-            self.tools.append(tool_spec)
+
+            # Register the function in function_mapping, 同名函数重新注册时覆盖原来的描述
+            name = func.__name__
+            if name in self.function_mapping:
+                self.tools[self.tools.index(self.function_mapping[name].spec)] = tool_spec
+            else:
+                self.tools.append(tool_spec)
+            self.function_mapping[name] = RegisteredFunction(func, arguments_model, tool_spec, cache)
+            if timeout is not None:
+                self.timeouts[name] = timeout
+            else:
+                self.timeouts.pop(name, None)
 
             return func
         return decorator
-    async def invoke(self, messages: Messages, context: Dict[str, Any]) -> ToolMessage:
+
+    async def invoke(self, messages: Messages, context: Dict[str, Any]) -> List[ToolMessage]:
         """
-        Invokes the functions suggested by the language model and returns ToolMessage objects.
+        Invokes every function the language model asked for in its last ToolCallMessage.
 
-        Args:
-            tool_call_message (ToolCallMessage): An object containing one or more tool calls
-                                                 (e.g., from a model's response).
+        The calls run concurrently: async functions are awaited, sync ones run in a thread pool
+        of `max_workers` threads, and each call is limited by its tool's timeout. The
+        ToolCallMessage stays in the history, the provider needs it before the tool results.
 
         Returns:
-            List[ToolMessage]: A list of ToolMessage objects, each containing the output
-                               of a tool call.
+            List[ToolMessage]: One ToolMessage per tool call, in the order of the calls.
         """
         if not messages.messages:
             console.print(":x: 没有消息可供解析。")
             return
         last_message = messages.get_last_message()
         if not isinstance(last_message,ToolCallMessage):
-            console.print("工具调用")
+            printd("工具调用")
             return
-        messages.pop_last_message()
-        results = []
-        console.print(last_message.tool_call)
-        results: List[ToolMessage] = []
-        tool_call = last_message.tool_call
+        printd(last_message.tool_call)
+        tool_calls = last_message.tool_call if isinstance(last_message.tool_call, list) else [last_message.tool_call]
+        results: List[ToolMessage] = list(await asyncio.gather(*(self.call(tool_call, context) for tool_call in tool_calls)))
+        printd(results)
+        return results
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="promptchain-tool")
+        return self._executor
+
+    async def _run(self, target_function, parsed_args: Dict[str, Any]):
+        if inspect.iscoroutinefunction(target_function):
+            return await target_function(**parsed_args)
+        # 同步函数在线程池中执行，带上当前的 contextvars(tracing 的 span 等)
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), functools.partial(context.run, target_function, **parsed_args))
+
+    async def _execute(self, target_function, parsed_args: Dict[str, Any], timeout: Optional[float]) -> str:
+        return str(await asyncio.wait_for(self._run(target_function, parsed_args), timeout))
+
+    async def call(self, tool_call, context: Optional[Dict[str, Any]] = None) -> ToolMessage:
+        """
+        Runs a single tool call and returns its ToolMessage, errors are reported in the content.
+        context[CACHE_BYPASS_KEY] skips the tool's cache for this call.
+        """
         function_name = tool_call.function.name
         tool_call_id = tool_call.id
         arguments_str = tool_call.function.arguments
 
-        if function_name not in self.function_mapping:
+        registered = self.function_mapping.get(function_name)
+        if registered is None:
             error_content = f"Error: Function '{function_name}' not found in registered tools."
-            results.append(ToolMessage(content=error_content, tool_call_id=tool_call_id))
-            console.print(error_content)
-            return
-        
-        target_function = self.function_mapping[function_name]
+            printd(error_content)
+            metrics.TOOL_ERRORS.labels(function_name).inc()
+            return ToolMessage(content=error_content, tool_call_id=tool_call_id)
+
+        timeout = self.timeouts.get(function_name, self.timeout)
 
+        started = time.perf_counter()
         try:
-            # Parse the arguments string (which is JSON) into a Python dictionary
-            # Use strict=False for older Python versions if needed, but strict=True is safer
-            parsed_args = json.loads(arguments_str)
+            # Parse the arguments string (which is JSON) and coerce it to the signature in one pass
+            validated = registered.validate(arguments_str)
+            parsed_args = registered.kwargs(validated)
 
             # Call the function with the parsed arguments
-            function_result = target_function(**parsed_args)
-            results.append(ToolMessage(content=str(function_result), tool_call_id=tool_call_id))
-        except json.JSONDecodeError:
-            error_content = f"Error: Could not parse arguments for function '{function_name}': Invalid JSON '{arguments_str}'"
-            results.append(ToolMessage(content=error_content, tool_call_id=tool_call_id))
+            if registered.cache is not None and not (context and context.get(CACHE_BYPASS_KEY)):
+                key = ToolCache.make_key(function_name, validated.model_dump(mode="json"))
+                content, lookup = await registered.cache.get_or_call(
+                    key, lambda: self._execute(registered.func, parsed_args, timeout))
+                metrics.TOOL_CACHE_LOOKUPS.labels(function_name, lookup).inc()
+            else:
+                content = await self._execute(registered.func, parsed_args, timeout)
+            result = ToolMessage(content=content, tool_call_id=tool_call_id)
+        except ValidationError as e:
+            metrics.TOOL_ERRORS.labels(function_name).inc()
+            if e.errors()[0]["type"] == "json_invalid":
+                error_content = f"Error: Could not parse arguments for function '{function_name}': Invalid JSON '{arguments_str}'"
+            else:
+                error_content = (f"Error: Invalid arguments for function '{function_name}': "
+                    f"{format_validation_error(e)}. Arguments received: {arguments_str}")
+            result = ToolMessage(content=error_content, tool_call_id=tool_call_id)
+        except asyncio.TimeoutError:
+            # 超时的同步函数无法被中断，线程会继续执行完，结果被丢弃
+            metrics.TOOL_ERRORS.labels(function_name).inc()
+            error_content = f"Error: Function '{function_name}' timed out after {timeout} seconds"
+            result = ToolMessage(content=error_content, tool_call_id=tool_call_id)
         except TypeError as e:
+            metrics.TOOL_ERRORS.labels(function_name).inc()
             error_content = f"Error: Argument mismatch for function '{function_name}': {e}. Arguments received: {arguments_str}"
-            results.append(ToolMessage(content=error_content, tool_call_id=tool_call_id))
+            result = ToolMessage(content=error_content, tool_call_id=tool_call_id)
         except Exception as e:
+            metrics.TOOL_ERRORS.labels(function_name).inc()
             error_content = f"Error executing function '{function_name}': {e}"
-            results.append(ToolMessage(content=error_content, tool_call_id=tool_call_id))
-        
-        console.print(results[0])
-        return results[0]
\ No newline at end of file
+            result = ToolMessage(content=error_content, tool_call_id=tool_call_id)
+        metrics.TOOL_LATENCY.labels(function_name).observe(time.perf_counter() - started)
+        return result
+
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hit/miss statistics of every tool registered with a cache, by tool name."""
+        return {name: registered.cache.stats() for name, registered in self.function_mapping.items()
+            if registered.cache is not None}
+
+    def shutdown(self) -> None:
+        """Stops the thread pool used for sync functions."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,239 @@
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 没有开启 tracing 时为 None，run_chain 只需要判断一次
+_tracer: Optional["Tracer"] = None
+_current_span: ContextVar[Optional["Span"]] = ContextVar("promptchain_current_span", default=None)
+
+
+@dataclass
+class Span:
+    """One runnable (or a whole chain) execution. Times are in seconds."""
+    name: str
+    kind: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_time: float = 0.0
+    end_time: float = 0.0
+    duration: float = 0.0
+    # 从就绪(入队、上一个节点结束)到开始执行的等待时间
+    queue_wait: float = 0.0
+    input_messages: int = 0
+    output_messages: int = 0
+    token_usage: Dict[str, int] = field(default_factory=dict)
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    _started: float = field(default=0.0, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("_started")
+        return data
+
+
+def span_kind(runnable: Any) -> str:
+    """The kind of a runnable, declared with a `span_kind` class attribute (model, tool, parser, ...)."""
+    return getattr(runnable, "span_kind", "runnable")
+
+
+def span_name(runnable: Any) -> str:
+    name = getattr(runnable, "name", None)
+    return name if isinstance(name, str) else type(runnable).__name__
+
+
+class SpanExporter(ABC):
+    @abstractmethod
+    def export(self, spans: Sequence[Span]) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        self.flush()
+
+
+class JSONLExporter(SpanExporter):
+    """Appends one JSON object per finished span to `path`."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _write(self, lines: Iterable[str]) -> None:
+        with self._lock:
+            for line in lines:
+                self._file.write(line + "\n")
+
+    def export(self, spans: Sequence[Span]) -> None:
+        self._write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) for span in spans)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._file.flush()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPJSONExporter(JSONLExporter):
+    """
+    Writes each batch of spans as one line of OTLP/JSON (an ExportTraceServiceRequest), the
+    format accepted by the OpenTelemetry collector's file receiver and OTLP/HTTP endpoints.
+    """
+
+    def __init__(self, path: str, service_name: str = "promptchain") -> None:
+        super().__init__(path)
+        self.service_name = service_name
+
+    def to_otlp(self, spans: Sequence[Span]) -> Dict[str, Any]:
+        otlp_spans = []
+        for span in spans:
+            attributes = {
+                "promptchain.kind": span.kind,
+                "promptchain.queue_wait": span.queue_wait,
+                "promptchain.input_messages": span.input_messages,
+                "promptchain.output_messages": span.output_messages,
+                **{f"gen_ai.usage.{key}": value for key, value in span.token_usage.items()},
+                **span.attributes,
+            }
+            otlp_span = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                # 模型调用是对外部服务的请求，其它节点是进程内的调用
+                "kind": 3 if span.kind == "model" else 1,
+                "startTimeUnixNano": str(int(span.start_time * 1e9)),
+                "endTimeUnixNano": str(int(span.end_time * 1e9)),
+                "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                otlp_span["parentSpanId"] = span.parent_id
+            otlp_spans.append(otlp_span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "promptchain"}, "spans": otlp_spans}],
+        }]}
+
+    def export(self, spans: Sequence[Span]) -> None:
+        self._write([json.dumps(self.to_otlp(spans), ensure_ascii=False, default=str)])
+
+
+class Tracer:
+    """
+    Records finished spans in a ring buffer of `capacity` spans and hands them to the exporters.
+
+    Args:
+        capacity: Number of most recent spans kept in memory, older ones are dropped.
+        exporters: Optional exporters (JSONLExporter, OTLPJSONExporter or your own SpanExporter).
+    """
+
+    def __init__(self, capacity: int = 1024, exporters: Optional[List[SpanExporter]] = None) -> None:
+        self.capacity = capacity
+        self.exporters = list(exporters) if exporters else []
+        self._spans: deque = deque(maxlen=capacity)
+
+    def start_span(self, name: str, kind: str, input_messages: int = 0, queue_wait: float = 0.0,
+            **attributes) -> Tuple[Span, Token]:
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            kind=kind,
+            trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+            span_id=os.urandom(8).hex(),
+            parent_id=parent.span_id if parent else None,
+            start_time=time.time(),
+            queue_wait=queue_wait,
+            input_messages=input_messages,
+            attributes=attributes,
+            _started=time.perf_counter(),
+        )
+        return span, _current_span.set(span)
+
+    def end_span(self, span: Span, token: Token, output_messages: int = 0, error: Optional[BaseException] = None) -> None:
+        span.duration = time.perf_counter() - span._started
+        span.end_time = span.start_time + span.duration
+        span.output_messages = output_messages
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        _current_span.reset(token)
+        self._spans.append(span)
+        for exporter in self.exporters:
+            exporter.export([span])
+
+    def spans(self, trace_id: Optional[str] = None) -> List[Span]:
+        """The buffered spans, oldest first, optionally only those of one trace."""
+        spans = list(self._spans)
+        return spans if trace_id is None else [span for span in spans if span.trace_id == trace_id]
+
+    def clear(self) -> None:
+        self._spans.clear()
+
+    def flush(self) -> None:
+        for exporter in self.exporters:
+            exporter.flush()
+
+    def shutdown(self) -> None:
+        for exporter in self.exporters:
+            exporter.shutdown()
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def enable_tracing(capacity: int = 1024, exporters: Optional[List[SpanExporter]] = None) -> Tracer:
+    """Turns tracing on for every chain run and returns the tracer holding the spans."""
+    global _tracer
+    _tracer = Tracer(capacity, exporters)
+    return _tracer
+
+
+def disable_tracing() -> None:
+    global _tracer
+    if _tracer is not None:
+        _tracer.shutdown()
+    _tracer = None
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def record_usage(prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None) -> None:
+    """Adds the token usage reported by a provider to the running span, a no-op without tracing."""
+    span = _current_span.get()
+    if span is None:
+        return
+    usage = span.token_usage
+    if prompt_tokens:
+        usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + prompt_tokens
+    if completion_tokens:
+        usage["completion_tokens"] = usage.get("completion_tokens", 0) + completion_tokens
+
+
+def set_attribute(key: str, value: Any) -> None:
+    span = _current_span.get()
+    if span is not None:
+        span.attributes[key] = value
@@ -1,16 +1,35 @@
 import json
 from datetime import datetime
-import pytz
-import numpy as np
-from pydantic import BaseModel
-from rich.console import Console
+from typing import TYPE_CHECKING
 
-console = Console()
+if TYPE_CHECKING:
+    from pydantic import BaseModel
+    from rich.console import Console
+
+
+class LazyConsole:
+    """
+    Stands in for the shared rich Console, rich is imported and the Console built on first use.
+    Modules use `from promptchain.utils import console` instead of creating their own at import.
+    """
+    _console = None
+
+    def get(self) -> "Console":
+        if LazyConsole._console is None:
+            from rich.console import Console
+            LazyConsole._console = Console()
+        return LazyConsole._console
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+console = LazyConsole()
 
 DEBUG = False
 
 
-def create_example_from_model(model: BaseModel) -> str:
+def create_example_from_model(model: "BaseModel") -> str:
     example_data = {}
     for field_name, field in model.model_fields.items():
         if not field.examples:
@@ -23,6 +42,7 @@ def printd(*args, **kwargs):
         console.print(*args, **kwargs)
 
 def get_local_time():
+    import pytz
     # Get the current time in UTC
     current_time_utc = datetime.now(pytz.utc)
 
@@ -34,8 +54,21 @@ def get_local_time():
 
     return formatted_time
 
-def cosine_similarity(a, b):
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+def cosine_similarity(a, b, normalized:bool = False):
+    """
+    Cosine similarity between vectors or between rows of matrices.
+
+    Two 1-D vectors give a scalar, a (n, d) matrix and a (d,) vector give n scores and two
+    matrices give the (n, m) similarity matrix, all computed in a single matrix product.
+    Pass normalized=True when the inputs already have unit length to skip the norms.
+    """
+    import numpy as np
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    if not normalized:
+        a = a / np.linalg.norm(a, axis=-1, keepdims=True)
+        b = b / np.linalg.norm(b, axis=-1, keepdims=True)
+    return np.matmul(a, b.T) if b.ndim == 2 else np.matmul(a, b)
 
 if __name__ == "__main__":
     get_local_time = get_local_time()
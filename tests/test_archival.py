@@ -0,0 +1,127 @@
+import asyncio
+
+import numpy as np
+
+from promptchain.archival import ArchivalStorage, ArchivalMemory
+from promptchain.config import PromptChainConfig, EmbeddingConfig
+from promptchain.message import Messages, HumanMessage
+
+
+def random_vectors(count, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+def test_search_returns_nearest_rows_across_segments(tmp_path):
+    storage = ArchivalStorage(str(tmp_path), embedding_dim=8, segment_rows=16, block_rows=5)
+    vectors = random_vectors(50)
+    ids = storage.add([f"passage {i}" for i in range(50)], vectors, [{"i": i} for i in range(50)])
+    assert len(storage) == 50 and ids[17] == "segment-000001:1"
+
+    results = storage.search(vectors[37], top_k=3)
+    assert results[0].text == "passage 37" and results[0].metadata == {"i": 37}
+    assert np.isclose(results[0].score, 1.0)
+    assert results[0].score >= results[1].score >= results[2].score
+
+def test_reopen_delete_and_compact(tmp_path):
+    config = PromptChainConfig(archival_storage_path=str(tmp_path))
+    storage = ArchivalStorage.from_config(config, EmbeddingConfig(model_name="e", embedding_dim=8), segment_rows=10, max_segments=100)
+    vectors = random_vectors(35)
+    storage.add([str(i) for i in range(35)], vectors)
+    assert storage.delete(["segment-000000:3", "segment-000002:4"]) == 2
+
+    storage = ArchivalStorage(str(tmp_path), embedding_dim=8, segment_rows=10)
+    assert len(storage) == 33
+    assert storage.search(vectors[3], top_k=1)[0].text != "3"
+
+    storage.compact()
+    assert len(storage) == 33
+    # 封存的 segment 合并为一个，加上活跃的 segment
+    assert len([name for name in (tmp_path).iterdir() if name.suffix == ".f32"]) == 2
+    assert storage.search(vectors[27], top_k=1)[0].text == "27"
+    assert "24" not in [record.text for record in storage.search(vectors[24], top_k=33)]
+
+def test_repeated_adds_do_not_compact_every_time(tmp_path, monkeypatch):
+    storage = ArchivalStorage(str(tmp_path), embedding_dim=8, segment_rows=4, max_segments=4)
+    merged_rows = []
+    merge = storage._merge
+    monkeypatch.setattr(storage, "_merge", lambda segments: merged_rows.append(sum(s.rows for s in segments)) or merge(segments))
+
+    vectors = random_vectors(400)
+    for i in range(0, 400, 2):
+        merges = len(merged_rows)
+        sealed = storage._segments[-1].rows + 2 >= storage.segment_rows if storage._segments else False
+        storage.add([str(i), str(i + 1)], vectors[i:i + 2])
+        assert sum(segment.sealed for segment in storage._segments) <= storage.max_segments
+        # 只有封存了新的 segment 的 add 才可能触发合并
+        if not sealed:
+            assert len(merged_rows) == merges
+    # 每行只被重写 O(log N) 次(这里 log2(100) 层)，而不是每次 add 都重写整个存储
+    assert sum(merged_rows) < 400 * 8
+    assert max(merged_rows) < 400
+    assert len(storage) == 400
+    assert storage.search(vectors[123], top_k=1)[0].text == "123"
+
+
+def test_deleted_rows_trigger_a_rewrite(tmp_path):
+    storage = ArchivalStorage(str(tmp_path), embedding_dim=8, segment_rows=10, max_segments=100)
+    storage.add([str(i) for i in range(25)], random_vectors(25))
+    storage.delete([f"segment-000001:{row}" for row in range(3)])
+    assert [segment.rows for segment in storage._segments] == [10, 7, 5]
+    assert all(not segment.deleted for segment in storage._segments)
+    assert len(storage) == 22
+
+
+def test_archival_memory_injects_passages(tmp_path):
+    storage = ArchivalStorage(str(tmp_path), embedding_dim=3)
+    storage.add(["about cats", "about rust"], [[1, 0, 0], [0, 1, 0]])
+
+    async def embed(text):
+        return [1, 0, 0] if "cat" in text else [0, 1, 0]
+
+    context = {}
+    messages = Messages(messages=[HumanMessage(content="tell me about cats")])
+    asyncio.run(ArchivalMemory(storage, embed, top_k=1).invoke(messages, context))
+    assert context["archival_passages"] == "about cats"
+    assert context["archival_passages_records"][0].score == 1.0
+
+def test_torn_append_is_truncated_on_open(tmp_path):
+    storage = ArchivalStorage(str(tmp_path), embedding_dim=4)
+    storage.add(["a", "b"], random_vectors(2, dim=4))
+    # simulate a crash after the vectors were written but before the index was updated
+    with open(tmp_path / "segment-000000.f32", "ab") as file:
+        file.write(random_vectors(1, dim=4).tobytes())
+    with open(tmp_path / "segment-000000.jsonl", "ab") as file:
+        file.write(b'{"id": "half')
+
+    storage = ArchivalStorage(str(tmp_path), embedding_dim=4)
+    assert len(storage) == 2
+    storage.add(["c"], random_vectors(1, dim=4, seed=3))
+    assert storage.search(random_vectors(1, dim=4, seed=3)[0], top_k=1)[0].text == "c"
+
+
+def test_merge_during_search_keeps_files_until_the_search_ends(tmp_path, monkeypatch):
+    storage = ArchivalStorage(str(tmp_path), embedding_dim=8, segment_rows=10, max_segments=100)
+    vectors = random_vectors(30)
+    storage.add([str(i) for i in range(30)], vectors)
+    read_records = storage._read_records
+
+    def merge_then_read(segment, rows):
+        # 模拟另一个线程的 add 在 search 读取元数据之前触发了合并
+        storage.compact()
+        return read_records(segment, rows)
+
+    monkeypatch.setattr(storage, "_read_records", merge_then_read)
+    assert storage.search(vectors[5], top_k=1)[0].text == "5"
+    assert not storage._readers and not storage._retired
+    assert len(list(tmp_path.glob("*.f32"))) == 1
+
+
+def test_delete_uses_id_index_across_merges(tmp_path, monkeypatch):
+    storage = ArchivalStorage(str(tmp_path), embedding_dim=8, segment_rows=10, max_segments=100)
+    ids = storage.add([str(i) for i in range(25)], random_vectors(25), ids=[f"doc-{i}" for i in range(25)])
+    assert storage.delete(ids[:4]) == 4
+    storage.compact()
+    storage.add(["late"], random_vectors(1, seed=1), ids=["doc-late"])
+    # 索引建立之后 delete 不再逐行解析元数据
+    monkeypatch.setattr(storage, "_iter_metadata", None)
+    assert storage.delete(["doc-4", "doc-24", "doc-late", "doc-0", "missing"]) == 3
+    assert len(storage) == 19
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from promptchain.cache import LLMCache, MemoryLRUCache, SQLiteCache, make_cache_key
+from promptchain.semantic_cache import SemanticCache
+from promptchain.utils import cosine_similarity
+
+
+def test_cache_key_is_canonical_and_ignores_transport_fields():
+    request = {"model": "m", "messages": [{"role": "user", "content": "hi"}], "temperature": 0}
+    reordered = {"temperature": 0, "messages": [{"content": "hi", "role": "user"}], "model": "m", "stream": True}
+    assert make_cache_key(request) == make_cache_key(reordered)
+    assert make_cache_key(request) != make_cache_key({**request, "temperature": 0.7})
+    assert make_cache_key(request) != make_cache_key({**request, "tools": [{"type": "function"}]})
+
+def test_memory_lru_evicts_oldest_and_expired():
+    cache = MemoryLRUCache(maxsize=2, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+def test_sqlite_tier_persists_and_promotes(tmp_path):
+    path = str(tmp_path / "cache.db")
+    LLMCache(persistent=SQLiteCache(path)).set("k", {"role": "assistant", "content": "cached"})
+
+    cache = LLMCache(persistent=SQLiteCache(path))
+    assert cache.get("k") == {"role": "assistant", "content": "cached"}
+    assert cache.memory.get("k") is not None
+    assert cache.get("missing") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_sqlite_tier_runs_off_the_event_loop_and_is_bounded(tmp_path):
+    with pytest.raises(ValueError):
+        SQLiteCache(str(tmp_path / "bad.db"), table="cache; DROP TABLE x")
+
+    tier = SQLiteCache(str(tmp_path / "cache.db"), max_rows=3)
+    threads = []
+    get = tier.get
+    tier.get = lambda key: threads.append(threading.get_ident()) or get(key)
+    cache = LLMCache(persistent=tier)
+
+    async def main():
+        for i in range(5):
+            await cache.aset(f"k{i}", {"content": str(i)})
+        cache.memory.clear()
+        return await cache.aget("k4"), await cache.aget("k0")
+
+    assert asyncio.run(main()) == ({"content": "4"}, None)
+    assert threads and threading.get_ident() not in threads
+    # 超过 max_rows 时删除最早写入的
+    assert len(tier) == 3
+    tier.close()
+
+
+def fake_embed(text):
+    vocabulary = ["weather", "shenyang", "today", "python", "generator"]
+    words = text.lower().replace("?", "").split()
+    return [float(sum(word.startswith(v) for word in words)) for v in vocabulary]
+
+def test_semantic_cache_matches_paraphrase_within_namespace():
+    cache = SemanticCache(fake_embed, threshold=0.9, capacity=2)
+
+    async def scenario():
+        vector, answer = await cache.lookup("ns", "weather in shenyang today?")
+        assert answer is None
+        cache.store("ns", vector, "27.5")
+        assert (await cache.lookup("ns", "today shenyang weather"))[1] == "27.5"
+        assert (await cache.lookup("other", "today shenyang weather"))[1] is None
+        assert (await cache.lookup("ns", "python generator"))[1] is None
+
+    asyncio.run(scenario())
+    report = cache.report(thresholds=[0.0, 0.9])
+    assert report["hits"] == 1 and report["misses"] == 3
+    assert report["hit_rate_at"][0.9] == 0.25
+
+def test_semantic_cache_evicts_least_recently_used():
+    cache = SemanticCache(fake_embed, capacity=2)
+    for text in ["weather", "python", "generator"]:
+        cache.store("ns", np.asarray(fake_embed(text), dtype=np.float32), text)
+    assert len(cache) == 2 and cache.report()["evictions"] == 1
+    assert cache.search("ns", np.asarray(fake_embed("weather"), dtype=np.float32))[0] is None
+
+def test_cosine_similarity_is_vectorized():
+    matrix = np.array([[1.0, 0.0], [0.0, 2.0], [1.0, 1.0]])
+    assert np.allclose(cosine_similarity(matrix, [1.0, 0.0]), [1.0, 0.0, np.sqrt(0.5)])
+    assert np.isclose(cosine_similarity([1.0, 1.0], [2.0, 2.0]), 1.0)
+    assert cosine_similarity(matrix, matrix).shape == (3, 3)
@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+import pytest
+
+from promptchain.message import AIMessage, HumanMessage, SystemMessage, Messages
+from promptchain.chain_processor import ChainProcessor
+from promptchain.stream import MessageStream
+from promptchain.chain import Parallel
+
+
+class EchoModel:
+    """A stub chat model that streams back the last message word by word."""
+    name = "echo"
+
+    async def invoke(self, messages, context):
+        return AIMessage(content=f"echo: {messages.get_last_message().content}")
+
+    def stream(self, messages, context):
+        async def deltas():
+            for word in f"echo: {messages.get_last_message().content}".split(" "):
+                yield word + " "
+        return MessageStream(deltas(), lambda content: AIMessage(content=content.strip()))
+
+
+class Collector:
+    def __init__(self):
+        self.chunks = []
+
+    async def invoke(self, messages, context):
+        return None
+
+    async def invoke_stream(self, stream, messages, context):
+        async for chunk in stream:
+            self.chunks.append(chunk)
+        return None
+
+
+def new_chain(**kwargs):
+    return ChainProcessor(Messages(messages=[SystemMessage(content="be brief")]), **kwargs)
+
+def test_invoke_appends_model_output():
+    chain = new_chain()
+    chain | EchoModel()
+    chain.messages.add_message(HumanMessage(content="hello world"))
+    asyncio.run(chain.invoke())
+    assert chain.messages.get_last_message().content == "echo: hello world"
+
+def test_stream_mode_feeds_consumer_and_assembles_message():
+    collector = Collector()
+    chain = new_chain(stream=True)
+    chain | EchoModel() | collector
+    chain.messages.add_message(HumanMessage(content="hello world"))
+    context = asyncio.run(chain.invoke())
+    assert collector.chunks == ["echo: ", "hello ", "world "]
+    assert chain.messages.get_last_message() == AIMessage(content="echo: hello world")
+    assert context["time_to_first_token"]["echo"] is not None
+
+def test_stream_mode_without_consumer_still_collects():
+    chain = new_chain()
+    chain | EchoModel()
+    chain.messages.add_message(HumanMessage(content="hi"))
+    asyncio.run(chain.invoke(stream=True))
+    assert chain.messages.get_last_message().content == "echo: hi"
+    assert len(chain.messages) == 3
+
+
+class SlowStep:
+    def __init__(self, key, value, delay=0.05, fail=False):
+        self.key, self.value, self.delay, self.fail = key, value, delay, fail
+
+    async def invoke(self, messages, context):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"{self.key} failed")
+        context[self.key] = self.value
+        return AIMessage(content=self.value)
+
+
+def test_parallel_branches_run_concurrently_and_merge_in_order():
+    chain = new_chain()
+    chain | Parallel({
+        "a": [SlowStep("a", "first", delay=0.1)],
+        "b": [SlowStep("b", "second", delay=0.1)],
+        "c": SlowStep("c", "third", delay=0.1),
+    })
+    started = time.perf_counter()
+    context = asyncio.run(chain.invoke())
+    assert time.perf_counter() - started < 0.25
+    assert [context[k] for k in "abc"] == ["first", "second", "third"]
+    assert [m.content for m in chain.messages.messages[1:]] == ["first", "second", "third"]
+
+def test_parallel_branches_are_isolated_and_namespaced():
+    chain = new_chain()
+    chain | Parallel({"x": SlowStep("value", "x", 0), "y": SlowStep("value", "y", 0)}, merge="namespace")
+    context = asyncio.run(chain.invoke({"value": "root"}))
+    assert context["value"] == "root"
+    assert context["x"] == {"value": "x"} and context["y"] == {"value": "y"}
+
+def test_parallel_collect_all_records_errors():
+    node = Parallel({"ok": SlowStep("ok", "done", 0), "bad": SlowStep("bad", "", 0, fail=True)}, fail_fast=False)
+    chain = new_chain()
+    chain | node
+    context = asyncio.run(chain.invoke())
+    assert context["ok"] == "done"
+    assert context["bad_error"] == "bad failed"
+
+    chain = new_chain()
+    chain | Parallel({"ok": SlowStep("ok", "done", 0.2), "bad": SlowStep("bad", "", 0, fail=True)}, max_concurrency=1)
+    with pytest.raises(RuntimeError):
+        asyncio.run(chain.invoke())
+
+def test_compiled_chain_runs_are_isolated():
+    chain = new_chain()
+    chain | SlowStep("answer", "ok", 0) | EchoModel()
+    compiled = chain.compile()
+
+    first = asyncio.run(compiled.invoke({"user": 1}))
+    second = asyncio.run(compiled.invoke({"user": 2}))
+    assert first.context == {"user": 1, "answer": "ok"}
+    assert second.context["user"] == 2
+    assert len(first.messages) == len(second.messages) == 3
+    # the chain definition and its initial history are untouched
+    assert len(chain.messages) == 1 and chain.context == {}
+
+def test_batch_keeps_input_order_and_limits_concurrency():
+    running = 0
+    peak = 0
+
+    class Probe:
+        async def invoke(self, messages, context):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01 * (5 - context["i"] % 5))
+            running -= 1
+            context["done"] = context["i"]
+
+    chain = new_chain()
+    chain | Probe()
+    states = asyncio.run(chain.batch(({"i": i} for i in range(20)), max_concurrency=4))
+    assert [state.context["done"] for state in states] == list(range(20))
+    assert peak == 4
+
+def test_as_completed_collects_errors():
+    chain = new_chain()
+    chain | SlowStep("x", "x", 0, fail=True)
+
+    async def collect():
+        return [item async for item in chain.as_completed([{}, {}], return_exceptions=True)]
+
+    results = asyncio.run(collect())
+    assert sorted(index for index, _ in results) == [0, 1]
+    assert all(isinstance(state.error, RuntimeError) for _, state in results)
+
+def test_chain_package_star_import():
+    namespace = {}
+    exec("from promptchain.chain import *", namespace)
+    assert namespace["Parallel"] is Parallel
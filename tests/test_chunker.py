@@ -0,0 +1,86 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from promptchain.archival import ArchivalStorage
+from promptchain.chunker import MAX_PENDING_CHARS, TextChunker, ingest, iter_file
+from promptchain.config import EmbeddingConfig
+from promptchain import tokens
+from promptchain.tokens import count_tokens
+
+TEXT = " ".join(f"word{i}" for i in range(200)) + "."
+
+
+@pytest.fixture(autouse=True)
+def approximate_tokens():
+    # token 模式的断言按近似分词计算，安装了 tiktoken 时结果也一样
+    tokens.set_tokenizer(tokens._approximate_tokens)
+    yield
+    tokens.set_tokenizer(None)
+
+
+def test_char_chunks_respect_size_overlap_and_word_boundaries():
+    chunks = list(TextChunker(chunk_size=50, overlap=10).chunk(TEXT))
+    assert all(len(chunk.text) <= 50 for chunk in chunks)
+    assert all(chunk.text.endswith(" ") for chunk in chunks[:-1])
+    for previous, current in zip(chunks, chunks[1:]):
+        assert TEXT[current.start:current.start + len(current.text)] == current.text
+        assert current.start == previous.start + len(previous.text) - 10
+    assert chunks[-1].text.endswith("word199.")
+
+def test_block_boundaries_do_not_change_chunks(tmp_path):
+    path = tmp_path / "doc.txt"
+    path.write_text(TEXT, encoding="utf-8")
+    chunker = TextChunker(chunk_size=40, overlap=5)
+    whole = [chunk.text for chunk in chunker.chunk(TEXT)]
+    assert [chunk.text for chunk in chunker.chunk_file(str(path), block_size=7)] == whole
+
+    token_chunker = TextChunker(chunk_size=16, overlap=4, unit="token")
+    tokens_whole = [chunk.text for chunk in token_chunker.chunk(TEXT)]
+    assert [chunk.text for chunk in token_chunker.chunk(iter_file(str(path), block_size=13))] == tokens_whole
+    assert all(count_tokens(text) <= 16 for text in tokens_whole)
+    first, second = tokens_whole[:2]
+    shared = next(second[:n] for n in range(len(second), 0, -1) if first.endswith(second[:n]))
+    assert 0 < count_tokens(shared) <= 4
+
+def test_token_chunks_use_count_tokens_for_text_without_spaces():
+    text = "这是一段没有空格的中文文本，" * 40 + "x" * 500
+    chunks = [chunk.text for chunk in TextChunker(chunk_size=50, unit="token").chunk(text)]
+    assert "".join(chunks) == text
+    assert len(chunks) > 10
+    assert all(count_tokens(chunk) <= 50 for chunk in chunks)
+    # 汉字部分的 chunk 几乎是满的
+    assert all(count_tokens(chunk) >= 48 for chunk in chunks[:10])
+
+def test_token_buffer_is_bounded():
+    read = []
+
+    def blocks():
+        for i in range(100):
+            read.append(i)
+            yield "y" * 10000
+
+    # 整个输入只是一个 piece 时，缓冲区达到上限后就开始输出，不会先读完全部输入
+    chunks = TextChunker(chunk_size=100, unit="token", tokenizer=lambda text: [text]).chunk(blocks())
+    first = [next(chunks) for _ in range(5)]
+    assert len(read) < 10
+    # 过长的 piece 被切开，每个 chunk 都不超过 chunk_size
+    assert all(count_tokens(chunk.text) <= 100 for chunk in first)
+    assert sum(len(chunk.text) for chunk in first) < MAX_PENDING_CHARS
+
+    long_words = [chunk.text for chunk in TextChunker(chunk_size=4, unit="token").chunk("x" * 100 + " y")]
+    assert "".join(long_words) == "x" * 100 + " y"
+    assert all(count_tokens(text) <= 4 for text in long_words)
+
+def test_from_config_and_ingest(tmp_path):
+    chunker = TextChunker.from_config(EmbeddingConfig(model_name="e", embedding_chuck_size=64))
+    assert chunker.chunk_size == 64
+    storage = ArchivalStorage(str(tmp_path / "db"), embedding_dim=2)
+
+    async def embed(texts):
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+    stored = asyncio.run(ingest(chunker.chunk(TEXT, source="doc"), embed, storage, batch_size=4))
+    assert stored == len(storage) > 4
+    assert storage.search([64.0, 1.0], top_k=1)[0].metadata["source"] == "doc"
@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from promptchain import constants
+from promptchain.llm import DeepseekChatMessageModel
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def isolated_config(monkeypatch):
+    monkeypatch.delenv("DEEPSEEK_API_KEY", raising=False)
+    monkeypatch.delenv(constants.CONFIG_PATH_ENV, raising=False)
+    monkeypatch.setattr(constants, "DEFAULT_CONFIG_PATH", "/nonexistent/config.yaml")
+    constants.configure()
+    yield
+    constants.configure()
+
+
+def test_config_precedence(isolated_config, tmp_path, monkeypatch):
+    assert constants.get_config() == {}
+    assert constants.DEEPSEEK_API_KEY is None
+
+    path = tmp_path / "config.yaml"
+    path.write_text("DEEPSEEK_API_KEY: from-file\nOTHER: 1\n")
+    monkeypatch.setenv(constants.CONFIG_PATH_ENV, str(path))
+    constants.configure()
+    assert constants.get_config() == {"DEEPSEEK_API_KEY": "from-file", "OTHER": 1}
+
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "from-env")
+    constants.configure()
+    assert constants.get_deepseek_api_key() == "from-env"
+
+    constants.configure({"DEEPSEEK_API_KEY": "explicit"})
+    assert constants.DEEPSEEK_API_KEY == "explicit"
+
+    constants.configure(path=str(tmp_path / "missing.yaml"))
+    with pytest.raises(FileNotFoundError):
+        constants.get_config()
+
+
+def test_missing_api_key_fails_on_use_not_on_import(isolated_config):
+    model = DeepseekChatMessageModel("test")
+    with pytest.raises(ValueError, match="DEEPSEEK_API_KEY"):
+        model.get_client()
+
+
+def test_import_does_not_load_provider_sdks():
+    code = ("import sys, promptchain.llm, promptchain.tool, promptchain.chain_processor, promptchain.parser; "
+        "print(sorted(m for m in ('openai', 'ollama', 'httpx', 'numpy', 'rich', 'yaml') if m in sys.modules))")
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.run([sys.executable, "-c", code], env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "[]"
@@ -0,0 +1,56 @@
+import os
+
+from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
+
+from promptchain.conversation_store import ConversationStore, INDEX_NAME, LOG_NAME
+from promptchain.message import AIMessage, HumanMessage, Messages, SystemMessage, ToolCallMessage, ToolMessage
+
+
+def test_append_and_lazy_tail_load(tmp_path):
+    path = str(tmp_path / "conversations")
+    with ConversationStore(path) as store:
+        store.append("a", SystemMessage(content="sys"))
+        for i in range(100):
+            store.append("a", [HumanMessage(content=f"q{i}"), AIMessage(content=f"a{i}")])
+            store.append("b", HumanMessage(content=f"other {i}"))
+        assert store.count("a") == 201
+        assert [m.content for m in store.load("a", last=2)] == ["q99", "a99"]
+
+    with ConversationStore(path) as store:
+        assert sorted(store.sessions()) == ["a", "b"]
+        history = store.load("a")
+        assert len(history) == 201 and isinstance(history.messages[0], SystemMessage)
+        budget = sum(m.token_count for m in history.messages[-4:])
+        assert store.load("a", max_tokens=budget).messages == history.messages[-4:]
+        assert store.load("missing").messages == []
+
+
+def test_tool_messages_and_sync_round_trip(tmp_path):
+    call = ChatCompletionMessageToolCall(id="call_1", type="function", function=Function(name="add", arguments="{}"))
+    messages = Messages(messages=[HumanMessage(content="add"), ToolCallMessage(content="", tool_call=call)])
+    with ConversationStore(str(tmp_path)) as store:
+        store.sync("s", messages)
+        messages.add_message(ToolMessage(content="3", tool_call_id="call_1"))
+        assert store.sync("s", messages) == 3
+        loaded = store.load("s")
+    assert loaded.messages[1].tool_call == call
+    assert loaded.messages[2] == ToolMessage(content="3", tool_call_id="call_1")
+
+
+def test_torn_append_is_repaired(tmp_path):
+    path = str(tmp_path)
+    with ConversationStore(path) as store:
+        store.append("s", [HumanMessage(content="one"), AIMessage(content="two")])
+    # 模拟写入 log 之后、写入 .idx 之前崩溃，以及最后一条记录只写了一半
+    with ConversationStore(path) as store:
+        store.append("s", HumanMessage(content="three"))
+    index_path = os.path.join(path, INDEX_NAME)
+    with open(index_path, "r+b") as file:
+        file.truncate(os.path.getsize(index_path) - 24)
+    with open(os.path.join(path, LOG_NAME), "ab") as file:
+        file.write(b"\x10\x00\x00\x00garbage")
+
+    with ConversationStore(path) as store:
+        assert [m.content for m in store.load("s")] == ["one", "two", "three"]
+        store.append("s", AIMessage(content="four"))
+        assert [m.content for m in store.load("s")] == ["one", "two", "three", "four"]
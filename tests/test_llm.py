@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from promptchain.config import HTTPClientConfig
+from promptchain.llm import aclose_clients, get_async_ollama_client, get_async_openai_client, get_http_client
+
+
+def run(scenario):
+    async def main():
+        try:
+            return await scenario()
+        finally:
+            await aclose_clients()
+    return asyncio.run(main())
+
+
+def test_pool_is_shared_per_base_url_and_config():
+    async def scenario():
+        default = get_http_client("http://a")
+        slow = HTTPClientConfig(timeout=300.0)
+        assert get_http_client("http://a") is default
+        assert get_http_client("http://a", HTTPClientConfig()) is default
+        assert get_http_client("http://b") is not default
+        # 不同的配置不能拿到按旧配置创建的连接池
+        pooled = get_http_client("http://a", slow)
+        assert pooled is not default and pooled.timeout.read == 300.0
+        assert get_http_client("http://a", HTTPClientConfig(timeout=300.0)) is pooled
+        client = get_async_openai_client("http://a", "key", slow)
+        assert get_async_openai_client("http://a", "key", slow) is client
+        assert get_async_openai_client("http://a", "key") is not client
+
+    run(scenario)
+
+
+def test_clients_of_a_finished_loop_are_replaced_and_closed():
+    async def first():
+        return get_http_client("http://a"), get_async_ollama_client("http://a")
+
+    async def second():
+        http_client, ollama_client = get_http_client("http://a"), get_async_ollama_client("http://a")
+        await aclose_clients()
+        return http_client, ollama_client
+
+    old_http, old_ollama = asyncio.run(first())
+    new_http, new_ollama = asyncio.run(second())
+    assert new_http is not old_http and new_ollama is not old_ollama
+    assert old_http.is_closed
+
+    async def request_with_old_client():
+        with pytest.raises(RuntimeError, match="client has been closed"):
+            await old_ollama.embed(model="mock", input=["a"])
+
+    asyncio.run(request_with_old_client())
+
+
+def test_reply_with_text_and_tool_calls_keeps_both():
+    from promptchain.llm import DeepseekChatMessageModel
+    from promptchain.message import HumanMessage, Messages, ToolCallMessage
+    from promptchain.mock_server import MockLLMServer, MockServerConfig
+
+    tools = [{"type": "function", "function": {"name": "add", "parameters": {
+        "type": "object", "properties": {"a": {"type": "integer"}}, "required": ["a"]}}}]
+    config = MockServerConfig(tool_call_content="Let me add that.", tool_calls_per_turn=2)
+
+    async def scenario():
+        async with MockLLMServer(config) as server:
+            model = DeepseekChatMessageModel("mock", model_config={"tools": tools},
+                base_url=server.openai_base_url, api_key="mock")
+            messages = Messages(messages=[HumanMessage(content="add 1")])
+            invoked = await model.invoke(messages)
+            stream = model.stream(messages)
+            deltas = [delta async for delta in stream]
+            return invoked, deltas, await stream.collect()
+
+    invoked, deltas, streamed = run(scenario)
+    assert "".join(deltas) == "Let me add that."
+    for message in (invoked, streamed):
+        assert isinstance(message, ToolCallMessage)
+        assert message.content == "Let me add that."
+        assert [call.function.name for call in message.tool_call] == ["add", "add"]
+        assert message.to_payload("openai")["tool_calls"][0]["function"]["arguments"] == '{"a": 1}'
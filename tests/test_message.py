@@ -110,4 +110,136 @@ def test_add_message_unsupported_type():
 def test_add_operator_unsupported_type():
     messages = Messages()
     with pytest.raises(TypeError, match="Unsupported message type"):
-        messages + 123 # Adding an integer
\ No newline at end of file
+        messages + 123 # Adding an integer
+def test_trusted_construction_matches_validated():
+    trusted = AIMessage.trusted(content="cached answer")
+    validated = AIMessage(content="cached answer")
+    assert trusted == validated
+    assert hash(trusted) == hash(validated)
+    assert repr(trusted) == repr(validated)
+    assert trusted.model_dump() == validated.model_dump()
+
+def test_records_round_trip():
+    from promptchain.message import MessageRecord, ToolMessage
+    messages = Messages(messages=[
+        SystemMessage(content="sys"),
+        HumanMessage(content="question"),
+        AIMessage(content="answer"),
+        ToolMessage(content="42", tool_call_id="call_1"),
+    ])
+    records = messages.to_records()
+    assert records[3] == MessageRecord("tool", "42", "call_1")
+    restored = Messages.from_records(records)
+    assert restored.messages == messages.messages
+    assert [type(m) for m in restored] == [type(m) for m in messages]
+
+def test_indexed_query_returns_views():
+    from promptchain.message import MessagesView
+    messages = Messages()
+    for i in range(50):
+        messages.add_message(HumanMessage(content=f"question {i} about python"))
+        messages.add_message(AIMessage(content=f"answer {i}"))
+    messages.build_token_index()
+    messages.messages.append(SystemMessage(content="appended directly about python"))
+
+    users = messages.query(role="user")
+    assert isinstance(users, MessagesView)
+    assert len(users) == 50 and users[0].content == "question 0 about python"
+
+    hits = messages.query(content_contains=" about python")
+    assert len(hits) == 51
+    assert list(messages.query(role="user", content_contains="n 7 ab")) == [messages.messages[14]]
+    assert messages.query(content_contains="python", start=-3).indices == [98, 100]
+    assert len(messages.query(role="assistant").query(content_contains="answer 4")) == 11
+
+    popped = messages.pop_last_message()
+    assert popped.role == "system"
+    assert len(messages.query(content_contains="python")) == 50
+
+def test_token_index_matches_partial_words():
+    messages = Messages()
+    for i in range(30):
+        messages.add_message(HumanMessage(content=f"question{i} about pythonic code"))
+        messages.add_message(AIMessage(content=f"答案 {i} 使用 python 编写"))
+    messages.build_token_index()
+    # 只有一个单词或者首尾单词不完整时，结果和逐条查找一致
+    for query in ["python", "ytho", "pyth", "onic", "question1", "stion2 ab", "ic code", "n 编", "使用", "用", "missing"]:
+        expected = [i for i, m in enumerate(messages.messages) if query in m.content]
+        assert list(messages.query(content_contains=query).indices) == expected, query
+
+def test_query_time_range():
+    import time
+    messages = Messages(messages=[HumanMessage(content="old")])
+    messages.query()
+    time.sleep(0.01)
+    checkpoint = time.time()
+    time.sleep(0.01)
+    messages.add_message(HumanMessage(content="new"))
+    assert [m.content for m in messages.query(since=checkpoint)] == ["new"]
+    assert [m.content for m in messages.query(until=checkpoint)] == ["old"]
+
+
+def test_messages_are_timestamped_when_the_container_is_created():
+    import time
+    created = Messages(messages=[HumanMessage(content="q")]) + AIMessage(content="a")
+    time.sleep(0.01)
+    checkpoint = time.time()
+    # 第一次查询发生在 checkpoint 之后，时间戳仍然是创建容器的时间
+    assert len(created.query(until=checkpoint)) == 2
+    assert len(created.query(since=checkpoint)) == 0
+
+def test_set_operations_preserve_order_and_use_digest():
+    from promptchain.message import ToolMessage
+    big_output = "x" * 100_000
+    first = Messages(messages=[
+        SystemMessage(content="sys"),
+        HumanMessage(content="q1"),
+        ToolMessage(content=big_output, tool_call_id="call_1"),
+        AIMessage(content="a1"),
+    ])
+    second = Messages(messages=[
+        HumanMessage(content="q1"),
+        ToolMessage(content=big_output, tool_call_id="call_2"),
+        AIMessage(content="a2"),
+    ])
+    union = first | second
+    assert [m.content[:3] for m in union] == ["sys", "q1", "xxx", "a1", "xxx", "a2"]
+    assert [m.content for m in first - second] == ["sys", big_output, "a1"]
+
+    digest = first.messages[2].digest
+    assert digest == ToolMessage(content=big_output, tool_call_id="call_1").digest
+    assert digest != second.messages[1].digest
+
+def test_payload_is_cached_and_incremental():
+    from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
+    from promptchain.message import ToolCallMessage, ToolMessage
+    messages = Messages(messages=[SystemMessage(content="sys"), HumanMessage(content="q")])
+    first = messages.payload()
+    assert first == [{"role": "system", "content": "sys"}, {"role": "user", "content": "q"}]
+
+    call = ChatCompletionMessageToolCall(id="call_1", type="function", function=Function(name="add", arguments='{"a": 1}'))
+    messages.add_message(ToolCallMessage(content="", tool_call=call))
+    messages.add_message(ToolMessage(content="2", tool_call_id="call_1"))
+    second = messages.payload()
+    # 已有消息的 dict 直接复用，不重新序列化
+    assert second[0] is first[0] and second[1] is first[1]
+    assert second[2] == {"role": "assistant", "content": "", "tool_calls": [
+        {"id": "call_1", "type": "function", "function": {"name": "add", "arguments": '{"a": 1}'}}]}
+    assert second[3] == {"role": "tool", "content": "2", "tool_call_id": "call_1"}
+    assert messages.payload("ollama")[2]["tool_calls"] == [{"function": {"name": "add", "arguments": {"a": 1}}}]
+
+    messages.pop_last_message()
+    assert len(messages.payload()) == 3
+    messages.messages = [HumanMessage(content="replaced")]
+    assert messages.payload() == [{"role": "user", "content": "replaced"}]
+
+
+def test_payload_after_pop_then_add():
+    messages = Messages(messages=[SystemMessage(content="sys"), HumanMessage(content="old question")])
+    messages.payload()
+    messages.payload("ollama")
+    messages.pop_last_message()
+    messages.add_message(HumanMessage(content="new question"))
+    expected = [{"role": "system", "content": "sys"}, {"role": "user", "content": "new question"}]
+    assert messages.payload() == expected
+    assert messages.payload("ollama") == expected
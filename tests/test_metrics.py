@@ -0,0 +1,95 @@
+import asyncio
+import math
+import threading
+import urllib.request
+
+import pytest
+
+from promptchain import metrics
+from promptchain.chain_processor import ChainProcessor
+from promptchain.message import AIMessage, HumanMessage, Messages
+
+
+class EchoModel:
+    name = "echo"
+    span_kind = "model"
+
+    async def invoke(self, messages, context):
+        return AIMessage(content="ok")
+
+
+class Failing:
+    async def invoke(self, messages, context):
+        raise RuntimeError("boom")
+
+
+def test_counters_and_histograms_sum_thread_shards():
+    registry = metrics.MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests.", ("model",))
+    histogram = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+
+    def work():
+        for _ in range(1000):
+            counter.labels("a").inc()
+            histogram.observe(0.5)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.labels(model="a").value == 4000
+    cumulative, total, count = histogram.labels().snapshot()
+    assert cumulative == [0, 4000, 4000] and count == 4000 and total == pytest.approx(2000)
+    # 同名不同类型的 metric 不能重复注册
+    assert registry.counter("requests_total") is counter
+    with pytest.raises(ValueError):
+        registry.gauge("requests_total")
+
+
+def test_quantiles_interpolate_inside_buckets():
+    histogram = metrics.Histogram("h", "", buckets=(1.0, 2.0, 4.0))
+    assert math.isnan(histogram.quantile(0.5))
+    for value in (0.5, 1.5, 1.5, 3.0):
+        histogram.observe(value)
+    assert histogram.quantile(0.25) == pytest.approx(1.0)
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(1.0) == pytest.approx(4.0)
+
+
+def test_render_write_and_http_endpoint(tmp_path):
+    registry = metrics.MetricsRegistry()
+    registry.counter("hits_total", "Hits.", ("path",)).labels('a"b').inc(2)
+    registry.gauge("inflight", "In flight.").set(3)
+    registry.histogram("latency_seconds", "Latency.", buckets=(1.0,)).observe(0.25)
+    text = registry.render()
+    assert '# TYPE hits_total counter\nhits_total{path="a\\"b"} 2\n' in text
+    assert "inflight 3\n" in text
+    assert 'latency_seconds_bucket{le="1"} 1\nlatency_seconds_bucket{le="+Inf"} 1\nlatency_seconds_sum 0.25\n' in text
+
+    path = tmp_path / "promptchain.prom"
+    registry.write(str(path))
+    assert path.read_text() == text
+
+    server = metrics.start_http_server(0, "127.0.0.1", registry)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            assert response.read().decode() == registry.render()
+    finally:
+        server.shutdown()
+
+
+def test_chain_runs_are_instrumented():
+    node = metrics.NODE_LATENCY.labels("metrics_chain", "echo", "model")
+    errors = metrics.NODE_ERRORS.labels("metrics_chain", "Failing", "runnable")
+    runs = metrics.CHAIN_LATENCY.labels("metrics_chain")
+    before = node.snapshot()[2], errors.value, runs.snapshot()[2]
+
+    chain = ChainProcessor(Messages(messages=[HumanMessage(content="q")]), name="metrics_chain")
+    chain | EchoModel() | Failing()
+    with pytest.raises(RuntimeError):
+        asyncio.run(chain.invoke())
+
+    assert (node.snapshot()[2], errors.value, runs.snapshot()[2]) == (before[0] + 1, before[1] + 1, before[2] + 1)
+    assert metrics.REGISTRY.summary()["promptchain_node_duration_seconds"]
@@ -0,0 +1,112 @@
+import asyncio
+
+import ollama
+import openai
+import pytest
+
+from promptchain.llm import (DeepseekChatMessageModel, OllamaChatMessageModel, aclose_clients,
+    build_batch_embedding_model, get_async_ollama_client)
+from promptchain.message import AIMessage, HumanMessage, Messages, ToolCallMessage
+from promptchain.mock_server import Latency, MockLLMServer, MockServerConfig, _embedding
+from promptchain.tool import Tool
+
+tool = Tool()
+
+
+@tool.func()
+def mock_weather(city: str, days: int) -> str:
+    """Weather forecast."""
+    return f"sunny in {city}"
+
+
+def history():
+    return Messages(messages=[HumanMessage(content="hello mock")])
+
+
+def run_with_server(config, scenario):
+    async def main():
+        try:
+            async with MockLLMServer(config) as server:
+                return await scenario(server)
+        finally:
+            await aclose_clients()
+    return asyncio.run(main())
+
+
+def test_openai_protocol_with_streaming_and_tool_calls():
+    async def scenario(server):
+        model = DeepseekChatMessageModel("mock", base_url=server.openai_base_url, api_key="mock")
+        reply = await model.invoke(history())
+        streamed = await model.stream(history()).collect()
+
+        tool_model = DeepseekChatMessageModel("mock", base_url=server.openai_base_url, api_key="mock",
+            model_config={"tools": tool.tools})
+        call = await tool_model.invoke(history())
+        streamed_call = await tool_model.stream(history()).collect()
+        return reply, streamed, call, streamed_call
+
+    config = MockServerConfig(reply="one two three", latency=Latency("uniform", 0.0, 0.01), seed=0)
+    reply, streamed, call, streamed_call = run_with_server(config, scenario)
+    assert reply == AIMessage(content="one two three")
+    assert streamed == reply
+    for message in (call, streamed_call):
+        assert isinstance(message, ToolCallMessage)
+        assert message.tool_call.function.name == "mock_weather"
+        assert message.tool_call.function.arguments == '{"city": "mock", "days": 1}'
+
+
+def test_ollama_chat_and_embed():
+    async def scenario(server):
+        model = OllamaChatMessageModel("mock", "mock-chat", host=server.url)
+        client = get_async_ollama_client(server.url)
+        embedded = await client.embed(model="mock-embed", input=["a", "b", "a"])
+        return await model.invoke(history()), await model.stream(history()).collect(), embedded["embeddings"]
+
+    reply, streamed, embeddings = run_with_server(MockServerConfig(embedding_dim=8), scenario)
+    assert reply.content == "This is a mock reply to: hello mock"
+    assert streamed == reply
+    assert len(embeddings) == 3 and len(embeddings[0]) == 8
+    assert embeddings[0] == embeddings[2] != embeddings[1]
+
+
+def test_batch_embedding_model_batches_in_order():
+    texts = [f"text {i}" for i in range(10)]
+
+    async def scenario(server):
+        embed = build_batch_embedding_model("mock-embed", batch_size=3, host=server.url)
+        return await embed(texts), dict(server.stats)
+
+    matrix, stats = run_with_server(MockServerConfig(embedding_dim=8), scenario)
+    assert matrix.shape == (10, 8)
+    # 4 批：3 + 3 + 3 + 1，每一行对应同一位置的输入
+    assert stats == {200: 4}
+    for row, text in zip(matrix, texts):
+        assert row.tolist() == pytest.approx(_embedding(text, 8), abs=1e-6)
+
+
+def test_batch_embedding_model_limits_concurrent_calls():
+    async def scenario(server):
+        embed = build_batch_embedding_model("mock-embed", embedding_dim=4, batch_size=1, max_concurrency=2, host=server.url)
+        # 两个调用各有 4 批，共享同一个上限，服务端同时处理超过 2 个请求会返回 429
+        await asyncio.gather(embed([f"a{i}" for i in range(4)]), embed([f"b{i}" for i in range(4)]))
+        return server.stats
+
+    config = MockServerConfig(embedding_dim=4, max_concurrency=2, latency=Latency("fixed", 0.02))
+    assert run_with_server(config, scenario) == {200: 8}
+
+
+def test_rate_limits_and_errors_are_injected():
+    async def scenario(server):
+        model = DeepseekChatMessageModel("mock", base_url=server.openai_base_url, api_key="mock")
+        with pytest.raises(openai.RateLimitError):
+            await model.invoke(history())
+        server.config.rate_limit_rate = 0.0
+        server.config.error_rate = 1.0
+        ollama_model = OllamaChatMessageModel("mock", "mock-chat", host=server.url)
+        with pytest.raises(ollama.ResponseError):
+            await ollama_model.invoke(history())
+        return server.stats
+
+    stats = run_with_server(MockServerConfig(rate_limit_rate=1.0, retry_after=0.001), scenario)
+    # openai 客户端默认重试两次
+    assert stats == {429: 3, 500: 1}
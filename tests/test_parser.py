@@ -0,0 +1,28 @@
+import asyncio
+
+from pydantic import BaseModel
+
+from promptchain.message import AIMessage, Messages
+from promptchain.parser import PydanticParser
+
+
+class Answer(BaseModel):
+    value: int
+
+
+def test_successful_parse_stores_the_model_and_returns_none():
+    context = {}
+    messages = Messages(messages=[AIMessage(content='结果如下 {"value": 42} 。')])
+    # 解析器只写 context，不向消息历史添加消息
+    assert asyncio.run(PydanticParser(Answer).invoke(messages, context)) is None
+    assert context["parsed_output"] == Answer(value=42)
+    assert len(messages) == 1
+
+
+def test_failed_parse_records_the_error():
+    context = {}
+    messages = Messages(messages=[AIMessage(content='{"value": "many"}')])
+    assert asyncio.run(PydanticParser(Answer, output_key="answer").invoke(messages, context)) is None
+    assert "answer" not in context
+    assert context["answer_raw_content"] == '{"value": "many"}'
+    assert "answer_error" in context
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from promptchain.chain_processor import ChainProcessor
+from promptchain.llm import DeepseekChatMessageModel, aclose_clients
+from promptchain.message import AIMessage, HumanMessage, Messages, ToolCallMessage, ToolMessage
+from promptchain.mock_server import MockLLMServer, MockServerConfig
+from promptchain.processors import ExtractCodeProcessor
+from promptchain.sandbox import CodeSandbox, SandboxPool
+
+REPLY = """Here is the computation:
+```python
+print(sum(range(10)))
+```
+and the failing case:
+```python
+import sys
+print("partial")
+raise ValueError("bad input")
+```
+```bash
+echo hi
+```
+"""
+
+
+def test_extracted_blocks_run_in_order():
+    sandbox = CodeSandbox(SandboxPool(size=2))
+
+    async def main():
+        chain = ChainProcessor(Messages(messages=[AIMessage(content=REPLY)]))
+        chain | ExtractCodeProcessor() | sandbox
+        await chain.invoke()
+        await sandbox.close()
+        return chain.messages
+
+    messages = asyncio.run(main())
+    call, results = messages.messages[1], messages.messages[2:]
+    assert isinstance(call, ToolCallMessage)
+    arguments = [json.loads(tool_call.function.arguments) for tool_call in call.tool_call]
+    assert [a["language"] for a in arguments] == ["python", "python", "bash"]
+    assert [m.tool_call_id for m in results] == [tool_call.id for tool_call in call.tool_call]
+    assert results[0] == ToolMessage(content="45\n", tool_call_id=call.tool_call[0].id)
+    assert results[1].content.startswith("Error: exit code 1\npartial\n")
+    assert "ValueError: bad input" in results[1].content
+    assert results[2].content == "Error: code in language 'bash' is not supported by the sandbox."
+
+
+def assert_valid_openai_tool_turns(payload):
+    # 与 OpenAI 的校验一致：带 tool_calls 的 assistant 消息之后紧跟每个 id 的 tool 消息
+    expected = []
+    for message in payload:
+        if message["role"] == "tool":
+            assert message["tool_call_id"] in expected, message
+            expected.remove(message["tool_call_id"])
+            continue
+        assert not expected, f"missing tool results for {expected}"
+        if message["role"] == "assistant" and message.get("tool_calls"):
+            expected = [tool_call["id"] for tool_call in message["tool_calls"]]
+    assert not expected
+
+
+def test_model_sandbox_model_chain_builds_a_valid_openai_request():
+    requests = []
+
+    def reply(messages):
+        requests.append(messages)
+        return REPLY if messages[-1]["role"] == "user" else "The sum is 45."
+
+    async def main():
+        sandbox = CodeSandbox(SandboxPool(size=2))
+        try:
+            async with MockLLMServer(MockServerConfig(reply=reply)) as server:
+                model = DeepseekChatMessageModel("mock", base_url=server.openai_base_url, api_key="mock")
+                chain = ChainProcessor(Messages(messages=[HumanMessage(content="add 0..9")]))
+                chain | model | ExtractCodeProcessor() | sandbox | model
+                await chain.invoke()
+                return chain.messages
+        finally:
+            await sandbox.close()
+            await aclose_clients()
+
+    messages = asyncio.run(main())
+    assert messages.get_last_message().content == "The sum is 45."
+    second_request = requests[1]
+    assert [m["role"] for m in second_request] == ["user", "assistant", "assistant", "tool", "tool", "tool"]
+    assert_valid_openai_tool_turns(second_request)
+    assert_valid_openai_tool_turns(messages.payload("openai"))
+
+
+def test_no_code_blocks():
+    messages = Messages(messages=[AIMessage(content="nothing to run here")])
+    assert asyncio.run(ExtractCodeProcessor().invoke(messages, {})) == []
+    assert asyncio.run(CodeSandbox().invoke(messages, {})) == []
+
+
+def test_limits():
+    pytest.importorskip("resource")
+    pool = SandboxPool(size=2)
+
+    async def main():
+        results = await asyncio.gather(
+            pool.run("import time; time.sleep(10)", timeout=0.5),
+            pool.run("while True: pass", cpu_time=1),
+            pool.run("data = bytearray(2 * 1024 ** 3)", memory=256 * 1024 ** 2))
+        await pool.close()
+        return results
+
+    timed_out, cpu, memory = asyncio.run(main())
+    assert timed_out.timed_out and timed_out.to_content().startswith("Error: execution timed out")
+    assert cpu.to_content().startswith("Error: killed by SIGXCPU")
+    assert memory.exit_code == 1 and "MemoryError" in memory.stderr
+
+
+def test_blocks_run_concurrently_off_the_event_loop():
+    pool = SandboxPool(size=3)
+    code = "import time\nstarted = time.perf_counter()\nwhile time.perf_counter() - started < 0.5: pass\nprint('done')"
+
+    async def main():
+        await pool.start()
+        await asyncio.sleep(0.5)  # 等预热的解释器启动完
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.get_running_loop().create_task(ticker())
+        started = time.perf_counter()
+        results = await asyncio.gather(*(pool.run(code) for _ in range(3)))
+        elapsed = time.perf_counter() - started
+        task.cancel()
+        await pool.close()
+        return results, elapsed, ticks
+
+    results, elapsed, ticks = asyncio.run(main())
+    assert [r.stdout for r in results] == ["done\n"] * 3
+    assert elapsed < 1.4
+    # 代码在其他进程中运行，事件循环一直在响应
+    assert ticks > elapsed * 100 * 0.5
+
+
+def test_workers_do_not_see_parent_secrets(monkeypatch):
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "sk-parent-secret")
+    code = "import os\nprint(os.environ.get('DEEPSEEK_API_KEY'), os.environ.get('EXTRA'))"
+
+    async def main(pool):
+        result = await pool.run(code)
+        await pool.close()
+        return result.stdout
+
+    assert asyncio.run(main(SandboxPool(size=1, env={"EXTRA": "1"}))) == "None 1\n"
+    assert asyncio.run(main(SandboxPool(size=1, inherit_env=True))) == "sk-parent-secret None\n"
@@ -0,0 +1,156 @@
+import asyncio
+import sys
+
+import pytest
+
+from promptchain.cache import LLMCache, MemoryLRUCache
+from promptchain.llm import DeepseekChatMessageModel, aclose_clients
+from promptchain.mock_server import MockLLMServer, MockServerConfig
+from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
+
+from promptchain.message import AIMessage, HumanMessage, Messages, SystemMessage, ToolCallMessage, ToolMessage
+from promptchain import tokens
+from promptchain.tokens import (
+    ContextWindowExceededError, DropToolMessagesFirst, KeepLastTurns, TokenBudget, count_tokens, trim_messages
+)
+
+
+def history():
+    return [
+        SystemMessage(content="you are a helpful assistant"),
+        HumanMessage(content="first question about python"),
+        AIMessage(content="first answer"),
+        ToolMessage(content="a very long tool result " * 20, tool_call_id="call_1"),
+        HumanMessage(content="second question"),
+        AIMessage(content="second answer"),
+        HumanMessage(content="third question"),
+    ]
+
+
+@pytest.fixture
+def approximate_tokens():
+    # 固定的 token 数只对应近似分词，安装了 tiktoken 时也使用近似值
+    tokens.set_tokenizer(tokens._approximate_tokens)
+    yield
+    tokens.set_tokenizer(None)
+
+
+def test_count_tokens_handles_cjk_and_caches_per_message(approximate_tokens):
+    assert count_tokens("") == 0
+    # 没有 tiktoken 时的近似值往多估
+    assert count_tokens("你好世界") == 6
+    assert count_tokens("internationalization") == 7
+    assert count_tokens("def f(x):\n    return x") >= 8
+
+    calls = []
+    tokens.set_tokenizer(lambda text: calls.append(text) or len(text.split()))
+    try:
+        message = HumanMessage(content="one two three")
+        assert message.token_count == 3 + tokens.MESSAGE_OVERHEAD_TOKENS
+        assert message.token_count == 3 + tokens.MESSAGE_OVERHEAD_TOKENS
+        assert calls == ["one two three"]
+        # 缓存不影响比较和序列化
+        assert message == HumanMessage(content="one two three")
+        assert message.model_dump() == {"role": "user", "content": "one two three"}
+    finally:
+        tokens.set_tokenizer(None)
+
+
+def test_tiktoken_failure_falls_back_to_approximation(monkeypatch):
+    class OfflineTiktoken:
+        @staticmethod
+        def get_encoding(name):
+            raise OSError("cannot download cl100k_base")
+
+    monkeypatch.setitem(sys.modules, "tiktoken", OfflineTiktoken)
+    tokens.set_tokenizer(None)
+    try:
+        assert count_tokens("你好世界") == tokens._approximate_tokens("你好世界")
+    finally:
+        tokens.set_tokenizer(None)
+
+
+def test_policies_keep_system_and_respect_budget():
+    messages = history()
+    total = sum(m.token_count for m in messages)
+
+    kept = trim_messages(messages, total, KeepLastTurns(1))
+    assert kept == [messages[0], messages[6]]
+
+    tool_free = trim_messages(messages, total - 1, DropToolMessagesFirst())
+    assert tool_free == messages[:3] + messages[4:]
+
+    budget = messages[0].token_count + messages[5].token_count + messages[6].token_count
+    assert trim_messages(messages, budget, TokenBudget()) == [messages[0], messages[5], messages[6]]
+    # 策略的结果超出预算时仍然会被裁剪
+    assert trim_messages(messages, budget, KeepLastTurns(3)) == [messages[0], messages[5], messages[6]]
+    with pytest.raises(ValueError):
+        KeepLastTurns(0)
+
+
+def test_trim_never_starts_with_orphan_tool_message():
+    messages = history()[:5]
+    budget = messages[0].token_count + messages[3].token_count + messages[4].token_count
+    assert trim_messages(messages, budget) == [messages[0], messages[4]]
+
+    with pytest.raises(ContextWindowExceededError):
+        trim_messages(messages, messages[0].token_count)
+
+
+def tool_turn(*call_ids):
+    calls = [ChatCompletionMessageToolCall(id=call_id, type="function", function=Function(name="lookup", arguments="{}"))
+        for call_id in call_ids]
+    return [ToolCallMessage(content="", tool_call=calls)] + [
+        ToolMessage(content=f"result of {call_id} " * 10, tool_call_id=call_id) for call_id in call_ids]
+
+
+def test_tool_calls_are_dropped_with_all_their_results():
+    messages = ([SystemMessage(content="sys"), HumanMessage(content="look up a and b")] + tool_turn("call_a", "call_b")
+        + [AIMessage(content="done"), HumanMessage(content="now c")] + tool_turn("call_c") + [AIMessage(content="c done")])
+    total = sum(m.token_count for m in messages)
+
+    kept = trim_messages(messages, total - 1, DropToolMessagesFirst())
+    assert kept == messages[:2] + messages[5:]
+    payload = Messages(messages=kept).payload()
+    assert not any(m.get("tool_call_id") in ("call_a", "call_b") for m in payload)
+
+    # TokenBudget 在一轮 tool call 中间截断时，整轮都被丢弃
+    budget = sum(m.token_count for m in messages[:1] + messages[3:])
+    kept = trim_messages(messages, budget)
+    assert kept == messages[:1] + messages[5:]
+
+
+def test_last_system_message_is_kept():
+    messages = [HumanMessage(content="hi"), SystemMessage(content="be brief")]
+    assert trim_messages(messages, 1000) == messages
+
+
+def test_model_request_is_trimmed_to_context_window():
+    messages = history()
+    window = sum(m.token_count for m in messages)
+    model = DeepseekChatMessageModel("test", api_key="sk-test", context_window=window, model_config={"max_tokens": 1})
+    request = model.build_request(Messages(messages=messages))
+    # 预留 max_tokens 后最早的一条用户消息放不下
+    assert [m["content"] for m in request["messages"]] == [m.content for m in messages[:1] + messages[2:]]
+
+    untrimmed = DeepseekChatMessageModel("test", api_key="sk-test").build_request(Messages(messages=messages))
+    assert len(untrimmed["messages"]) == len(messages)
+
+
+def test_history_is_trimmed_once_per_request(monkeypatch):
+    calls = []
+    select = DeepseekChatMessageModel.select_messages
+    monkeypatch.setattr(DeepseekChatMessageModel, "select_messages", lambda self, messages: calls.append(1) or select(self, messages))
+
+    async def main():
+        try:
+            async with MockLLMServer(MockServerConfig()) as server:
+                model = DeepseekChatMessageModel("mock", base_url=server.openai_base_url, api_key="mock",
+                    context_window=10000, cache=LLMCache(MemoryLRUCache()))
+                await model.invoke(Messages(messages=history()))
+                await model.stream(Messages(messages=history())).collect()
+        finally:
+            await aclose_clients()
+
+    asyncio.run(main())
+    assert len(calls) == 2
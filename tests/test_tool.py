@@ -0,0 +1,246 @@
+import asyncio
+import time
+from enum import Enum
+from typing import Dict, List, Optional
+
+from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
+from pydantic import BaseModel
+
+from promptchain.cache import CACHE_BYPASS_KEY, SQLiteCache, ToolCache
+from promptchain.chain_processor import ChainProcessor
+from promptchain.llm import DeepseekChatMessageModel, aclose_clients
+from promptchain.message import AIMessage, HumanMessage, Messages, ToolCallMessage, ToolMessage
+from promptchain.mock_server import MockLLMServer, MockServerConfig
+from promptchain.tool import Tool
+
+
+def tool_call(call_id, name, arguments):
+    return ChatCompletionMessageToolCall(id=call_id, type="function", function=Function(name=name, arguments=arguments))
+
+
+def test_tool_calls_run_concurrently_in_order():
+    tool = Tool()
+
+    @tool.func()
+    def slow_lookup(key: str) -> str:
+        time.sleep(0.3)
+        return f"value of {key}"
+
+    @tool.func()
+    async def async_lookup(key: str) -> str:
+        await asyncio.sleep(0.3)
+        return f"async value of {key}"
+
+    call_message = ToolCallMessage(content="", tool_call=[
+        tool_call("call_1", "slow_lookup", '{"key": "a"}'),
+        tool_call("call_2", "async_lookup", '{"key": "b"}'),
+        tool_call("call_3", "slow_lookup", '{"key": "c"}'),
+        tool_call("call_4", "missing_tool", '{}'),
+    ])
+    messages = Messages(messages=[HumanMessage(content="look up a, b and c"), call_message])
+
+    started = time.perf_counter()
+    results = asyncio.run(tool.invoke(messages, {}))
+    elapsed = time.perf_counter() - started
+
+    assert [(m.tool_call_id, m.content) for m in results[:3]] == [
+        ("call_1", "value of a"), ("call_2", "async value of b"), ("call_3", "value of c")]
+    assert results[3].tool_call_id == "call_4" and results[3].content.startswith("Error")
+    assert elapsed < 0.8
+    # ToolCallMessage 保留在历史中，下一次请求需要它
+    assert messages.get_last_message() is call_message
+    tool.shutdown()
+
+
+def test_each_call_has_its_own_timeout():
+    tool = Tool(timeout=5)
+
+    @tool.func(timeout=0.05)
+    async def hanging_lookup() -> str:
+        await asyncio.sleep(10)
+
+    @tool.func()
+    def quick_lookup() -> str:
+        return "done"
+
+    messages = Messages(messages=[ToolCallMessage(content="", tool_call=[
+        tool_call("call_1", "hanging_lookup", "{}"), tool_call("call_2", "quick_lookup", "{}")])])
+    results = asyncio.run(tool.invoke(messages, {}))
+    assert results[0].content == "Error: Function 'hanging_lookup' timed out after 0.05 seconds"
+    assert results[1] == ToolMessage(content="done", tool_call_id="call_2")
+    tool.shutdown()
+
+
+def test_model_tool_model_chain_with_parallel_calls():
+    tool = Tool()
+
+    @tool.func()
+    def city_temperature(city: str) -> str:
+        """Temperature of a city."""
+        return "27.5"
+
+    @tool.func()
+    def city_humidity(city: str) -> str:
+        """Humidity of a city."""
+        return "60%"
+
+    async def main():
+        histories = []
+        async with MockLLMServer(MockServerConfig(tool_calls_per_turn=3)) as server:
+            model = DeepseekChatMessageModel("mock", base_url=server.openai_base_url, api_key="mock",
+                model_config={"tools": tool.tools})
+            for stream in (False, True):
+                chain = ChainProcessor(Messages(messages=[HumanMessage(content="weather in Shenyang?")]), stream=stream)
+                chain | model | tool | model
+                await chain.invoke()
+                histories.append(chain.messages)
+        await aclose_clients()
+        return histories
+
+    for messages in asyncio.run(main()):
+        call_message = messages.messages[1]
+        assert isinstance(call_message, ToolCallMessage) and len(call_message.tool_call) == 3
+        results = messages.messages[2:5]
+        assert [m.tool_call_id for m in results] == [call.id for call in call_message.tool_call]
+        assert [m.content for m in results] == ["27.5", "60%", "27.5"]
+        assert isinstance(messages.messages[5], AIMessage)
+        assert messages.payload()[1]["role"] == "assistant"
+    tool.shutdown()
+
+
+class Unit(str, Enum):
+    celsius = "celsius"
+    fahrenheit = "fahrenheit"
+
+
+class Location(BaseModel):
+    city: str
+    country: Optional[str] = None
+
+
+def test_arguments_are_validated_and_coerced():
+    tool = Tool()
+
+    @tool.func()
+    def forecast(location: Location, days: int, unit: Unit = Unit.celsius, hours: Optional[List[int]] = None,
+            extra: Dict[str, float] = {}) -> str:
+        """Forecast of a location."""
+        return repr((location, days, unit, hours, extra))
+
+    properties = tool.tools[0]["function"]["parameters"]["properties"]
+    assert tool.tools[0]["function"]["parameters"]["required"] == ["location", "days"]
+    assert properties["days"] == {"type": "integer", "description": "The days for the function."}
+    assert properties["hours"]["anyOf"][0] == {"type": "array", "items": {"type": "integer"}}
+    assert properties["extra"]["additionalProperties"] == {"type": "number"}
+
+    messages = Messages(messages=[ToolCallMessage(content="", tool_call=[
+        tool_call("call_1", "forecast", '{"location": {"city": "Shenyang"}, "days": "3", "unit": "fahrenheit", "hours": [6, "12"]}'),
+        tool_call("call_2", "forecast", '{"location": {}, "days": "three"}'),
+        tool_call("call_3", "forecast", '{"location": {"city": "x"}, "days": 1, "color": "red"}'),
+        tool_call("call_4", "forecast", '{"days": '),
+    ])])
+    results = asyncio.run(tool.invoke(messages, {}))
+    assert results[0].content == repr((Location(city="Shenyang"), 3, Unit.fahrenheit, [6, 12], {}))
+    assert results[1].content.startswith("Error: Invalid arguments for function 'forecast': location.city: Field required; days:")
+    assert "color: Extra inputs are not permitted" in results[2].content
+    assert results[3].content.startswith("Error: Could not parse arguments for function 'forecast': Invalid JSON")
+    tool.shutdown()
+
+
+def test_registries_are_per_instance():
+    tenant_a, tenant_b = Tool(), Tool()
+
+    @tenant_a.func()
+    def lookup(key: str) -> str:
+        return "a"
+
+    @tenant_b.func(description="Tenant b lookup.")
+    def lookup(key: str, limit: int = 1) -> str:
+        return "b"
+
+    assert list(tenant_a.function_mapping) == list(tenant_b.function_mapping) == ["lookup"]
+    assert "limit" not in tenant_a.tools[0]["function"]["parameters"]["properties"]
+    messages = Messages(messages=[ToolCallMessage(content="", tool_call=tool_call("call_1", "lookup", '{"key": "k"}'))])
+    assert asyncio.run(tenant_a.invoke(messages, {}))[0].content == "a"
+    assert asyncio.run(tenant_b.invoke(messages, {}))[0].content == "b"
+
+    # 重新注册同名函数替换原来的描述
+    @tenant_a.func(description="New lookup.")
+    def lookup(key: str) -> str:
+        return "a2"
+
+    assert [spec["function"]["description"] for spec in tenant_a.tools] == ["New lookup."]
+    assert asyncio.run(tenant_a.invoke(messages, {}))[0].content == "a2"
+    tenant_a.shutdown()
+    tenant_b.shutdown()
+
+
+def test_cached_tool_coalesces_and_expires():
+    tool = Tool()
+    calls = []
+
+    @tool.func(cache=ToolCache(ttl=0.3, maxsize=8))
+    async def get_weather(city_name: str, days: int = 1) -> str:
+        calls.append((city_name, days))
+        await asyncio.sleep(0.05)
+        if city_name == "nowhere":
+            raise ValueError("unknown city")
+        return f"27.5 in {city_name}"
+
+    def ask(*arguments, context=None):
+        message = ToolCallMessage(content="", tool_call=[
+            tool_call(f"call_{i}", "get_weather", args) for i, args in enumerate(arguments)])
+        return asyncio.run(tool.invoke(Messages(messages=[message]), context or {}))
+
+    # 参数顺序、默认值和类型转换不影响缓存 key，并发的相同调用只执行一次
+    results = ask('{"city_name": "Shenyang"}', '{"days": "1", "city_name": "Shenyang"}', '{"city_name": "Dalian"}')
+    assert [m.content for m in results] == ["27.5 in Shenyang", "27.5 in Shenyang", "27.5 in Dalian"]
+    assert calls == [("Shenyang", 1), ("Dalian", 1)]
+
+    assert ask('{"city_name": "Shenyang", "days": 1}')[0].content == "27.5 in Shenyang"
+    assert ask('{"city_name": "Shenyang"}', context={CACHE_BYPASS_KEY: True})[0].content == "27.5 in Shenyang"
+    assert ask('{"city_name": "nowhere"}', '{"city_name": "nowhere"}')[0].content.startswith("Error")
+    assert len(calls) == 4
+    assert tool.cache_stats()["get_weather"] == {
+        "hits": 1, "misses": 3, "coalesced": 2, "hit_rate": 0.5, "size": 2, "maxsize": 8}
+
+    time.sleep(0.35)
+    ask('{"city_name": "Shenyang"}')
+    assert calls[-1] == ("Shenyang", 1) and len(calls) == 5
+    tool.shutdown()
+
+
+def test_shared_sqlite_tier_across_tools(tmp_path):
+    shared = SQLiteCache(str(tmp_path / "tools.db"), table="tool_cache")
+    counts = {"long": 0, "short": 0}
+
+    def session():
+        tool = Tool()
+
+        @tool.func(cache=ToolCache(ttl=3600, persistent=shared))
+        def lookup(key: str) -> str:
+            counts["long"] += 1
+            return key.upper()
+
+        return tool
+
+    messages = Messages(messages=[ToolCallMessage(content="", tool_call=tool_call("call_1", "lookup", '{"key": "k"}'))])
+    for _ in range(2):
+        tool = session()
+        assert asyncio.run(tool.invoke(messages, {}))[0].content == "K"
+        tool.shutdown()
+    assert counts["long"] == 1
+    assert tool.cache_stats()["lookup"]["persistent"]["hits"] == 1
+
+    # 同一个共享层上 ttl 按工具各自检查
+    tool = Tool()
+
+    @tool.func(cache=ToolCache(ttl=0, persistent=shared))
+    def lookup(key: str) -> str:
+        counts["short"] += 1
+        return key.upper()
+
+    asyncio.run(tool.invoke(messages, {}))
+    assert counts["short"] == 1
+    tool.shutdown()
+    shared.close()
@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import pytest
+
+from promptchain import tracing
+from promptchain.chain import Parallel
+from promptchain.chain_processor import ChainProcessor
+from promptchain.message import AIMessage, HumanMessage, Messages, SystemMessage
+
+
+class UsageModel:
+    name = "usage_model"
+    span_kind = "model"
+
+    async def invoke(self, messages, context):
+        tracing.record_usage(prompt_tokens=len(messages), completion_tokens=2)
+        return AIMessage(content="ok")
+
+
+class Failing:
+    async def invoke(self, messages, context):
+        raise RuntimeError("boom")
+
+
+def new_chain():
+    return ChainProcessor(Messages(messages=[SystemMessage(content="sys"), HumanMessage(content="q")]))
+
+
+def test_spans_record_counts_usage_and_nesting(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer = tracing.enable_tracing(capacity=3, exporters=[tracing.JSONLExporter(str(path))])
+    try:
+        chain = new_chain()
+        chain | UsageModel() | Parallel({"a": UsageModel(), "b": UsageModel()}, merge="append")
+        asyncio.run(chain.invoke())
+        tracer.flush()
+    finally:
+        tracing.disable_tracing()
+
+    exported = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [span["name"] for span in exported] == [
+        "usage_model", "usage_model", "Parallel.a", "usage_model", "Parallel.b", "Parallel", "chain"]
+    by_id = {span["span_id"]: span for span in exported}
+    root = exported[-1]
+    assert root["parent_id"] is None and root["input_messages"] == 2 and root["output_messages"] == 3
+    assert exported[0]["token_usage"] == {"prompt_tokens": 2, "completion_tokens": 2}
+    assert by_id[exported[1]["parent_id"]]["name"] == "Parallel.a"
+    assert {span["trace_id"] for span in exported} == {root["trace_id"]}
+    # ring buffer 只保留最近的 3 个 span
+    assert [span.name for span in tracer.spans()] == ["Parallel.b", "Parallel", "chain"]
+
+
+def test_errors_are_recorded_and_disabled_tracing_records_nothing():
+    tracer = tracing.enable_tracing()
+    try:
+        chain = new_chain()
+        chain | Failing()
+        with pytest.raises(RuntimeError):
+            asyncio.run(chain.invoke())
+        assert [span.error for span in tracer.spans()] == ["RuntimeError: boom", "RuntimeError: boom"]
+    finally:
+        tracing.disable_tracing()
+
+    chain = new_chain()
+    chain | UsageModel()
+    asyncio.run(chain.invoke())
+    assert tracer.spans()[-1].kind == "chain" and len(tracer.spans()) == 2
+    assert tracing.get_tracer() is None and tracing.current_span() is None
+
+
+def test_otlp_export_format(tmp_path):
+    exporter = tracing.OTLPJSONExporter(str(tmp_path / "spans.otlp.jsonl"), service_name="svc")
+    span = tracing.Span(name="m", kind="model", trace_id="a" * 32, span_id="b" * 16, start_time=1.0, end_time=1.5,
+        token_usage={"prompt_tokens": 3}, error="ValueError: x")
+    otlp = exporter.to_otlp([span])["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert otlp["kind"] == 3 and otlp["status"] == {"code": 2, "message": "ValueError: x"}
+    assert otlp["startTimeUnixNano"] == "1000000000" and "parentSpanId" not in otlp
+    assert {"key": "gen_ai.usage.prompt_tokens", "value": {"intValue": "3"}} in otlp["attributes"]
+    exporter.shutdown()